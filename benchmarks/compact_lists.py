@@ -0,0 +1,34 @@
+"""
+Compares the edge payload of a model with and without the compact encoding of large aggregations,
+i.e., the number of listItem properties written and the number of p21 ids moved into list properties:
+
+    PYTHONPATH=converter python benchmarks/compact_lists.py <path to ifc model> [threshold]
+"""
+import sys
+
+from Ifc2GraphTranslator import IFCGraphGenerator
+from GraphRecords import ORDERED_LIST_SUFFIX
+
+
+def measure(model_path: str, threshold: int = None) -> tuple:
+    generator = IFCGraphGenerator(None, model_path, write_to_file=True, compact_list_threshold=threshold)
+    list_ids = sum(len(value) for node in generator.iter_node_rows()
+                   for name, value in zip(node.names, node.values) if name.endswith(ORDERED_LIST_SUFFIX))
+    edges = 0
+    list_items = 0
+    for edge in generator.iter_edge_rows():
+        edges += 1
+        if edge.list_item is not None:
+            list_items += 1
+    return edges, list_items, list_ids
+
+
+def run_benchmark(model_path: str, threshold: int = 100):
+    for name, t in [('listItem', None), ('compact >= {}'.format(threshold), threshold)]:
+        edges, list_items, list_ids = measure(model_path, t)
+        print('{:<16} edges: {:>10}  listItem properties: {:>10}  p21 ids in list properties: {:>10}'.format(
+            name, edges, list_items, list_ids))
+
+
+if __name__ == '__main__':
+    run_benchmark(sys.argv[1], *[int(arg) for arg in sys.argv[2:3]])
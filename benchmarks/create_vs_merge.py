@@ -0,0 +1,44 @@
+"""
+Compares the load time of a model into a fresh label using CREATE statements with the MERGE based load:
+
+    PYTHONPATH=converter python benchmarks/create_vs_merge.py <path to ifc model>
+
+The model label gets overwritten, the database connection is read from .env
+"""
+import sys
+import time
+
+from dotenv import dotenv_values
+
+from neo4jConnector import Neo4jConnector
+from Ifc2GraphTranslator import IFCGraphGenerator
+from GraphSinks import Neo4jSink
+
+
+def load(connector, model_path: str, merge: bool) -> tuple:
+    generator = IFCGraphGenerator(connector, model_path)
+
+    # start from an empty label in both cases, so only the write statements differ
+    connector.run_cypher_statement('MATCH (n:{}) DETACH DELETE n'.format(generator.timestamp))
+
+    sink = Neo4jSink(connector, generator.import_key(False, False), merge=merge)
+    start = time.perf_counter()
+    generator.generateGraph(sink=sink)
+    seconds = time.perf_counter() - start
+    return seconds, sink.loader.commit_time
+
+
+def run_benchmark(model_path: str):
+    config = dotenv_values(".env")
+    connector = Neo4jConnector(config=config)
+    connector.connect_driver()
+
+    for name, merge in [('MERGE', True), ('CREATE', False)]:
+        seconds, commit_time = load(connector, model_path, merge)
+        print('{:<6}  total {:>8.2f}s  commit {:>8.2f}s'.format(name, seconds, commit_time))
+
+    connector.disconnect_driver()
+
+
+if __name__ == '__main__':
+    run_benchmark(sys.argv[1])
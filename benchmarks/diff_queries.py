@@ -0,0 +1,81 @@
+"""
+Compares the original SIMILAR_TO diff queries of Neo4jQueryFactory with their anchored counterparts.
+
+Both model versions need to be loaded and connected by SIMILAR_TO edges beforehand.
+Run it for model pairs of increasing size to see how both variants scale with the number of edges:
+
+    PYTHONPATH=converter python benchmarks/diff_queries.py <label_init> <label_updt>
+"""
+import sys
+import time
+
+from dotenv import dotenv_values
+
+from neo4jConnector import Neo4jConnector
+from Neo4jQueryFactory import Neo4jQueryFactory
+
+
+def sum_db_hits(plan) -> int:
+    """
+    sums up the db hits of a profiled query plan
+    """
+    hits = plan.get('dbHits', 0)
+    for child in plan.get('children', []):
+        hits += sum_db_hits(child)
+    return hits
+
+
+def profile(connector, cy: str):
+    """
+    runs the query with PROFILE and returns (rows, db hits, runtime in seconds)
+    """
+    start = time.perf_counter()
+    with connector.my_driver.session(database=connector.database) as session:
+        res = session.run('PROFILE ' + cy)
+        rows = sum(1 for _ in res)
+        summary = res.consume()
+    return rows, sum_db_hits(summary.profile), time.perf_counter() - start
+
+
+def stream(connector, cy: str, chunk_size: int = 10000):
+    """
+    consumes the query result chunk-wise and returns (rows, chunks, runtime in seconds)
+    """
+    start = time.perf_counter()
+    rows = 0
+    chunks = 0
+    for chunk in connector.stream_cypher_statement(cy, chunk_size=chunk_size):
+        rows += len(chunk)
+        chunks += 1
+    return rows, chunks, time.perf_counter() - start
+
+
+def run_benchmark(ts_init: str, ts_updt: str):
+    config = dotenv_values(".env")
+    connector = Neo4jConnector(config=config)
+    connector.connect_driver()
+
+    for cy in ["MATCH (n:{})-[r:rel]->() RETURN COUNT(r)".format(ts_init),
+               "MATCH (n:{})-[r:rel]->() RETURN COUNT(r)".format(ts_updt)]:
+        print('edges: {}'.format(connector.run_cypher_statement(cy)[0][0]))
+
+    variants = [
+        ('load_SIMILAR_TO_rectangles', Neo4jQueryFactory.load_SIMILAR_TO_rectangles),
+        ('load_SIMILAR_TO_rectangles_anchored', Neo4jQueryFactory.load_SIMILAR_TO_rectangles_anchored),
+        ('get_modified_edge_IDs', Neo4jQueryFactory.get_modified_edge_IDs),
+        ('get_modified_edge_IDs_anchored', Neo4jQueryFactory.get_modified_edge_IDs_anchored),
+    ]
+
+    for name, builder in variants:
+        rows, db_hits, runtime = profile(connector, builder(ts_init, ts_updt))
+        print('{:40s} rows: {:>10d}  db hits: {:>12d}  time: {:8.3f}s'.format(name, rows, db_hits, runtime))
+
+    for name, builder in variants[1::2]:
+        rows, chunks, runtime = stream(connector, builder(ts_init, ts_updt))
+        print('{:40s} streamed {} rows in {} chunks, time: {:8.3f}s'.format(name, rows, chunks, runtime))
+
+    connector.disconnect_driver()
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1], sys.argv[2])
@@ -0,0 +1,20 @@
+"""
+Measures the raw extraction throughput of IFCGraphGenerator, i.e., without any database or file output:
+
+    PYTHONPATH=converter python benchmarks/extraction_throughput.py <path to ifc model>
+"""
+import sys
+
+from Ifc2GraphTranslator import IFCGraphGenerator
+from GraphSinks import NullSink
+
+
+def run_benchmark(model_path: str, derive_shortcuts: bool = True):
+    generator = IFCGraphGenerator(None, model_path, write_to_file=True)
+    sink = NullSink()
+    generator.generateGraph(derive_shortcuts=derive_shortcuts, sink=sink)
+    return sink
+
+
+if __name__ == '__main__':
+    run_benchmark(sys.argv[1])
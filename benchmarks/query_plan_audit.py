@@ -0,0 +1,355 @@
+"""
+Audits the query plans of all builders of Neo4jQueryFactory and Neo4jGraphFactory.
+
+Every builder is called with sample arguments taken from a loaded model and its query is run with PROFILE
+(or EXPLAIN only, see --explain) inside a transaction that gets rolled back, so write queries leave the
+database untouched. Db hits, rows and operator types are recorded per builder, and plans containing full scans,
+label scans or Cartesian products are flagged. Compared to a stored baseline, the audit fails if a query got
+more expensive, gained a flag or stopped working.
+
+Start a local database with the docker-compose.yml of the repository, load a benchmark model and store a baseline:
+
+    docker compose up -d neo4j
+    PYTHONPATH=converter python benchmarks/query_plan_audit.py --ifc <path to ifc model> --update-baseline
+
+Later runs against the same model compare with the baseline and exit with 1 on regressions:
+
+    PYTHONPATH=converter python benchmarks/query_plan_audit.py --label <model label>
+
+Without a database, --offline only builds the queries with placeholder arguments and records them as unmeasured.
+Unmeasured entries in the results or in the baseline fail the audit, so that a baseline recorded offline can't pass
+for a measured one. --allow-unmeasured accepts them, e.g. to only check that all builders still build:
+
+    PYTHONPATH=converter python benchmarks/query_plan_audit.py --offline --allow-unmeasured
+
+The committed baseline has been recorded offline. Replace it with a measured baseline via --update-baseline.
+
+The database connection is read from .env
+"""
+import argparse
+import inspect
+import json
+import os
+import sys
+
+from dotenv import dotenv_values
+
+from neo4jConnector import Neo4jConnector
+from Neo4jQueryFactory import Neo4jQueryFactory
+from Neo4jGraphFactory import Neo4jGraphFactory
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'query_plan_baseline.json')
+
+# operator types (without the runtime suffix, e.g. @neo4j) and the flag they raise
+FLAGGED_OPERATORS = {
+    'AllNodesScan': 'full scan',
+    'AllRelationshipsScan': 'full scan',
+    'DirectedAllRelationshipsScan': 'full scan',
+    'UndirectedAllRelationshipsScan': 'full scan',
+    'NodeByLabelScan': 'label scan',
+    'RelationshipTypeScan': 'label scan',
+    'DirectedRelationshipTypeScan': 'label scan',
+    'UndirectedRelationshipTypeScan': 'label scan',
+    'CartesianProduct': 'cartesian product',
+}
+
+# builder argument name -> key of the sample
+SAMPLE_ARGUMENTS = {
+    'label': 'label', 'timestamp': 'label', 'ts_init': 'label', 'ts_updt': 'label_updt',
+    'node_id': 'node_id', 'nodeId': 'node_id', 'node_id_left': 'node_id', 'node_id_start': 'node_id',
+    'node_id_a': 'node_id', 'parent_node_id': 'node_id', 'parent_id': 'node_id', 'my_node_id': 'node_id',
+    'source_node_id': 'node_id', 'node_id_from': 'node_id',
+    'node_id_right': 'node_id_2', 'node_id_target': 'node_id_2', 'node_id_b': 'node_id_2',
+    'target_node_id': 'node_id_2', 'node_id_to': 'node_id_2',
+    'p21_id': 'p21_id', 'from_p21': 'p21_id', 'to_p21': 'p21_id_2',
+    'rel_id': 'rel_id', 'rel_type': 'rel_type', 'inverse_rel_type': 'rel_type',
+    'global_id': 'global_id', 'entity_id': 'global_id', 'target_node_guid': 'global_id',
+    'owner_history_guid': 'global_id', 'rel_guid': 'global_id', 'obj_rel_guid': 'global_id',
+    'entity_type': 'entity_type',
+    'attrs': 'properties', 'attributes': 'properties', 'rel_attrs': 'properties',
+    'item_no': 'item_no', 'exclude_nodes': 'node_list', 'max_depth': 'max_depth',
+}
+
+
+def collect_samples(connector, label: str, label_updt: str) -> dict:
+    """
+    picks the sample values the builders are called with from the loaded model
+    """
+    nodes = connector.run_cypher_statement(
+        'MATCH (n:PrimaryNode:{}) RETURN ID(n), n.p21_id, n.GlobalId, n.EntityType LIMIT 2'.format(label))
+    if len(nodes) == 0:
+        raise Exception('No primary nodes labeled with {} found. Load a model first.'.format(label))
+    rels = connector.run_cypher_statement(
+        'MATCH (:{}:PrimaryNode)-[r:rel]->() RETURN ID(r), r.rel_type LIMIT 1'.format(label))
+    second = nodes[-1]
+    return {
+        'label': label,
+        'label_updt': label_updt,
+        'node_id': nodes[0][0], 'node_id_2': second[0],
+        'p21_id': nodes[0][1], 'p21_id_2': second[1],
+        'global_id': nodes[0][2],
+        'entity_type': nodes[0][3],
+        'rel_id': rels[0][0] if rels else -1,
+        'rel_type': rels[0][1] if rels else 'rel',
+        'properties': {},
+        'item_no': 0,
+        'node_list': [],
+        'max_depth': 3,
+    }
+
+
+def placeholder_samples(label: str) -> dict:
+    """
+    sample values for building the queries without a loaded model, see --offline
+    """
+    return {
+        'label': label, 'label_updt': label,
+        'node_id': 0, 'node_id_2': 1,
+        'p21_id': 1, 'p21_id_2': 2,
+        'global_id': '0000000000000000000000',
+        'entity_type': 'IfcWall',
+        'rel_id': 0, 'rel_type': 'rel',
+        'properties': {},
+        'item_no': 0,
+        'node_list': [],
+        'max_depth': 3,
+    }
+
+
+def query_parameters(samples: dict) -> dict:
+    """
+    values of the $parameters used by the parametrized builders. Batch statements get an empty row list,
+    so that their plan is recorded without touching any data
+    """
+    return {'label': samples['label'],
+            'props': {},
+            'limit': 1,
+            'rows': [],
+            'node_ids': [samples['node_id'], samples['node_id_2']],
+            'p21_ids': [samples['p21_id'], samples['p21_id_2']]}
+
+
+def iter_builders():
+    """
+    @return: generator of (name, builder method) of all classmethods of both factories
+    """
+    for cls in (Neo4jQueryFactory, Neo4jGraphFactory):
+        for name, method in inspect.getmembers(cls, inspect.ismethod):
+            yield '{}.{}'.format(cls.__name__, name), method
+
+
+def build(method, samples: dict):
+    """
+    calls a builder with sample arguments
+    @return: cypher statement, raises a LookupError if an argument has no sample
+    """
+    arguments = {}
+    for name, parameter in inspect.signature(method).parameters.items():
+        if name in SAMPLE_ARGUMENTS:
+            arguments[name] = samples[SAMPLE_ARGUMENTS[name]]
+        elif parameter.default is inspect.Parameter.empty:
+            raise LookupError('no sample for argument {}'.format(name))
+    return method(**arguments)
+
+
+def plan_operators(plan) -> list:
+    """
+    @return: operator types of a query plan, depth first
+    """
+    operators = [plan.get('operatorType', '').split('@')[0]]
+    for child in plan.get('children', []):
+        operators.extend(plan_operators(child))
+    return operators
+
+
+def sum_db_hits(plan) -> int:
+    hits = plan.get('dbHits', 0)
+    for child in plan.get('children', []):
+        hits += sum_db_hits(child)
+    return hits
+
+
+def audit_query(connector, cy: str, parameters: dict, explain: bool) -> dict:
+    """
+    runs a query with PROFILE or EXPLAIN in a transaction that gets rolled back
+    @return: dict with db_hits, rows, operators and flags
+    """
+    with connector.my_driver.session(database=connector.database) as session:
+        tx = session.begin_transaction()
+        try:
+            res = tx.run(('EXPLAIN ' if explain else 'PROFILE ') + cy, parameters)
+            rows = sum(1 for _ in res)
+            summary = res.consume()
+        finally:
+            tx.rollback()
+    plan = summary.plan if explain else summary.profile
+    operators = plan_operators(plan)
+    return {'db_hits': None if explain else sum_db_hits(plan),
+            'rows': None if explain else rows,
+            'operators': sorted(set(operators)),
+            'flags': sorted({FLAGGED_OPERATORS[op] for op in operators if op in FLAGGED_OPERATORS})}
+
+
+def build_queries(samples: dict) -> tuple:
+    """
+    calls all builders with the samples
+    @return: dict builder name -> cypher statement of the queries to audit, and dict builder name -> result of the
+             builders that can't be audited, with a 'skipped' reason or a build 'error'
+    """
+    queries = {}
+    results = {}
+    for name, method in iter_builders():
+        try:
+            cy = build(method, samples)
+        except LookupError as e:
+            results[name] = {'skipped': str(e)}
+            continue
+        except Exception as e:
+            results[name] = {'error': 'build failed: {}'.format(e)}
+            continue
+        if not isinstance(cy, str):
+            results[name] = {'skipped': 'returns {}'.format(type(cy).__name__)}
+            continue
+        if cy.strip().upper().startswith(('CREATE INDEX', 'CREATE CONSTRAINT', 'DROP ')):
+            results[name] = {'skipped': 'schema statement'}
+            continue
+        queries[name] = cy
+    return queries, results
+
+
+def run_audit(connector, samples: dict, explain: bool) -> dict:
+    """
+    @return: dict builder name -> audit result. Builders that can't be called with samples are recorded with a
+             'skipped' reason, builders that fail and queries the database rejects with an 'error'
+    """
+    parameters = query_parameters(samples)
+    queries, results = build_queries(samples)
+    for name, cy in queries.items():
+        try:
+            results[name] = audit_query(connector, cy, parameters, explain)
+        except Exception as e:
+            results[name] = {'error': (str(e).splitlines() or [type(e).__name__])[0]}
+    return results
+
+
+def run_offline() -> dict:
+    """
+    builds the queries with placeholder samples without running them
+    @return: dict builder name -> result, queries that build are recorded as 'unmeasured'
+    """
+    queries, results = build_queries(placeholder_samples('ts00000000T000000'))
+    for name in queries:
+        results[name] = {'unmeasured': True}
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float, min_db_hits: int,
+                     allow_unmeasured: bool = False) -> list:
+    """
+    compares the audit results with a baseline
+    @param tolerance: relative increase of db hits that is accepted
+    @param min_db_hits: absolute increase of db hits that is accepted, so that small queries don't fail on noise
+    @param allow_unmeasured: accepts unmeasured results and baseline entries instead of reporting them
+    @return: list of (builder name, reason)
+    """
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None:
+            regressions.append((name, 'not in baseline'))
+            continue
+        if 'skipped' in result:
+            continue
+        if 'error' in result:
+            if 'error' not in before:
+                regressions.append((name, 'fails: {}'.format(result['error'])))
+            continue
+        if 'unmeasured' in before or 'unmeasured' in result:
+            if not allow_unmeasured:
+                regressions.append((name, 'unmeasured {}'.format('result' if 'unmeasured' in result else 'baseline')))
+            continue
+        if 'error' in before or 'skipped' in before:
+            continue
+        new_flags = set(result['flags']) - set(before['flags'])
+        if new_flags:
+            regressions.append((name, 'new {}'.format(', '.join(sorted(new_flags)))))
+        if result['db_hits'] is not None and before.get('db_hits') is not None:
+            limit = max(before['db_hits'] * (1 + tolerance), before['db_hits'] + min_db_hits)
+            if result['db_hits'] > limit:
+                regressions.append((name, 'db hits {} -> {}'.format(before['db_hits'], result['db_hits'])))
+    return regressions
+
+
+def print_results(results: dict):
+    for name, result in sorted(results.items()):
+        if 'skipped' in result:
+            print('{:<60} skipped: {}'.format(name, result['skipped']))
+        elif 'unmeasured' in result:
+            print('{:<60} builds'.format(name))
+        elif 'error' in result:
+            print('{:<60} ERROR: {}'.format(name, result['error']))
+        else:
+            print('{:<60} db hits: {:>10}  rows: {:>8}  {}'.format(
+                name, '-' if result['db_hits'] is None else result['db_hits'],
+                '-' if result['rows'] is None else result['rows'],
+                ('[' + ', '.join(result['flags']) + ']') if result['flags'] else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Audits the query plans of all query builders.')
+    parser.add_argument('--ifc', help='loads this model first and audits against it')
+    parser.add_argument('--label', help='label of an already loaded model')
+    parser.add_argument('--label-updt', help='label of the updated model for the diff queries, defaults to --label')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='path of the baseline json')
+    parser.add_argument('--update-baseline', action='store_true', help='stores the results as new baseline')
+    parser.add_argument('--explain', action='store_true', help='only plans the queries without running them')
+    parser.add_argument('--offline', action='store_true', help='only builds the queries, without database')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='accepted relative increase of db hits')
+    parser.add_argument('--min-db-hits', type=int, default=1000, help='accepted absolute increase of db hits')
+    parser.add_argument('--allow-unmeasured', action='store_true',
+                        help='accepts unmeasured results and baseline entries, e.g. of --offline')
+    args = parser.parse_args()
+
+    if args.offline:
+        results = run_offline()
+    else:
+        if args.ifc is None and args.label is None:
+            parser.error('either --ifc or --label is required')
+        config = dotenv_values(".env")
+        connector = Neo4jConnector(config=config)
+        connector.connect_driver()
+
+        label = args.label
+        if args.ifc is not None:
+            from Ifc2GraphTranslator import IFCGraphGenerator
+            generator = IFCGraphGenerator(connector, args.ifc)
+            generator.generateGraph()
+            label = generator.timestamp
+
+        samples = collect_samples(connector, label, args.label_updt or label)
+        results = run_audit(connector, samples, args.explain)
+        connector.disconnect_driver()
+    print_results(results)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        print('Baseline written to {}'.format(args.baseline))
+        return
+
+    if not os.path.exists(args.baseline):
+        print('No baseline at {}, run with --update-baseline to store one.'.format(args.baseline))
+        sys.exit(1)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, args.tolerance, args.min_db_hits, args.allow_unmeasured)
+    for name, reason in regressions:
+        print('REGRESSION {}: {}'.format(name, reason))
+    if regressions:
+        sys.exit(1)
+    print('No regressions against {}'.format(args.baseline))
+
+
+if __name__ == '__main__':
+    main()
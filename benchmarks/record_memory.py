@@ -0,0 +1,71 @@
+"""
+Compares the memory footprint of the dict/tuple rows formerly produced by IFCGraphGenerator with the
+compact NodeRecord and EdgeRecord types. Uses synthetic rows shaped like IfcCartesianPoint, IfcPropertySingleValue
+and IfcWall instances, so no model or database is required:
+
+    PYTHONPATH=converter python benchmarks/record_memory.py [number of nodes]
+"""
+import sys
+import tracemalloc
+
+from GraphRecords import NodeRecord, EdgeRecord, intern_names
+
+# (entity type, node type, attribute names)
+SHAPES = [
+    ('IfcCartesianPoint', 'SecondaryNode', ['Coordinates']),
+    ('IfcPropertySingleValue', 'SecondaryNode', ['Name', 'Description', 'NominalValue']),
+    ('IfcWall', 'PrimaryNode', ['GlobalId', 'Name', 'Description', 'ObjectType', 'Tag', 'PredefinedType']),
+]
+
+
+def attribute_values(p21_id: int, names: list) -> list:
+    # freshly created strings, as ifcopenshell returns them
+    return [''.join(['val_', name, '_', str(p21_id)]) if name != 'Coordinates' else (p21_id * 0.5, 1.0, 2.0)
+            for name in names]
+
+
+def dict_rows(n: int):
+    nodes, edges = [], []
+    for p21_id in range(1, n + 1):
+        entity_type, node_type, names = SHAPES[p21_id % len(SHAPES)]
+        attrs = dict(zip([str(name) for name in names], attribute_values(p21_id, names)))
+        attrs['p21_id'] = p21_id
+        attrs['EntityType'] = ''.join(entity_type)
+        nodes.append((''.join(node_type), attrs, attrs['EntityType']))
+        edges.append((p21_id, p21_id + 1, {'rel_type': ''.join('RelatedObjects'), 'listItem': 0}))
+    return nodes, edges
+
+
+def record_rows(n: int):
+    nodes, edges = [], []
+    for p21_id in range(1, n + 1):
+        entity_type, node_type, names = SHAPES[p21_id % len(SHAPES)]
+        nodes.append(NodeRecord(p21_id, ''.join(node_type), ''.join(entity_type),
+                                intern_names(str(name) for name in names),
+                                tuple(attribute_values(p21_id, names))))
+        edges.append(EdgeRecord(p21_id, p21_id + 1, ''.join('RelatedObjects'), list_item=0))
+    return nodes, edges
+
+
+def measure(build, n: int) -> tuple:
+    tracemalloc.start()
+    rows = build(n)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    return current, peak
+
+
+def run_benchmark(n: int = 100000):
+    print('{} nodes, {} edges'.format(n, n))
+    results = {}
+    for name, build in [('dict rows', dict_rows), ('records', record_rows)]:
+        current, peak = measure(build, n)
+        results[name] = current
+        print('{:<10} retained {:>8.1f} MiB  peak {:>8.1f} MiB  {:>6.0f} B/row'.format(
+            name, current / 2 ** 20, peak / 2 ** 20, current / (2 * n)))
+    print('reduction: {:.0%}'.format(1 - results['records'] / results['dict rows']))
+
+
+if __name__ == '__main__':
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,53 @@
+"""
+Compares multi-hop queries over connection nodes with the 1-hop lookups over derived shortcut edges.
+
+The model needs to be loaded with IFCGraphGenerator.generateGraph(derive_shortcuts=True) beforehand:
+
+    PYTHONPATH=converter python benchmarks/shortcut_edges.py <label>
+"""
+import sys
+
+from dotenv import dotenv_values
+
+from neo4jConnector import Neo4jConnector
+from diff_queries import profile
+
+# (name, query via connection nodes, query via shortcut edges)
+QUERIES = [
+    ('property sets of elements',
+     "MATCH (n:{0}:PrimaryNode)<-[:rel {{rel_type: 'RelatedObjects'}}]-"
+     "(c:ConnectionNode {{EntityType: 'IfcRelDefinesByProperties'}})"
+     "-[:rel {{rel_type: 'RelatingPropertyDefinition'}}]->(p) RETURN ID(n), ID(p)",
+     "MATCH (n:{0}:PrimaryNode)-[:shortcut {{rel_type: 'HAS_PROPERTY_SET'}}]->(p) RETURN ID(n), ID(p)"),
+    ('spatial container of elements',
+     "MATCH (n:{0}:PrimaryNode)<-[:rel {{rel_type: 'RelatedElements'}}]-"
+     "(c:ConnectionNode {{EntityType: 'IfcRelContainedInSpatialStructure'}})"
+     "-[:rel {{rel_type: 'RelatingStructure'}}]->(s) RETURN ID(n), ID(s)",
+     "MATCH (n:{0}:PrimaryNode)-[:shortcut {{rel_type: 'CONTAINED_IN'}}]->(s) RETURN ID(n), ID(s)"),
+    ('parts of aggregates',
+     "MATCH (n:{0}:PrimaryNode)<-[:rel {{rel_type: 'RelatingObject'}}]-"
+     "(c:ConnectionNode {{EntityType: 'IfcRelAggregates'}})"
+     "-[:rel {{rel_type: 'RelatedObjects'}}]->(m) RETURN ID(n), ID(m)",
+     "MATCH (n:{0}:PrimaryNode)-[:shortcut {{rel_type: 'AGGREGATES'}}]->(m) RETURN ID(n), ID(m)"),
+]
+
+
+def run_benchmark(label: str):
+    config = dotenv_values(".env")
+    connector = Neo4jConnector(config=config)
+    connector.connect_driver()
+
+    for name, multi_hop, shortcut in QUERIES:
+        rows_before, hits_before, time_before = profile(connector, multi_hop.format(label))
+        rows_after, hits_after, time_after = profile(connector, shortcut.format(label))
+        print('{}'.format(name))
+        print('\tconnection nodes  rows: {:>8d}  db hits: {:>10d}  time: {:.3f}s'.format(
+            rows_before, hits_before, time_before))
+        print('\tshortcut edges    rows: {:>8d}  db hits: {:>10d}  time: {:.3f}s'.format(
+            rows_after, hits_after, time_after))
+
+    connector.disconnect_driver()
+
+
+if __name__ == "__main__":
+    run_benchmark(sys.argv[1])
@@ -0,0 +1,48 @@
+"""
+Compares path enumeration (Neo4jQueryFactory.get_pattern_by_node_id) with the bounded subgraph fetch
+(GraphTraversal.fetch_subgraph) on the same start node, e.g. a wall of a loaded model:
+
+    PYTHONPATH=converter python benchmarks/subgraph_fetch.py <model label> <node id> [max depth]
+
+The database connection is read from .env
+"""
+import sys
+import time
+
+from dotenv import dotenv_values
+
+from neo4jConnector import Neo4jConnector
+from Neo4jQueryFactory import Neo4jQueryFactory
+from GraphTraversal import fetch_subgraph
+
+
+def run_benchmark(label: str, node_id: int, max_depth: int = 10):
+    config = dotenv_values(".env")
+    connector = Neo4jConnector(config=config)
+    connector.connect_driver()
+
+    start = time.perf_counter()
+    rows = 0
+    nodes_returned = 0
+    for chunk in connector.stream_cypher_statement(Neo4jQueryFactory.get_pattern_by_node_id(node_id)):
+        rows += len(chunk)
+        nodes_returned += sum(len(record[1]) for record in chunk)
+    print('{:<16} paths: {:>10}  nodes returned: {:>12}  time: {:8.3f}s'.format(
+        'path enumeration', rows, nodes_returned, time.perf_counter() - start))
+
+    for server_side in (False, True):
+        start = time.perf_counter()
+        try:
+            subgraph = fetch_subgraph(connector, label, [node_id], max_depth, server_side=server_side)
+        except Exception as e:
+            print('{:<16} failed: {}'.format('server side', e))
+            continue
+        print('{:<16} nodes: {:>10}  edges: {:>12}  time: {:8.3f}s'.format(
+            'server side' if server_side else 'client side', len(subgraph.nodes), len(subgraph.edges),
+            time.perf_counter() - start))
+
+    connector.disconnect_driver()
+
+
+if __name__ == '__main__':
+    run_benchmark(sys.argv[1], int(sys.argv[2]), *[int(arg) for arg in sys.argv[3:4]])
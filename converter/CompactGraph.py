@@ -0,0 +1,402 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+
+
+class PropertyColumn:
+    """
+    Values of one node property together with the positions of the nodes having a value.
+    Booleans, integers and floats are stored in typed arrays, all other values (strings, aggregations) as codes into
+    a table of their distinct values. A column starts with the type of its first value and falls back to the code
+    table once a value of another type is added.
+    """
+
+    __slots__ = ('positions', 'values', 'table', 'codes')
+
+    def __init__(self, val):
+        self.positions = array('l')
+        self.table = None
+        self.codes = None
+        if isinstance(val, bool):
+            self.values = array('b')
+        elif isinstance(val, int) and -2 ** 63 <= val < 2 ** 63:
+            self.values = array('q')
+        elif isinstance(val, float):
+            self.values = array('d')
+        else:
+            self.__use_table([])
+
+    def __len__(self):
+        return len(self.positions)
+
+    def append(self, pos: int, val):
+        """
+        @param pos: node position, positions are appended in ascending order
+        @param val: property value
+        """
+        if self.table is None and not self.__fits(val):
+            self.__use_table([self.get(i) for i in range(len(self.values))])
+        self.positions.append(pos)
+        self.values.append(self.__encode(val) if self.table is not None else val)
+
+    def get(self, i: int):
+        """
+        @param i: index within the column
+        @return: property value
+        """
+        if self.table is not None:
+            return self.table[self.values[i]]
+        if self.values.typecode == 'b':
+            return bool(self.values[i])
+        return self.values[i]
+
+    def __fits(self, val) -> bool:
+        typecode = self.values.typecode
+        if typecode == 'b':
+            return isinstance(val, bool)
+        if typecode == 'q':
+            return isinstance(val, int) and not isinstance(val, bool) and -2 ** 63 <= val < 2 ** 63
+        return isinstance(val, float)
+
+    def __use_table(self, values: list):
+        self.table = []
+        self.codes = {}
+        self.values = array('L')
+        for val in values:
+            self.values.append(self.__encode(val))
+
+    def __encode(self, val) -> int:
+        # the type is part of the key, so that e.g. 1, 1.0 and True keep their types
+        key = (type(val), tuple(val) if isinstance(val, list) else val)
+        try:
+            code = self.codes.get(key)
+        except TypeError:
+            # unhashable values are not shared
+            code = len(self.table)
+            self.table.append(val)
+            return code
+        if code is None:
+            code = len(self.table)
+            self.table.append(val)
+            self.codes[key] = code
+        return code
+
+
+class CompactGraph:
+    """
+    Compact in-memory mirror of a translated IFC model.
+    Nodes are addressed by their p21 id, adjacency is stored in CSR arrays (outgoing and incoming),
+    node types, entity types and rel types are stored as small-integer codes and
+    node properties are stored column-wise in typed arrays, see PropertyColumn.
+    Allows path and hierarchy analysis without a neo4j instance.
+    """
+
+    NODE_TYPES = ('PrimaryNode', 'SecondaryNode', 'ConnectionNode')
+
+    def __init__(self):
+        # node arrays, indexed by the node position (i.e., the insertion order)
+        self._p21 = array('q')
+        self._node_type = array('b')
+        self._entity_type = array('H')
+
+        # string tables
+        self._entity_types = []
+        self._entity_type_codes = {}
+        self._rel_types = []
+        self._rel_type_codes = {}
+
+        # columnar properties: attribute name -> PropertyColumn
+        self._columns = {}
+
+        # staged edges, converted into CSR arrays by finalize()
+        self._edge_from = array('q')
+        self._edge_to = array('q')
+        self._edge_rel = array('H')
+        self._edge_item = array('l')
+
+        self._finalized = False
+
+    # -- construction --
+
+    def add_node(self, p21_id: int, node_type: str, entity_type: str, attrs: dict = None):
+        """
+        adds a node to the graph
+        @param p21_id: p21 id of the IFC entity
+        @param node_type: PrimaryNode, SecondaryNode or ConnectionNode
+        @param entity_type: IFC class name
+        @param attrs: node properties. Set to None to skip property storage
+        """
+        if self._finalized:
+            raise Exception('CompactGraph is already finalized.')
+
+        pos = len(self._p21)
+        self._p21.append(p21_id)
+        self._node_type.append(self.NODE_TYPES.index(node_type))
+        self._entity_type.append(self.__encode(entity_type, self._entity_types, self._entity_type_codes))
+
+        if attrs is None:
+            return
+        for name, val in attrs.items():
+            if val is None or name in ('p21_id', 'EntityType'):
+                continue
+            column = self._columns.get(name)
+            if column is None:
+                column = PropertyColumn(val)
+                self._columns[name] = column
+            column.append(pos, val)
+
+    def add_edge(self, from_p21: int, to_p21: int, rel_type: str, list_item: int = None):
+        """
+        adds a directed edge between two nodes specified by their p21 ids
+        @param from_p21: p21 id origin
+        @param to_p21: p21 id destination
+        @param rel_type: attribute name of the association
+        @param list_item: position of the target within an aggregated association
+        """
+        if self._finalized:
+            raise Exception('CompactGraph is already finalized.')
+
+        self._edge_from.append(from_p21)
+        self._edge_to.append(to_p21)
+        self._edge_rel.append(self.__encode(rel_type, self._rel_types, self._rel_type_codes))
+        self._edge_item.append(-1 if list_item is None else list_item)
+
+    def finalize(self):
+        """
+        builds the p21 index and the CSR adjacency arrays. Has to be called once all nodes and edges are added.
+        Edges pointing to unknown nodes are dropped.
+        @return: the graph itself
+        """
+        n = len(self._p21)
+
+        # p21 index: sorted p21 ids and the corresponding node positions
+        order = sorted(range(n), key=self._p21.__getitem__)
+        self._sorted_p21 = array('q', (self._p21[i] for i in order))
+        self._sorted_pos = array('l', order)
+
+        # resolve edge endpoints to node positions
+        src = array('l')
+        dst = array('l')
+        rel = array('H')
+        item = array('l')
+        for i in range(len(self._edge_from)):
+            s = self._position(self._edge_from[i])
+            t = self._position(self._edge_to[i])
+            if s is None or t is None:
+                continue
+            src.append(s)
+            dst.append(t)
+            rel.append(self._edge_rel[i])
+            item.append(self._edge_item[i])
+
+        # outgoing CSR, counting sort by source position
+        self._out_offsets = self.__offsets(src, n)
+        cursor = array('q', self._out_offsets[:-1])
+        m = len(src)
+        self._out_targets = array('l', bytes(m * array('l').itemsize))
+        self._out_rel = array('H', bytes(m * array('H').itemsize))
+        self._out_item = array('l', bytes(m * array('l').itemsize))
+        for i in range(m):
+            k = cursor[src[i]]
+            cursor[src[i]] += 1
+            self._out_targets[k] = dst[i]
+            self._out_rel[k] = rel[i]
+            self._out_item[k] = item[i]
+
+        # incoming CSR, referencing the edge slots of the outgoing CSR
+        self._in_offsets = self.__offsets(self._out_targets, n)
+        cursor = array('q', self._in_offsets[:-1])
+        self._in_sources = array('l', bytes(m * array('l').itemsize))
+        self._in_edges = array('l', bytes(m * array('l').itemsize))
+        for s in range(n):
+            for k in range(self._out_offsets[s], self._out_offsets[s + 1]):
+                t = self._out_targets[k]
+                j = cursor[t]
+                cursor[t] += 1
+                self._in_sources[j] = s
+                self._in_edges[j] = k
+
+        # staged edges are not needed anymore
+        self._edge_from = self._edge_to = self._edge_rel = self._edge_item = None
+        self._finalized = True
+        return self
+
+    # -- node access --
+
+    def node_count(self) -> int:
+        return len(self._p21)
+
+    def edge_count(self) -> int:
+        return len(self._out_targets)
+
+    def has_node(self, p21_id: int) -> bool:
+        return self._position(p21_id) is not None
+
+    def get_node(self, p21_id: int) -> dict:
+        """
+        reconstructs the properties of a node
+        @param p21_id: p21 id of the node
+        @return: dict of node properties including p21_id, EntityType and the node type
+        """
+        pos = self.__require(p21_id)
+        node = {'p21_id': p21_id,
+                'EntityType': self._entity_types[self._entity_type[pos]],
+                'NodeType': self.NODE_TYPES[self._node_type[pos]]}
+        for name, column in self._columns.items():
+            i = bisect_left(column.positions, pos)
+            if i < len(column) and column.positions[i] == pos:
+                node[name] = column.get(i)
+        return node
+
+    def get_node_type(self, p21_id: int) -> str:
+        return self.NODE_TYPES[self._node_type[self.__require(p21_id)]]
+
+    def get_entity_type(self, p21_id: int) -> str:
+        return self._entity_types[self._entity_type[self.__require(p21_id)]]
+
+    def get_child_nodes(self, p21_id: int) -> list:
+        """
+        @param p21_id: p21 id of the parent node
+        @return: list of (child p21 id, rel_type, listItem) for all outgoing edges
+        """
+        pos = self.__require(p21_id)
+        return [(self._p21[self._out_targets[k]],
+                 self._rel_types[self._out_rel[k]],
+                 None if self._out_item[k] < 0 else self._out_item[k])
+                for k in range(self._out_offsets[pos], self._out_offsets[pos + 1])]
+
+    def get_parent_nodes(self, p21_id: int) -> list:
+        """
+        @param p21_id: p21 id of the child node
+        @return: list of (parent p21 id, rel_type, listItem) for all incoming edges
+        """
+        pos = self.__require(p21_id)
+        return [(self._p21[self._in_sources[j]],
+                 self._rel_types[self._out_rel[self._in_edges[j]]],
+                 None if self._out_item[self._in_edges[j]] < 0 else self._out_item[self._in_edges[j]])
+                for j in range(self._in_offsets[pos], self._in_offsets[pos + 1])]
+
+    # -- traversals --
+
+    def get_directed_path(self, p21_start: int, p21_target: int, max_length: int = 15) -> list:
+        """
+        local equivalent of Neo4jQueryFactory.get_directed_path_by_nodeId.
+        Searches the shortest directed path between two nodes using a breadth-first search.
+        @param p21_start: p21 id of the start node
+        @param p21_target: p21 id of the target node
+        @param max_length: max number of edges in the path
+        @return: list of p21 ids from start to target or None if no path exists
+        """
+        start = self.__require(p21_start)
+        target = self.__require(p21_target)
+
+        predecessor = {start: -1}
+        frontier = [start]
+        length = 0
+        while frontier and target not in predecessor and length < max_length:
+            length += 1
+            next_frontier = []
+            for s in frontier:
+                for k in range(self._out_offsets[s], self._out_offsets[s + 1]):
+                    t = self._out_targets[k]
+                    if t not in predecessor:
+                        predecessor[t] = s
+                        next_frontier.append(t)
+            frontier = next_frontier
+
+        if target not in predecessor or start == target:
+            return None
+
+        path = deque()
+        pos = target
+        while pos != -1:
+            path.appendleft(self._p21[pos])
+            pos = predecessor[pos]
+        return list(path)
+
+    def get_distinct_paths_from_node(self, p21_id: int, max_length: int = 12):
+        """
+        local equivalent of Neo4jQueryFactory.get_distinct_paths_from_node.
+        Enumerates all directed paths from the given node to leaf nodes (i.e., nodes without outgoing edges)
+        @param p21_id: p21 id of the start node
+        @param max_length: max number of edges in a path
+        @return: generator of paths, each path is a list of p21 ids
+        """
+        start = self.__require(p21_id)
+        # relationship-unique paths as in cypher: an edge slot must not be used twice within a path
+        stack = [(start, [start], frozenset())]
+        while stack:
+            pos, path, used_edges = stack.pop()
+            for k in range(self._out_offsets[pos], self._out_offsets[pos + 1]):
+                if k in used_edges:
+                    continue
+                t = self._out_targets[k]
+                new_path = path + [t]
+                if self._out_offsets[t] == self._out_offsets[t + 1]:
+                    yield [self._p21[p] for p in new_path]
+                elif len(new_path) - 1 < max_length:
+                    stack.append((t, new_path, used_edges | {k}))
+
+    def get_hierarchical_prim_nodes(self, p21_id: int, exclude_p21_ids=()) -> list:
+        """
+        local equivalent of Neo4jQueryFactory.get_hierarchical_prim_nodes.
+        Queries all primary nodes m with (n)<-[r1]-(c:ConnectionNode)-[r2]->(m:PrimaryNode)
+        @param p21_id: p21 id of node n
+        @param exclude_p21_ids: p21 ids of nodes to be excluded from the result
+        @return: list of distinct p21 ids
+        """
+        pos = self.__require(p21_id)
+        connection_node = self.NODE_TYPES.index('ConnectionNode')
+        primary_node = self.NODE_TYPES.index('PrimaryNode')
+        exclude = set(exclude_p21_ids)
+
+        result = []
+        seen = set()
+        for j in range(self._in_offsets[pos], self._in_offsets[pos + 1]):
+            c = self._in_sources[j]
+            if self._node_type[c] != connection_node:
+                continue
+            for k in range(self._out_offsets[c], self._out_offsets[c + 1]):
+                m = self._out_targets[k]
+                if k == self._in_edges[j] or self._node_type[m] != primary_node:
+                    continue
+                m_p21 = self._p21[m]
+                if m_p21 in exclude or m_p21 in seen:
+                    continue
+                seen.add(m_p21)
+                result.append(m_p21)
+        return result
+
+    # -- helpers --
+
+    def _position(self, p21_id: int):
+        i = bisect_left(self._sorted_p21, p21_id)
+        if i < len(self._sorted_p21) and self._sorted_p21[i] == p21_id:
+            return self._sorted_pos[i]
+        return None
+
+    def __require(self, p21_id: int) -> int:
+        if not self._finalized:
+            raise Exception('CompactGraph needs to be finalized before it can be queried.')
+        pos = self._position(p21_id)
+        if pos is None:
+            raise Exception('Node #{} does not exist in the graph.'.format(p21_id))
+        return pos
+
+    @staticmethod
+    def __encode(value: str, table: list, codes: dict) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = len(table)
+            table.append(value)
+            codes[value] = code
+        return code
+
+    @staticmethod
+    def __offsets(keys, n: int) -> array:
+        offsets = array('q', bytes((n + 1) * array('q').itemsize))
+        for key in keys:
+            offsets[key + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        return offsets
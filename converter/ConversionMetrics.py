@@ -0,0 +1,180 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def resident_memory_bytes():
+    """
+    @return: resident set size of the process in bytes, or None if it can't be determined on this platform
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+        # peak instead of current RSS, in kilobytes on linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except ImportError:
+        return None
+
+
+class ConversionMetrics:
+    """
+    Metrics of running conversions, exposed in the Prometheus text format via a local HTTP endpoint:
+    entities processed by the translator, nodes and edges committed to the database, the latency of batch commits,
+    retries of batches, rows queued in the loader and the resident memory of the process.
+    Pass an instance to IFCGraphGenerator.generateGraph(). The endpoint is served while generateGraph runs, or
+    across several conversions (e.g. a batch run) if it has been started beforehand:
+
+        with ConversionMetrics(port=9464) as metrics:
+            for path in paths:
+                IFCGraphGenerator(connector, path).generateGraph(metrics=metrics)
+    """
+
+    COMMIT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, port: int = 9464, host: str = '127.0.0.1'):
+        """
+
+        @param port: port of the metrics endpoint
+        @param host: interface to bind, e.g. 0.0.0.0 to scrape a container from outside
+        """
+        self.port = port
+        self.host = host
+
+        self.entities_processed = 0
+        # kind (nodes or edges) -> committed rows
+        self.rows_written = {'nodes': 0, 'edges': 0}
+        # kind -> bucket counts, sum and count of the commit latencies
+        self.commit_buckets = {}
+        self.commit_sum = {}
+        self.commit_count = {}
+        self.retries = 0
+        # callable returning the number of rows handed to the loader but not yet committed
+        self.queue_depth_of = None
+
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # -- recording --
+
+    def entity_processed(self, count: int = 1):
+        with self._lock:
+            self.entities_processed += count
+
+    def batch_committed(self, kind: str, rows: int, seconds: float):
+        """
+        @param kind: nodes or edges
+        @param rows: number of rows of the batch
+        @param seconds: commit latency
+        """
+        with self._lock:
+            self.rows_written[kind] = self.rows_written.get(kind, 0) + rows
+            buckets = self.commit_buckets.setdefault(kind, [0] * len(self.COMMIT_BUCKETS))
+            for i, bound in enumerate(self.COMMIT_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self.commit_sum[kind] = self.commit_sum.get(kind, 0.0) + seconds
+            self.commit_count[kind] = self.commit_count.get(kind, 0) + 1
+
+    def batch_retried(self):
+        with self._lock:
+            self.retries += 1
+
+    # -- exposition --
+
+    def render(self) -> str:
+        """
+        @return: all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            lines = ['# HELP ifc_graph_entities_processed_total IFC entities translated into node records.',
+                     '# TYPE ifc_graph_entities_processed_total counter',
+                     'ifc_graph_entities_processed_total {}'.format(self.entities_processed)]
+            for kind in ('nodes', 'edges'):
+                lines += ['# HELP ifc_graph_{}_written_total {} committed to the database.'.format(
+                              kind, kind.capitalize()),
+                          '# TYPE ifc_graph_{}_written_total counter'.format(kind),
+                          'ifc_graph_{}_written_total {}'.format(kind, self.rows_written.get(kind, 0))]
+
+            lines += ['# HELP ifc_graph_batch_commit_seconds Latency of batch commits.',
+                      '# TYPE ifc_graph_batch_commit_seconds histogram']
+            for kind, buckets in sorted(self.commit_buckets.items()):
+                for bound, count in zip(self.COMMIT_BUCKETS, buckets):
+                    lines.append('ifc_graph_batch_commit_seconds_bucket{{kind="{}",le="{}"}} {}'.format(
+                        kind, bound, count))
+                lines.append('ifc_graph_batch_commit_seconds_bucket{{kind="{}",le="+Inf"}} {}'.format(
+                    kind, self.commit_count[kind]))
+                lines.append('ifc_graph_batch_commit_seconds_sum{{kind="{}"}} {}'.format(kind, self.commit_sum[kind]))
+                lines.append('ifc_graph_batch_commit_seconds_count{{kind="{}"}} {}'.format(
+                    kind, self.commit_count[kind]))
+
+            lines += ['# HELP ifc_graph_batch_retries_total Batches retried after a transient error.',
+                      '# TYPE ifc_graph_batch_retries_total counter',
+                      'ifc_graph_batch_retries_total {}'.format(self.retries)]
+            queue_depth_of = self.queue_depth_of
+
+        lines += ['# HELP ifc_graph_queue_depth Rows handed to the loader but not yet committed.',
+                  '# TYPE ifc_graph_queue_depth gauge',
+                  'ifc_graph_queue_depth {}'.format(queue_depth_of() if queue_depth_of is not None else 0)]
+
+        rss = resident_memory_bytes()
+        if rss is not None:
+            lines += ['# HELP process_resident_memory_bytes Resident memory size in bytes.',
+                      '# TYPE process_resident_memory_bytes gauge',
+                      'process_resident_memory_bytes {}'.format(rss)]
+        return '\n'.join(lines) + '\n'
+
+    # -- endpoint --
+
+    @property
+    def running(self) -> bool:
+        return self._server is not None
+
+    def start(self):
+        """
+        serves the metrics at http://host:port/metrics in a background thread
+        """
+        if self.running:
+            return
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes would interleave with the progress bar
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='metrics-endpoint', daemon=True)
+        self._thread.start()
+        print('Serving metrics at http://{}:{}/metrics'.format(self.host, self._server.server_address[1]))
+
+    def stop(self):
+        if not self.running:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
@@ -0,0 +1,138 @@
+import hashlib
+import re
+import threading
+
+from Neo4jQueryFactory import Neo4jQueryFactory
+
+ROUTING_POLICIES = ('project', 'model', 'hash')
+
+
+def database_name(name: str, prefix: str = 'ifc') -> str:
+    """
+    converts a name into a valid neo4j database name: lowercase ascii letters, digits, dots and dashes,
+    starting with a letter, at most 63 characters
+    @param name: e.g. a project name or model label
+    @param prefix: prefix of the database name
+    @return: database name
+    """
+    name = re.sub(r'[^a-z0-9.]+', '-', name.lower()).strip('-.')
+    database = '{}-{}'.format(prefix, name) if name else prefix
+    if len(database) > 63:
+        # keep distinct names distinct after truncation
+        digest = hashlib.blake2b(database.encode(), digest_size=4).hexdigest()
+        database = database[:54].rstrip('-.') + '-' + digest
+    return database
+
+
+class DatabaseRouter:
+    """
+    Routes models to separate databases, so that independent models are loaded and queried in parallel without
+    contending on the same store and indexes, and dropping a model doesn't slow down the others.
+    Policies:
+        project: all models of a project share a database
+        model: every model gets its own database
+        hash: models are distributed over a fixed number of shard databases by the hash of their label
+    Databases are created on demand. The route of every model is stored as (:ModelRoute {label, database, project})
+    node in the home database of the connector, so that queries of a model find its database later on.
+    Servers without support for multiple databases (e.g. Neo4j Community Edition) keep all models in the
+    home database.
+    """
+
+    def __init__(self, connector, policy: str = 'model', shards: int = 4, prefix: str = 'ifc'):
+        """
+
+        @param connector: Neo4jConnector instance, its database holds the routes
+        @param policy: project, model or hash
+        @param shards: number of databases of the hash policy
+        @param prefix: prefix of the database names
+        """
+        if policy not in ROUTING_POLICIES:
+            raise Exception('Unknown routing policy {}, expected one of {}.'.format(policy, ROUTING_POLICIES))
+        self.connector = connector
+        self.policy = policy
+        self.shards = shards
+        self.prefix = prefix
+
+        # databases known to exist
+        self.databases = None
+        # set if the server can't create databases
+        self.single_database = False
+        self._lock = threading.Lock()
+
+        self.connector.run_cypher_statement(Neo4jQueryFactory.create_model_route_index())
+
+    def database_for(self, label: str, project: str = None) -> str:
+        """
+        applies the routing policy to a model
+        @param label: model label
+        @param project: project of the model, required by the project policy
+        @return: database name
+        """
+        if self.policy == 'project':
+            if project is None:
+                raise Exception('The project policy requires the project of model {}.'.format(label))
+            return database_name(project, self.prefix)
+        if self.policy == 'model':
+            return database_name(label, self.prefix)
+        shard = int.from_bytes(hashlib.blake2b(label.encode(), digest_size=8).digest(), 'little') % self.shards
+        return database_name('shard-{}'.format(shard), self.prefix)
+
+    def route(self, label: str, project: str = None) -> str:
+        """
+        looks up the database of a model. Models without stored route are routed by the policy,
+        their database gets created and the route stored
+        @param label: model label
+        @param project: project of the model, see database_for()
+        @return: database name, None for the home database
+        """
+        records = self.connector.run_cypher_statement(Neo4jQueryFactory.get_model_route(label))
+        if len(records) > 0:
+            return records[0]['database']
+
+        database = self.database_for(label, project)
+        if not self.ensure_database(database):
+            return None
+        self.connector.run_cypher_statement(Neo4jQueryFactory.merge_model_route(),
+                                            parameters={'label': label, 'database': database, 'project': project})
+        return database
+
+    def connector_for(self, label: str, project: str = None):
+        """
+        @param label: model label
+        @param project: project of the model, see database_for()
+        @return: connector running all statements against the database of the model
+        """
+        return self.connector.for_database(self.route(label, project))
+
+    def ensure_database(self, database: str) -> bool:
+        """
+        creates a database unless it exists already
+        @param database: database name
+        @return: False if the server doesn't support multiple databases
+        """
+        with self._lock:
+            if self.single_database:
+                return False
+            if self.databases is None:
+                self.databases = {record['name'] for record in
+                                  self.connector.run_system_statement(Neo4jQueryFactory.list_databases())}
+            if database in self.databases:
+                return True
+            try:
+                self.connector.run_system_statement(Neo4jQueryFactory.create_database(database))
+            except Exception as e:
+                if 'Unsupported' not in str(e.__cause__):
+                    raise
+                print('WARNING: the server does not support multiple databases, all models stay in the home database.')
+                self.single_database = True
+                return False
+            print('Created database {}.'.format(database))
+            self.databases.add(database)
+            return True
+
+    def list_routes(self) -> list:
+        """
+        @return: list of dicts with label, database and project of all routed models
+        """
+        return [dict(record) for record in
+                self.connector.run_cypher_statement(Neo4jQueryFactory.list_model_routes())]
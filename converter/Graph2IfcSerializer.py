@@ -0,0 +1,293 @@
+import ast
+import datetime
+import os
+import re
+
+import ifcopenshell
+from Neo4jQueryFactory import Neo4jQueryFactory
+from GraphRecords import ORDERED_LIST_SUFFIX
+
+# typed values of selects, e.g. IfcLengthMeasure(1.) or the NominalValue IfcLabel(abc)
+TYPED_VALUE = re.compile(r'^(Ifc\w+)\((.*)\)$', re.DOTALL)
+# entity instances within aggregations, e.g. #25=IfcCartesianPoint((1.,0.))
+ENTITY_INSTANCE = re.compile(r'^#(\d+)=')
+
+
+def format_real(val: float) -> str:
+    """
+    formats a float as STEP real, i.e., with a decimal point and an upper case exponent
+    """
+    mantissa, _, exponent = repr(float(val)).partition('e')
+    if '.' not in mantissa:
+        mantissa += '.'
+    return mantissa + ('E' + exponent if exponent else '')
+
+
+def format_string(val: str) -> str:
+    """
+    formats a str as STEP string, escaping quotes, backslashes and non-ascii characters
+    """
+    s = "'"
+    for char in str(val):
+        code = ord(char)
+        if char == "'":
+            s += "''"
+        elif char == '\\':
+            s += '\\\\'
+        elif 32 <= code <= 126:
+            s += char
+        elif code <= 0xFFFF:
+            s += '\\X2\\{:04X}\\X0\\'.format(code)
+        else:
+            s += '\\X4\\{:08X}\\X0\\'.format(code)
+    return s + "'"
+
+
+def split_aggregate(val: str) -> list:
+    """
+    splits the string representation of an aggregation into the representations of its elements, e.g.
+    (#25=IfcCartesianPoint((1.,0.)), IfcParameterValue(0.)) -> #25=IfcCartesianPoint((1.,0.)), IfcParameterValue(0.)
+    @param val: string representation of a tuple
+    @return: list of str, None if val isn't enclosed in parentheses
+    """
+    val = val.strip()
+    if not (val.startswith('(') and val.endswith(')')):
+        return None
+
+    elements = []
+    depth = 0
+    quote = None
+    start = 1
+    for i in range(1, len(val) - 1):
+        char = val[i]
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in '\'"':
+            quote = char
+        elif char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            elements.append(val[start:i].strip())
+            start = i + 1
+    elements.append(val[start:-1].strip())
+    # the trailing comma of single element tuples
+    return [element for element in elements if element != '']
+
+
+class IFCP21Serializer:
+    """
+    Writes a model stored in the graph back into an IFC-SPF (P21) file.
+    Nodes are streamed from the database together with their outgoing associations and every entity is written
+    as soon as it has been reconstructed, so the memory consumption is bounded by the page size.
+    Entity attributes are ordered by the schema definition of the entity type: node properties provide the
+    attribute values, rel edges (ordered by listItem) provide the references. The order of compactly encoded
+    aggregations is taken from the list property of the node, see IFCGraphGenerator(compact_list_threshold).
+    """
+
+    def __init__(self, connector, label: str, schema: str = 'IFC4', page_size: int = 1000):
+        """
+
+        @param connector: Neo4jConnector instance
+        @param label: model label, see IFCGraphGenerator.timestamp
+        @param schema: IFC schema of the model, e.g. IFC2X3 or IFC4
+        @param page_size: number of nodes fetched from the database at once
+        """
+        self.connector = connector
+        self.label = label
+        self.schema_name = schema
+        self.schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(schema)
+        self.page_size = page_size
+
+        # entity type -> list of (attribute name, attribute type, is derived)
+        self._attribute_cache = {}
+
+    def serialize(self, path: str) -> int:
+        """
+        writes the model to a P21 file
+        @param path: file path of the IFC file
+        @return: number of written entities
+        """
+        print('[GRAPH > {} < ]: Serializing graph to {}... '.format(self.label, path))
+
+        count = 0
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='ascii') as f:
+            f.write(self.header(os.path.basename(path)))
+
+            cy = Neo4jQueryFactory.get_entities_with_edges(self.label)
+            for chunk in self.connector.stream_cypher_statement(cy, chunk_size=self.page_size):
+                for record in chunk:
+                    f.write(self.format_entity(record['p21_id'], record['entity_type'],
+                                               record['attrs'], record['edges']))
+                    f.write('\n')
+                    count += 1
+
+            f.write('ENDSEC;\nEND-ISO-10303-21;\n')
+
+        # replace an existing file only once the new one is complete
+        os.replace(tmp_path, path)
+
+        print('[GRAPH > {} < ]: Serializing graph - DONE. {} entities written.'.format(self.label, count))
+        return count
+
+    def header(self, file_name: str) -> str:
+        """
+        @param file_name: name of the IFC file
+        @return: STEP header section and the start of the data section
+        """
+        return 'ISO-10303-21;\n' \
+               'HEADER;\n' \
+               "FILE_DESCRIPTION(('ViewDefinition [CoordinationView]'),'2;1');\n" \
+               "FILE_NAME({},{},(''),(''),'','IFC-graph {}','');\n" \
+               "FILE_SCHEMA(('{}'));\n" \
+               'ENDSEC;\n' \
+               'DATA;\n'.format(format_string(file_name),
+                                format_string(datetime.datetime.now().replace(microsecond=0).isoformat()),
+                                self.label,
+                                self.schema_name)
+
+    def format_entity(self, p21_id: int, entity_type: str, attrs: dict, edges: list) -> str:
+        """
+        reconstructs the STEP instance of a node
+        @param p21_id: p21 id of the node
+        @param entity_type: IFC class name
+        @param attrs: node properties
+        @param edges: outgoing associations as [rel_type, listItem, p21 id destination]
+        @return: STEP instance, e.g. #1=IFCCARTESIANPOINT((0.,0.,0.));
+        """
+        references = {}
+        for rel_type, list_item, to_p21 in edges:
+            references.setdefault(rel_type, []).append((-1 if list_item is None else list_item, to_p21))
+
+        values = []
+        for name, attr_type, derived in self.attributes_of(entity_type):
+            if derived:
+                values.append('*')
+            elif name + ORDERED_LIST_SUFFIX in attrs:
+                values.append('(' + ','.join('#{}'.format(to_p21) for to_p21 in attrs[name + ORDERED_LIST_SUFFIX]) + ')')
+            elif name in references:
+                refs = ['#{}'.format(to_p21) for _, to_p21 in sorted(references[name])]
+                if self.__is_aggregation(attr_type):
+                    values.append('(' + ','.join(refs) + ')')
+                else:
+                    values.append(refs[0])
+            elif name in attrs:
+                values.append(self.format_value(attrs[name], attr_type, name))
+            else:
+                values.append('$')
+
+        return '#{}={}({});'.format(p21_id, entity_type.upper(), ','.join(values))
+
+    def attributes_of(self, entity_type: str) -> list:
+        """
+        @param entity_type: IFC class name
+        @return: list of (attribute name, attribute type, is derived) in the order of the schema definition
+        """
+        attributes = self._attribute_cache.get(entity_type)
+        if attributes is None:
+            try:
+                declaration = self.schema.declaration_by_name(entity_type)
+            except:
+                raise Exception("Failed to query schema specification in IFCP21Serializer.\n "
+                                "Schema: {}, Entity: {} ".format(self.schema_name, entity_type))
+            attributes = [(attr.name(), attr.type_of_attribute(), derived)
+                          for attr, derived in zip(declaration.all_attributes(), declaration.derived())]
+            self._attribute_cache[entity_type] = attributes
+        return attributes
+
+    def format_value(self, val, attr_type, name: str = None) -> str:
+        """
+        formats a node property as STEP value w.r.t. the attribute type.
+        Aggregations are stored as their string representation and get parsed again.
+        @param val: property value
+        @param attr_type: parameter type of the schema
+        @param name: attribute name
+        @return: STEP value
+        """
+        if val is None or val == 'None':
+            return '$'
+
+        attr_type = self.__resolve(attr_type)
+        wrapper = ifcopenshell.ifcopenshell_wrapper
+
+        if isinstance(attr_type, wrapper.aggregation_type):
+            element_type = attr_type.type_of_element()
+            if isinstance(val, str):
+                try:
+                    val = ast.literal_eval(val)
+                except (ValueError, SyntaxError):
+                    # aggregations of entity instances or typed values, e.g. Trim1 of IfcTrimmedCurve
+                    elements = split_aggregate(val)
+                    if elements is None:
+                        return format_string(val)
+                    return '(' + ','.join(self.__format_element(element, element_type) for element in elements) + ')'
+            if not isinstance(val, (tuple, list)):
+                val = (val,)
+            return '(' + ','.join(self.format_value(v, element_type) for v in val) + ')'
+
+        if isinstance(attr_type, wrapper.enumeration_type):
+            return '.{}.'.format(str(val).upper())
+
+        if isinstance(attr_type, wrapper.select_type):
+            match = TYPED_VALUE.match(val) if isinstance(val, str) else None
+            if match is None:
+                return format_string(val)
+            type_name, inner = match.groups()
+            if name == 'NominalValue':
+                # IFCGraphGenerator.extract_node_record stores nominal values as <type>(<value without quotes>)
+                return '{}({})'.format(type_name.upper(), self.__format_typed(type_name, inner))
+            # typed values of other selects are stored in their STEP representation
+            return '{}({})'.format(type_name.upper(), inner)
+
+        if isinstance(attr_type, wrapper.simple_type):
+            simple = attr_type.declared_type()
+            if simple == 'boolean':
+                return '.T.' if val in (True, 'True') else '.F.'
+            if simple == 'logical':
+                if val in (True, 'True'):
+                    return '.T.'
+                return '.F.' if val in (False, 'False') else '.U.'
+            if simple == 'integer':
+                return str(int(val))
+            if simple in ('real', 'number'):
+                return format_real(val)
+            if simple == 'binary':
+                return '"{}"'.format(val)
+
+        return format_string(val)
+
+    def __format_element(self, element: str, element_type) -> str:
+        """
+        formats an element of an aggregation stored as string representation, see split_aggregate()
+        """
+        reference = ENTITY_INSTANCE.match(element)
+        if reference is not None:
+            return '#' + reference.group(1)
+        return self.format_value(element, element_type)
+
+    def __format_typed(self, type_name: str, val: str) -> str:
+        """
+        formats the value of a defined type, e.g. 0.3 of IfcLengthMeasure as real and A1 of IfcLabel as string
+        """
+        try:
+            declaration = self.schema.declaration_by_name(type_name)
+        except:
+            return format_string(val)
+        return self.format_value(val, declaration)
+
+    def __is_aggregation(self, attr_type) -> bool:
+        return isinstance(self.__resolve(attr_type), ifcopenshell.ifcopenshell_wrapper.aggregation_type)
+
+    @staticmethod
+    def __resolve(attr_type):
+        """
+        resolves named types and type declarations to the underlying simple, aggregation, enumeration,
+        select or entity type
+        """
+        wrapper = ifcopenshell.ifcopenshell_wrapper
+        while isinstance(attr_type, (wrapper.named_type, wrapper.type_declaration)):
+            attr_type = attr_type.declared_type()
+        return attr_type
@@ -0,0 +1,104 @@
+import sys
+
+# suffix of the node property holding the ordered target p21 ids of a compactly encoded LIST aggregation,
+# e.g. Polygon_p21_ids, see IFCGraphGenerator(compact_list_threshold)
+ORDERED_LIST_SUFFIX = '_p21_ids'
+
+# shared attribute name tuples, one per distinct set of attribute names (i.e., roughly one per IFC class)
+_name_tuples = {}
+
+
+def intern_names(names) -> tuple:
+    """
+    returns the shared instance of a tuple of attribute names, all names being interned strings
+    @param names: iterable of attribute names
+    @return: tuple of str
+    """
+    names = tuple(names)
+    shared = _name_tuples.get(names)
+    if shared is None:
+        shared = tuple(sys.intern(name) for name in names)
+        _name_tuples[shared] = shared
+    return shared
+
+
+class NodeRecord:
+    """
+    Compact representation of a node extracted from an IFC entity.
+    Attribute names are stored once per IFC class in a shared tuple, types are interned strings,
+    so a record only holds its own attribute values.
+    """
+
+    __slots__ = ('p21_id', 'node_type', 'entity_type', 'names', 'values')
+
+    def __init__(self, p21_id: int, node_type: str, entity_type: str, names: tuple, values: tuple):
+        """
+
+        @param p21_id: p21 id of the IFC entity
+        @param node_type: PrimaryNode, SecondaryNode or ConnectionNode
+        @param entity_type: IFC class name
+        @param names: attribute names, see intern_names()
+        @param values: attribute values in the order of names
+        """
+        self.p21_id = p21_id
+        self.node_type = sys.intern(node_type)
+        self.entity_type = sys.intern(entity_type)
+        self.names = names
+        self.values = values
+
+    def properties(self) -> dict:
+        """
+        @return: node properties as dict, including p21_id and EntityType (see IFCGraphGenerator.extract_node_data)
+        """
+        node_properties_dict = dict(zip(self.names, self.values))
+        node_properties_dict['p21_id'] = self.p21_id
+        node_properties_dict['EntityType'] = self.entity_type
+        return node_properties_dict
+
+    def add_properties(self, properties: dict):
+        """
+        appends further properties to the record
+        @param properties: dict of property names and values
+        """
+        self.names = intern_names(self.names + tuple(properties.keys()))
+        self.values = self.values + tuple(properties.values())
+
+    def __repr__(self):
+        return 'NodeRecord(#{}={}, {})'.format(self.p21_id, self.entity_type, self.node_type)
+
+
+class EdgeRecord:
+    """
+    Compact representation of a directed edge between two nodes specified by their p21 ids.
+    """
+
+    __slots__ = ('source', 'target', 'rel_type', 'list_item', 'derived_from')
+
+    def __init__(self, source: int, target: int, rel_type: str, list_item: int = None, derived_from: int = None):
+        """
+
+        @param source: p21 id origin
+        @param target: p21 id destination
+        @param rel_type: name of the association attribute
+        @param list_item: position of the target within an aggregated association
+        @param derived_from: p21 id of the relationship entity a shortcut edge has been derived from
+        """
+        self.source = source
+        self.target = target
+        self.rel_type = sys.intern(rel_type)
+        self.list_item = list_item
+        self.derived_from = derived_from
+
+    def properties(self) -> dict:
+        """
+        @return: edge properties as dict, i.e., rel_type and optionally listItem and derived_from
+        """
+        edge_attrs = {'rel_type': self.rel_type}
+        if self.list_item is not None:
+            edge_attrs['listItem'] = self.list_item
+        if self.derived_from is not None:
+            edge_attrs['derived_from'] = self.derived_from
+        return edge_attrs
+
+    def __repr__(self):
+        return 'EdgeRecord(#{} -[{}]-> #{})'.format(self.source, self.rel_type, self.target)
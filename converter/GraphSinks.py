@@ -0,0 +1,243 @@
+import time
+
+from Neo4jGraphFactory import Neo4jGraphFactory
+from Neo4jBatchLoader import Neo4jBatchLoader
+from Neo4jQueryFactory import Neo4jQueryFactory
+from ModelRegistry import ModelRegistry, RegistryCounter
+
+
+class GraphSink:
+    """
+    Receives the node and edge records produced by IFCGraphGenerator.generateGraph.
+    Nodes are always written before edges, so sinks may rely on all nodes being present once the first
+    edge arrives.
+    """
+
+    def begin(self, timestamp: str):
+        """
+        called once before any record is written
+        @param timestamp: model label
+        """
+        pass
+
+    def write_statement(self, statement: str):
+        """
+        writes a schema statement, e.g. an index definition
+        @param statement: cypher statement
+        """
+        pass
+
+    def write_nodes(self, nodes):
+        """
+        @param nodes: iterable of NodeRecord
+        """
+        for _ in nodes:
+            pass
+
+    def write_edges(self, edges, edge_type: str = 'rel', phase: str = 'edges'):
+        """
+        @param edges: iterable of EdgeRecord
+        @param edge_type: relationship type of the edges, rel or shortcut
+        @param phase: name of the checkpoint phase, see Neo4jBatchLoader
+        """
+        for _ in edges:
+            pass
+
+    def close(self):
+        """
+        called once all records are written
+        """
+        pass
+
+
+class NullSink(GraphSink):
+    """
+    Discards all records. Used to measure the raw extraction throughput of the translator.
+    """
+
+    def __init__(self):
+        self.node_count = 0
+        self.edge_count = 0
+        self.start = None
+        self.seconds = 0.0
+
+    def begin(self, timestamp: str):
+        self.start = time.perf_counter()
+
+    def write_nodes(self, nodes):
+        for _ in nodes:
+            self.node_count += 1
+
+    def write_edges(self, edges, edge_type: str = 'rel', phase: str = 'edges'):
+        for _ in edges:
+            self.edge_count += 1
+
+    def close(self):
+        self.seconds = time.perf_counter() - self.start
+        print('NullSink: {} nodes, {} edges in {:.2f}s ({:.0f} records/s)'.format(
+            self.node_count, self.edge_count, self.seconds,
+            (self.node_count + self.edge_count) / max(self.seconds, 1e-9)))
+
+
+class RecordingSink(GraphSink):
+    """
+    Keeps all records in memory, e.g. to inspect the output of the translator without a database.
+    """
+
+    def __init__(self):
+        self.timestamp = None
+        self.statements = []
+        self.nodes = []
+        # list of (EdgeRecord, edge type)
+        self.edges = []
+        self.closed = False
+
+    def begin(self, timestamp: str):
+        self.timestamp = timestamp
+
+    def write_statement(self, statement: str):
+        self.statements.append(statement)
+
+    def write_nodes(self, nodes):
+        self.nodes.extend(nodes)
+
+    def write_edges(self, edges, edge_type: str = 'rel', phase: str = 'edges'):
+        self.edges.extend((edge, edge_type) for edge in edges)
+
+    def close(self):
+        self.closed = True
+
+
+class CypherFileSink(GraphSink):
+    """
+    Translates the records into single cypher statements and prints them, e.g. to be piped into a *.cypher file.
+    """
+
+    def __init__(self, statements: list = None):
+        """
+
+        @param statements: optional list the statements get appended to
+        """
+        self.timestamp = None
+        self.statements = statements if statements is not None else []
+
+    def begin(self, timestamp: str):
+        self.timestamp = timestamp
+
+    def write_statement(self, statement: str):
+        print(statement)
+        self.statements.append(statement)
+
+    def write_nodes(self, nodes):
+        for node in nodes:
+            self.write_statement(Neo4jGraphFactory.merge_node_with_attr(label=node.node_type,
+                                                                        attrs=node.properties(),
+                                                                        timestamp=self.timestamp,
+                                                                        entity_type=node.entity_type,
+                                                                        node_identifier=node.p21_id,
+                                                                        skip_return=True))
+
+    def write_edges(self, edges, edge_type: str = 'rel', phase: str = 'edges'):
+        for edge in edges:
+            self.write_statement(Neo4jGraphFactory.merge_on_p21(
+                edge.source, edge.target, edge.properties(), self.timestamp, without_match=True, edge_type=edge_type))
+
+
+class Neo4jSink(GraphSink):
+    """
+    Writes the records into the connected database using a Neo4jBatchLoader.
+    An interrupted import of the same model with the same import key gets resumed, otherwise an existing graph
+    with the same label gets overwritten. As the label is fresh then, nodes and edges are CREATEd.
+    Set merge to keep an existing graph and MERGE into it instead, e.g. for incremental or repair runs.
+    Once complete, the import is recorded in the registry node of the model, see ModelRegistry.
+    """
+
+    def __init__(self, connector, import_key: str, batch_size: int = 5000, writer_threads: int = 1,
+                 merge: bool = False, unique_constraint: bool = False, model_info: dict = None,
+                 target_latency: float = 2.0, metrics=None):
+        """
+
+        @param connector: Neo4jConnector instance
+        @param import_key: see Neo4jBatchLoader
+        @param batch_size: initial number of rows per transaction
+        @param writer_threads: number of threads writing the edges, see Neo4jBatchLoader.load_edges_parallel()
+        @param merge: keep an existing graph with the same label and MERGE nodes and edges into it
+        @param unique_constraint: additionally let the database enforce unique p21 ids within the model label
+        @param model_info: source_path, file_hash, schema and header_timestamp of the model for the registry node
+        @param target_latency: seconds a commit should take at most, see AdaptiveBatchSize
+        @param metrics: optional ConversionMetrics recording the commits
+        """
+        self.connector = connector
+        # an import in merge mode can't be resumed with CREATE statements and vice versa
+        self.import_key = import_key + (':merge' if merge else ':create')
+        self.batch_size = batch_size
+        self.target_latency = target_latency
+        self.metrics = metrics
+        self.writer_threads = writer_threads
+        self.merge = merge
+        self.unique_constraint = unique_constraint
+        self.model_info = model_info if model_info is not None else {}
+        self.loader = None
+        self.registry = None
+        self.counter = RegistryCounter()
+        self.resumed = False
+
+    def begin(self, timestamp: str):
+        self.loader = Neo4jBatchLoader(self.connector, timestamp, import_key=self.import_key,
+                                       batch_size=self.batch_size, create_only=not self.merge, target_latency=self.target_latency,
+                                       metrics=self.metrics)
+        self.registry = ModelRegistry(self.connector)
+
+        if self.unique_constraint:
+            self.connector.run_cypher_statement(Neo4jQueryFactory.create_p21_uniqueness_constraint(timestamp))
+
+        if self.loader.load_checkpoints():
+            # a previous import of the same file has been interrupted
+            print('[IFC_P21 > {} < ]: Resuming interrupted import.'.format(timestamp))
+            self.resumed = True
+            return
+
+        # check if model has been already processed
+        exists = self.registry.exists(timestamp)
+        if exists and self.merge:
+            print('[IFC_P21 > {} < ]: Merging into existing graph.'.format(timestamp))
+        elif exists:
+            print('WARNING: entire graph labeled with >> {} << gets overwritten.'.format(timestamp))
+            self.connector.run_cypher_statement('MATCH(n:{}) DETACH DELETE n'.format(timestamp))
+            self.registry.delete(timestamp)
+            self.invalidate_cached_queries()
+        self.loader.clear_checkpoints()
+
+    def write_statement(self, statement: str):
+        self.connector.run_cypher_statement(statement)
+
+    def write_nodes(self, nodes):
+        self.loader.load_nodes(self.counter.count_nodes(nodes))
+
+    def write_edges(self, edges, edge_type: str = 'rel', phase: str = 'edges'):
+        self.loader.load_edges_parallel(self.counter.count_edges(edges, edge_type), edge_type=edge_type, phase=phase,
+                                        writer_threads=self.writer_threads)
+
+    def close(self):
+        # the import is complete, nothing to resume anymore
+        self.loader.clear_checkpoints()
+        if self.merge or self.resumed:
+            # the graph may hold more than the records written by this run
+            self.registry.refresh(self.loader.timestamp, self.model_info,
+                                  'merge' if self.merge else 'create')
+        else:
+            self.registry.write(self.loader.timestamp, self.model_info,
+                                self.counter.entity_types, self.counter.rel_types, 'create')
+        self.invalidate_cached_queries()
+        print('[IFC_P21 > {} < ]: Committed {} rows in {} batches, {:.1f}s commit time, {} retries.'.format(
+            self.loader.timestamp, self.loader.rows_committed, self.loader.batches_committed,
+            self.loader.commit_time, self.loader.retries))
+        self.loader.batch_sizes.print_summary()
+
+    def invalidate_cached_queries(self):
+        """
+        drops cached query results for this model if the connector is wrapped by a Neo4jQueryCache
+        """
+        invalidate = getattr(self.connector, 'invalidate_label', None)
+        if invalidate is not None:
+            invalidate(self.loader.timestamp)
@@ -0,0 +1,264 @@
+import hashlib
+import json
+import os
+import sys
+import zipfile
+from array import array
+
+from GraphRecords import NodeRecord, EdgeRecord, intern_names, ORDERED_LIST_SUFFIX
+
+
+def file_hash(path: str) -> str:
+    """
+    calculates the sha256 content hash of a file
+    @param path: file path
+    @return: hex digest
+    """
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def is_plain(value) -> bool:
+    """
+    @return: True if json encodes the value without loss, i.e., it consists of None, bool, numbers, strings and
+             tuples or lists of those
+    """
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return True
+    if isinstance(value, (tuple, list)):
+        return all(is_plain(v) for v in value)
+    return False
+
+
+def to_tuples(value):
+    """
+    restores the tuples of IFC aggregations after a json round trip
+    """
+    if isinstance(value, list):
+        return tuple(to_tuples(v) for v in value)
+    return value
+
+
+class GraphSnapshot:
+    """
+    Compact on-disk snapshot of the node and edge rows extracted from an IFC model.
+    Rows are stored column-wise in a compressed zip container together with the content hash of the source file,
+    so a later run on the unchanged file can replay the rows without parsing the model again.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, source_hash: str = None, source_path: str = None, schema: str = None,
+                 timestamp: str = None):
+        self.meta = {
+            'format_version': self.FORMAT_VERSION,
+            'source_hash': source_hash,
+            'source_path': source_path,
+            'schema': schema,
+            'timestamp': timestamp,
+            'byteorder': sys.byteorder
+        }
+
+        # node columns
+        self._p21 = array('q')
+        self._node_type = array('b')
+        self._entity_type = array('H')
+        self._node_types = []
+        self._entity_types = []
+
+        # property columns, grouped by layout (i.e., the attribute names of a node)
+        self._layout = array('H')
+        self._layouts = []
+        self._columns = []
+
+        # edge columns
+        self._edge_from = array('q')
+        self._edge_to = array('q')
+        self._edge_rel = array('H')
+        self._edge_item = array('q')
+        self._rel_types = []
+
+        self._codes = {}
+
+    # -- writing --
+
+    def add_node(self, node: NodeRecord):
+        """
+        appends a node row
+        @param node: NodeRecord as returned by IFCGraphGenerator.extract_node_record
+        """
+        self._p21.append(node.p21_id)
+        self._node_type.append(self.__encode(node.node_type, self._node_types))
+        self._entity_type.append(self.__encode(node.entity_type, self._entity_types))
+
+        layout = self.__encode(node.names, self._layouts)
+        if layout == len(self._columns):
+            self._columns.append([[] for _ in node.names])
+        self._layout.append(layout)
+
+        for column, val in zip(self._columns[layout], node.values):
+            column.append(val)
+
+    def add_edge(self, edge: EdgeRecord):
+        """
+        appends an edge row
+        @param edge: EdgeRecord
+        """
+        self._edge_from.append(edge.source)
+        self._edge_to.append(edge.target)
+        self._edge_rel.append(self.__encode(edge.rel_type, self._rel_types))
+        self._edge_item.append(-1 if edge.list_item is None else edge.list_item)
+
+    def save(self, path: str):
+        """
+        writes the snapshot to disk
+        @param path: file path of the snapshot
+        """
+        self.meta.update({
+            'node_count': len(self._p21),
+            'edge_count': len(self._edge_from),
+            'node_types': self._node_types,
+            'entity_types': self._entity_types,
+            'rel_types': self._rel_types,
+            'layouts': self._layouts
+        })
+
+        tmp_path = path + '.tmp'
+        with zipfile.ZipFile(tmp_path, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+            z.writestr('meta.json', json.dumps(self.meta))
+            z.writestr('nodes/p21_id', self._p21.tobytes())
+            z.writestr('nodes/node_type', self._node_type.tobytes())
+            z.writestr('nodes/entity_type', self._entity_type.tobytes())
+            z.writestr('nodes/layout', self._layout.tobytes())
+            for i, columns in enumerate(self._columns):
+                # values that json can't encode (e.g. typed select values or aggregations of entity instances)
+                # are written in their string representation as a whole, which is what the database stores
+                z.writestr('properties/{}.json'.format(i), json.dumps(
+                    [[v if is_plain(v) else str(v) for v in column] for column in columns]))
+            z.writestr('edges/from', self._edge_from.tobytes())
+            z.writestr('edges/to', self._edge_to.tobytes())
+            z.writestr('edges/rel_type', self._edge_rel.tobytes())
+            z.writestr('edges/list_item', self._edge_item.tobytes())
+
+        # replace the previous snapshot only once the new one is complete
+        os.replace(tmp_path, path)
+
+    # -- reading --
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        reads a snapshot from disk
+        @param path: file path of the snapshot
+        @return: GraphSnapshot
+        """
+        snapshot = cls()
+        with zipfile.ZipFile(path, 'r') as z:
+            meta = json.loads(z.read('meta.json'))
+            if meta['format_version'] != cls.FORMAT_VERSION:
+                raise Exception('Unsupported snapshot format version {} in {}'.format(meta['format_version'], path))
+            swap = meta['byteorder'] != sys.byteorder
+
+            def read_array(type_code, name):
+                arr = array(type_code)
+                arr.frombytes(z.read(name))
+                if swap:
+                    arr.byteswap()
+                return arr
+
+            snapshot.meta = meta
+            snapshot._p21 = read_array('q', 'nodes/p21_id')
+            snapshot._node_type = read_array('b', 'nodes/node_type')
+            snapshot._entity_type = read_array('H', 'nodes/entity_type')
+            snapshot._node_types = meta['node_types']
+            snapshot._entity_types = meta['entity_types']
+            snapshot._rel_types = meta['rel_types']
+            snapshot._layout = read_array('H', 'nodes/layout')
+            snapshot._layouts = [intern_names(names) for names in meta['layouts']]
+
+            for i, names in enumerate(snapshot._layouts):
+                columns = json.loads(z.read('properties/{}.json'.format(i)))
+                # ordered p21 ids of compact aggregations are lists already and get stored as list properties
+                snapshot._columns.append([column if name.endswith(ORDERED_LIST_SUFFIX) else
+                                          [to_tuples(v) for v in column] for name, column in zip(names, columns)])
+
+            snapshot._edge_from = read_array('q', 'edges/from')
+            snapshot._edge_to = read_array('q', 'edges/to')
+            snapshot._edge_rel = read_array('H', 'edges/rel_type')
+            snapshot._edge_item = read_array('q', 'edges/list_item')
+
+        return snapshot
+
+    def is_valid_for(self, model_path: str, source_hash: str = None, selection: dict = None) -> bool:
+        """
+        checks if the snapshot has been created from the given file
+        @param model_path: path to the IFC model
+        @param source_hash: precalculated content hash of the model
+        @param selection: entity filter settings the snapshot needs to be created with
+        @return: boolean
+        """
+        if source_hash is None:
+            source_hash = file_hash(model_path)
+        if selection is not None and self.meta.get('selection') != selection:
+            return False
+        return self.meta['source_hash'] == source_hash
+
+    def node_count(self) -> int:
+        return len(self._p21)
+
+    def edge_count(self) -> int:
+        return len(self._edge_from)
+
+    def entity_types_by_p21(self, node_type: str) -> dict:
+        """
+        @param node_type: PrimaryNode, SecondaryNode or ConnectionNode
+        @return: dict p21 id -> entity type of all nodes with the given node type
+        """
+        if node_type not in self._node_types:
+            return {}
+        code = self._node_types.index(node_type)
+        return {self._p21[pos]: self._entity_types[self._entity_type[pos]]
+                for pos in range(len(self._p21)) if self._node_type[pos] == code}
+
+    def iter_node_rows(self):
+        """
+        replays the node rows in their original order
+        @return: generator of NodeRecord
+        """
+        # current row per layout
+        rows = [0] * len(self._layouts)
+
+        for pos in range(len(self._p21)):
+            layout = self._layout[pos]
+            row = rows[layout]
+            rows[layout] += 1
+            values = tuple(column[row] for column in self._columns[layout])
+
+            yield NodeRecord(self._p21[pos],
+                             self._node_types[self._node_type[pos]],
+                             self._entity_types[self._entity_type[pos]],
+                             self._layouts[layout],
+                             values)
+
+    def iter_edge_rows(self):
+        """
+        replays the edge rows in their original order
+        @return: generator of EdgeRecord
+        """
+        for i in range(len(self._edge_from)):
+            yield EdgeRecord(self._edge_from[i],
+                             self._edge_to[i],
+                             self._rel_types[self._edge_rel[i]],
+                             None if self._edge_item[i] < 0 else self._edge_item[i])
+
+    def __encode(self, value: str, table: list) -> int:
+        key = (id(table), value)
+        code = self._codes.get(key)
+        if code is None:
+            code = len(table)
+            table.append(value)
+            self._codes[key] = code
+        return code
@@ -0,0 +1,178 @@
+from Neo4jQueryFactory import Neo4jQueryFactory
+
+
+def chunks(items: list, size: int):
+    """
+    splits a list into consecutive chunks of the given size
+    @param items: list to be split
+    @param size: max number of items per chunk
+    @return: generator of lists
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def get_child_nodes(connector, label: str, node_ids: list, batch_size: int = 500) -> dict:
+    """
+    queries the child nodes of many parent nodes with one round trip per batch
+    @param connector: Neo4jConnector instance
+    @param label: model identifier
+    @param node_ids: node ids of the parent nodes
+    @param batch_size: number of parent nodes per round trip
+    @return: dict parent node id -> list of (child node id, child node, edge properties)
+    """
+    cy = Neo4jQueryFactory.get_child_nodes_batch(label)
+    children = {node_id: [] for node_id in node_ids}
+
+    for batch in chunks(list(node_ids), batch_size):
+        for record in connector.run_cypher_statement(cy, parameters={'node_ids': batch}):
+            children[record['parent_id']].append((record['child_id'], record['c'], record[3]))
+
+    return children
+
+
+def walk_breadth_first(connector, label: str, start_node_ids: list, batch_size: int = 500, max_depth: int = None):
+    """
+    walks a model breadth-first along its rel edges, starting from the given nodes.
+    Each level is expanded in batches of batch_size nodes, i.e., one round trip per batch instead of one per node.
+    Every node is visited once.
+    @param connector: Neo4jConnector instance
+    @param label: model identifier
+    @param start_node_ids: node ids the walk starts from
+    @param batch_size: number of nodes expanded per round trip
+    @param max_depth: stop after this number of levels. Set to None to walk the entire reachable graph
+    @return: generator of (depth, parent node id, child node id, child node, edge properties)
+    """
+    visited = set(start_node_ids)
+    frontier = list(visited)
+    depth = 0
+
+    while frontier and (max_depth is None or depth < max_depth):
+        depth += 1
+        next_frontier = []
+
+        for parent_id, children in get_child_nodes(connector, label, frontier, batch_size).items():
+            for child_id, child, rel_props in children:
+                yield depth, parent_id, child_id, child, rel_props
+
+                if child_id not in visited:
+                    visited.add(child_id)
+                    next_frontier.append(child_id)
+
+        frontier = next_frontier
+
+
+def get_ordered_members(connector, label: str, node_id: int, rel_type: str) -> list:
+    """
+    queries the members of an aggregated association of a node in their order, regardless of whether the
+    aggregation has been encoded compactly (see IFCGraphGenerator(compact_list_threshold)) or by listItem.
+    Compact aggregations are ordered by a lookup in their list property instead of sorting the edges
+    @param connector: Neo4jConnector instance
+    @param label: model identifier
+    @param node_id: node id of the source node
+    @param rel_type: name of the aggregated association, e.g. Polygon
+    @return: list of (p21 id, node id) of the members
+    """
+    records = connector.run_cypher_statement(Neo4jQueryFactory.get_aggregation_members(label, rel_type),
+                                             parameters={'node_id': node_id})
+    if len(records) == 0:
+        return []
+    order, members = records[0]['order'], [m for m in records[0]['members'] if m[0] is not None]
+
+    if order is not None:
+        node_ids = {p21_id: member_id for p21_id, _, member_id in members}
+        return [(p21_id, node_ids.get(p21_id)) for p21_id in order]
+
+    # unordered (SET) aggregations without listItem keep the order of the edges
+    if any(list_item is None for _, list_item, _ in members):
+        return [(p21_id, member_id) for p21_id, _, member_id in members]
+    return [(p21_id, member_id) for p21_id, _, member_id in sorted(members, key=lambda m: m[1])]
+
+
+class Subgraph:
+    """
+    Distinct nodes and edges reachable from a set of start nodes, see fetch_subgraph().
+    """
+
+    def __init__(self):
+        # node id -> node, None if the nodes haven't been fetched
+        self.nodes = {}
+        # node id -> level the node has been reached first, 0 for the start nodes
+        self.depth = {}
+        # edge id -> (source node id, target node id, edge type, edge properties)
+        self.edges = {}
+
+    def __repr__(self):
+        return 'Subgraph({} nodes, {} edges, depth {})'.format(
+            len(self.depth), len(self.edges), max(self.depth.values(), default=0))
+
+
+def fetch_subgraph(connector, label: str, start_node_ids: list, max_depth: int, rel_types: list = None,
+                   labels: list = None, edge_types=('rel',), direction: str = 'out', batch_size: int = 500,
+                   fetch_nodes: bool = True, server_side: bool = False) -> Subgraph:
+    """
+    queries the distinct nodes and edges reachable from the given nodes within max_depth levels.
+    Unlike path queries (e.g. Neo4jQueryFactory.get_pattern_by_node_id), shared nodes like the owner history or
+    geometric representation contexts are expanded and returned once, so the response grows with the size of the
+    subgraph rather than with the number of paths.
+    The subgraph is expanded level by level with one round trip per batch of frontier nodes. Only ids travel during
+    the expansion, the nodes are fetched once at the end. Alternatively, the expansion runs on the server in a
+    single query (requires APOC, without rel_type filter), which returns all relationships among the reached nodes.
+    @param connector: Neo4jConnector instance
+    @param label: model identifier
+    @param start_node_ids: node ids the expansion starts from
+    @param max_depth: max number of levels
+    @param rel_types: optional list of rel_types (i.e., association names) to follow
+    @param labels: optional list of node labels (e.g. PrimaryNode or entity types like IfcWall) to expand to
+    @param edge_types: relationship types to follow, e.g. rel and shortcut
+    @param direction: out, in or both
+    @param batch_size: number of frontier nodes expanded per round trip
+    @param fetch_nodes: fetch the node properties, otherwise only the ids are returned
+    @param server_side: expand on the server using apoc.path.subgraphAll
+    @return: Subgraph
+    """
+    subgraph = Subgraph()
+
+    if server_side:
+        if rel_types is not None:
+            raise Exception('rel_types can only be filtered by the client-side expansion.')
+        cy = Neo4jQueryFactory.get_subgraph_apoc(label, max_depth, edge_types, direction, labels)
+        for record in connector.run_cypher_statement(cy, parameters={'node_ids': list(start_node_ids)}):
+            for node_id, node in zip(record['node_ids'], record['nodes']):
+                subgraph.nodes[node_id] = node if fetch_nodes else None
+            for edge_id, source, target, edge_type, props in record['edges']:
+                subgraph.edges[edge_id] = (source, target, edge_type, props)
+        # the server doesn't report levels
+        subgraph.depth = {node_id: None for node_id in subgraph.nodes}
+        for node_id in start_node_ids:
+            subgraph.depth[node_id] = 0
+        return subgraph
+
+    cy = Neo4jQueryFactory.get_subgraph_frontier(label, edge_types, direction)
+    frontier = list(dict.fromkeys(start_node_ids))
+    for node_id in frontier:
+        subgraph.depth[node_id] = 0
+
+    depth = 0
+    while frontier and depth < max_depth:
+        depth += 1
+        next_frontier = []
+        for batch in chunks(frontier, batch_size):
+            parameters = {'node_ids': batch, 'rel_types': rel_types, 'labels': labels}
+            for record in connector.run_cypher_statement(cy, parameters=parameters):
+                subgraph.edges[record['edge_id']] = (record['source'], record['target'],
+                                                     record['edge_type'], record['props'])
+                neighbor = record['neighbor']
+                if neighbor not in subgraph.depth:
+                    subgraph.depth[neighbor] = depth
+                    next_frontier.append(neighbor)
+        frontier = next_frontier
+
+    if fetch_nodes:
+        cy = Neo4jQueryFactory.get_nodes_by_ids()
+        for batch in chunks(list(subgraph.depth), batch_size):
+            for record in connector.run_cypher_statement(cy, parameters={'node_ids': batch}):
+                subgraph.nodes[record['node_id']] = record['n']
+    else:
+        subgraph.nodes = dict.fromkeys(subgraph.depth)
+    return subgraph
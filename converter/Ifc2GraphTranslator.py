@@ -1,7 +1,21 @@
 
+import hashlib
+import json
+import os
+from collections import Counter
+
 import jsonpickle
-import Neo4jGraphFactory
-import Neo4jQueryFactory
+from Neo4jGraphFactory import Neo4jGraphFactory
+from Neo4jQueryFactory import Neo4jQueryFactory
+from CompactGraph import CompactGraph
+from GraphSnapshot import GraphSnapshot, file_hash
+from ShortcutEdges import SHORTCUTS, SHORTCUT_EDGE_TYPE, derive_shortcuts
+from SpatialHierarchy import SpatialHierarchy, SCOPE_DECOMPOSITION
+from GraphRecords import NodeRecord, EdgeRecord, intern_names, ORDERED_LIST_SUFFIX
+from ParquetGraphWriter import ParquetGraphWriter
+from GraphSinks import GraphSink, CypherFileSink, Neo4jSink
+from ModelRegistry import ModelRegistry
+from ConversionMetrics import ConversionMetrics
 import ifcopenshell
 import progressbar
 
@@ -18,97 +32,237 @@ class IFCGraphGenerator:
     trigger console output while parsing using the ToConsole boolean
     """
 
-    def __init__(self, connector, model_path, write_to_file=False):
+    def __init__(self, connector, model_path, write_to_file=False, snapshot_path=None,
+                 include_classes=None, exclude_classes=None, keep_reference_closure=False, spatial_scope=None,
+                 router=None, project=None, compact_list_threshold=None):
         """
 
         @param connector: can be null if write_to_file is set to True
         @param model_path:
         @param write_to_file: if False, all commands are directly executed on the connected neo4j db.
                                 if set to True, cypher is written to console or *.cypher file
+        @param snapshot_path: optional path of a GraphSnapshot. If the snapshot matches the content of the model,
+                                nodes and edges are replayed from the snapshot without parsing the model.
+                                Otherwise, the model is parsed and the snapshot is (re)written.
+        @param include_classes: optional list of IFC classes to be translated. Subclasses are included as well
+        @param exclude_classes: optional list of IFC classes to be skipped (including their subclasses),
+                                e.g. ['IfcRepresentationItem']
+        @param keep_reference_closure: if True, skipped entities referenced by translated entities are translated
+                                anyway, so that no edge dangles. If False, edges to skipped entities are dropped.
+        @param spatial_scope: optional list of GlobalIds of spatial structure elements (e.g. a storey).
+                                Only the elements decomposed from or contained in the scope are translated,
+                                together with their relationships and referenced resources, see select_spatial_scope()
+        @param router: optional DatabaseRouter. The graph is then written to the database the model is routed to,
+                                which gets created on demand
+        @param project: project of the model, used by the project routing policy
+        @param compact_list_threshold: optional min number of members of an aggregated association to encode it
+                                compactly: the edges don't carry a listItem, and the ordered target p21 ids of
+                                LIST and ARRAY aggregations are stored once as list property on the source node
+                                (e.g. Polygon_p21_ids), see Neo4jQueryFactory.get_aggregation_members()
         """
 
-        # try to open the ifc model and load the content into the model variable
-        try:
-            self.model_path = model_path
-            self.model = ifcopenshell.open(model_path)
-            ifc_version = self.model.schema
-            self.schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(
-                ifc_version)
-        except:
-            print('file path: {}'.format(model_path))
-            raise Exception('Unable to open IFC model on given file path')
-
-        # define the label (i.e., the model timestamp)
-        my_label = 'ts' + self.model.wrapped_data.header.file_name.time_stamp
-        my_label = my_label.replace('-', '')
-        my_label = my_label.replace(':', '')
-        self.timestamp = my_label
+        self.model_path = model_path
+        self.snapshot_path = snapshot_path
+        self.snapshot = None
+        self.source_hash = None
+
+        # entity filters, see select_entities()
+        self.include_classes = list(include_classes) if include_classes else []
+        self.exclude_classes = list(exclude_classes) if exclude_classes else []
+        self.keep_reference_closure = keep_reference_closure
+        self.spatial_scope = list(spatial_scope) if spatial_scope else []
+        self.compact_list_threshold = compact_list_threshold
+        self._selection = None
+        self.skipped_entities = Counter()
+
+        if snapshot_path is not None:
+            self.source_hash = file_hash(model_path)
+            if os.path.exists(snapshot_path):
+                snapshot = GraphSnapshot.load(snapshot_path)
+                if snapshot.is_valid_for(model_path, self.source_hash, self.selection_settings()):
+                    self.snapshot = snapshot
+                else:
+                    print('Snapshot {} is outdated and gets rewritten.'.format(snapshot_path))
+
+        if self.snapshot is not None:
+            # everything required is stored in the snapshot
+            self.model = None
+            self.schema = None
+            self.schema_name = self.snapshot.meta['schema']
+            self.timestamp = self.snapshot.meta['timestamp']
+            self.header_timestamp = self.snapshot.meta.get('header_timestamp')
+            self.skipped_entities = Counter(self.snapshot.meta.get('skipped_entities', {}))
+        else:
+            # try to open the ifc model and load the content into the model variable
+            try:
+                self.model = ifcopenshell.open(model_path)
+                ifc_version = self.model.schema
+                self.schema_name = ifc_version
+                self.schema = ifcopenshell.ifcopenshell_wrapper.schema_by_name(
+                    ifc_version)
+            except:
+                print('file path: {}'.format(model_path))
+                raise Exception('Unable to open IFC model on given file path')
+
+            # define the label (i.e., the model timestamp)
+            self.header_timestamp = self.model.header.file_name.time_stamp
+            my_label = 'ts' + self.header_timestamp
+            my_label = my_label.replace('-', '')
+            my_label = my_label.replace(':', '')
+            self.timestamp = my_label
+
         self.cypher_statements = []
+        # receives the nodes and edges, see generateGraph()
+        self.sink = None
 
         # set the connector
         self.connector = connector
+        self.router = router
+        self.project = project
 
         self.write_to_file = write_to_file
 
+        # attribute separation per IFC class, see separate_attributes()
+        self._attribute_cache = {}
+        # shared node attribute names per IFC class, see extract_node_record()
+        self._node_names = {}
+        # ordered aggregated associations per IFC class, see ordered_aggregations()
+        self._ordered_aggregations = {}
+
+        if snapshot_path is not None and self.snapshot is None:
+            # extract the rows once, later passes replay them from the snapshot
+            self.snapshot = self.save_snapshot(snapshot_path)
+
         super().__init__()
 
-    def generateGraph(self, validate_result=False):
+    def generateGraph(self, validate_result=False, derive_shortcuts=False, spatial_index=False, batch_size=5000,
+                      writer_threads=1, sink: GraphSink = None, merge=False, unique_constraint=False,
+                      metrics: ConversionMetrics = None):
         """
-        parses the IFC model into the graph database
+        parses the IFC model into the graph database.
+        Imports into the database are checkpointed per batch. If an import of the same file with the same settings
+        has been interrupted, a rerun resumes from the last committed batch instead of starting over.
+        @param validate_result: compare the number of generated nodes with the number of entities afterwards
+        @param derive_shortcuts: additionally materialize direct edges for objectified relationships,
+                                see iter_shortcut_rows()
+        @param spatial_index: attach the spatial hierarchy encodings to the primary nodes,
+                                see build_spatial_hierarchy()
+        @param batch_size: initial number of rows per transaction when writing to the database
+        @param writer_threads: number of threads writing the edges concurrently,
+                                see Neo4jBatchLoader.load_edges_parallel()
+        @param sink: optional GraphSink receiving the nodes and edges, e.g. a NullSink or RecordingSink.
+                                Defaults to a CypherFileSink if write_to_file is set, otherwise to a Neo4jSink
+        @param merge: keep an existing graph of the model and MERGE into it (incremental or repair runs).
+                                By default, the graph is replaced and nodes and edges are CREATEd
+        @param unique_constraint: let the database additionally enforce unique p21 ids within the model
+        @param metrics: optional ConversionMetrics. Its endpoint is served while the graph gets generated,
+                                unless it has been started already, e.g. for a batch run
         @return: the label, by which you can identify the model in the database
         """
 
-        if not self.write_to_file:
-            # check if model has been already processed
-            n = self.connector.run_cypher_statement(
-                'MATCH(n:{}) RETURN COUNT(n)'.format(self.timestamp))[0][0]
+        serve_metrics = metrics is not None and not metrics.running
+        if serve_metrics:
+            metrics.start()
+        try:
+            self.__generate_graph(derive_shortcuts, spatial_index, batch_size, writer_threads, sink, merge,
+                                  unique_constraint, metrics)
+        finally:
+            if serve_metrics:
+                metrics.stop()
 
-            if int(n) > 0:
-                print('WARNING: entire graph labeled with >> {} << gets overwritten by staged file {}.'.format(
-                    self.timestamp, self.model_path))
+        if len(self.skipped_entities) > 0:
+            self.print_skipped_entities()
 
-                self.connector.run_cypher_statement(
-                    'MATCH(n:{}) DETACH DELETE n'.format(self.timestamp))
+        if validate_result:
+            self.validate_parsing_result()
+
+        return self.cypher_statements
+
+    def __generate_graph(self, derive_shortcuts, spatial_index, batch_size, writer_threads, sink, merge,
+                         unique_constraint, metrics):
+        """
+        writes the node and edge records into the sink, see generateGraph()
+        """
+        if self.router is not None and not self.write_to_file:
+            # all further statements of this model run against its own database
+            self.connector = self.router.connector_for(self.timestamp, self.project)
+        if sink is None:
+            sink = self.default_sink(self.import_key(derive_shortcuts, spatial_index), batch_size, writer_threads,
+                                     merge, unique_constraint, metrics)
+        self.sink = sink
+        sink.begin(self.timestamp)
 
         print('[IFC_P21 > {} < ]: Generating graph... '.format(self.timestamp))
 
+        hierarchy = None
+        if spatial_index:
+            hierarchy = self.build_spatial_hierarchy()
+            for cy in Neo4jQueryFactory.create_spatial_hierarchy_indexes():
+                sink.write_statement(cy)
+
         # extract model data
 
-        entity_list = []
+        increment = 100 / (self.entity_count() * 2)
+        progress = {'percent': 0, 'last_p21': None}
 
-        for element in self.model:
-            entity_list.append(element)
+        def node_rows():
+            for node in self.iter_node_rows():
 
-        increment = 100 / (len(entity_list) * 2)
-        percent = 0
+                # print progressbar
+                progress['percent'] += increment
+                progressbar.print_bar(progress['percent'])
+                if metrics is not None:
+                    metrics.entity_processed()
 
-        for entity in entity_list:
+                if hierarchy is not None and node.node_type == "PrimaryNode":
+                    encoding = hierarchy.get_encoding(node.p21_id)
+                    if encoding is not None:
+                        node.add_properties(encoding)
 
-            # print progressbar
-            percent += increment
-            progressbar.print_bar(percent)
+                yield node
 
-            # check if the primary_node_type is either an ObjectDef or Relationship or neither
-            if entity.is_a('IfcObjectDefinition'):
-                self.__map_entity(entity, "PrimaryNode")
-            elif entity.is_a('IfcRelationship'):
-                self.__map_entity(entity, "ConnectionNode")
-            else:
-                self.__map_entity(entity, "SecondaryNode")
+        def edge_rows():
+            for edge in self.iter_edge_rows():
+                # print progressbar once per source node
+                if edge.source != progress['last_p21']:
+                    progress['last_p21'] = edge.source
+                    progress['percent'] += increment
+                    progressbar.print_bar(progress['percent'])
 
-        for entity in entity_list:
-            # print progressbar
-            percent += increment
-            progressbar.print_bar(percent)
+                yield edge
 
-            self.build_node_rels(entity)
+        sink.write_nodes(node_rows())
+        sink.write_edges(edge_rows())
+        if derive_shortcuts:
+            sink.write_edges(self.iter_shortcut_rows(), edge_type=SHORTCUT_EDGE_TYPE, phase='shortcuts')
+        sink.close()
 
         print('[IFC_P21 > {} < ]: Generating graph - DONE. \n '.format(self.timestamp))
 
-        if validate_result:
-            self.validate_parsing_result()
-
-        return self.cypher_statements
+    def default_sink(self, import_key: str = None, batch_size: int = 5000, writer_threads: int = 1,
+                     merge: bool = False, unique_constraint: bool = False,
+                     metrics: ConversionMetrics = None) -> GraphSink:
+        """
+        @return: a CypherFileSink if write_to_file is set, otherwise a Neo4jSink writing to the connector
+        """
+        if self.write_to_file:
+            return CypherFileSink(statements=self.cypher_statements)
+        if import_key is None:
+            import_key = self.import_key(False, False)
+        return Neo4jSink(self.connector, import_key, batch_size=batch_size, writer_threads=writer_threads,
+                         merge=merge, unique_constraint=unique_constraint, model_info=self.model_info(),
+                         metrics=metrics)
+
+    def model_info(self) -> dict:
+        """
+        @return: source path, content hash, schema and header timestamp of the model, see ModelRegistry
+        """
+        if self.source_hash is None:
+            self.source_hash = file_hash(self.model_path)
+        return {'source_path': self.model_path,
+                'file_hash': self.source_hash,
+                'schema': self.schema_name,
+                'header_timestamp': self.header_timestamp}
 
     def generate_arrows_visualization(self, ignore_null_values: bool = False):
         """
@@ -123,11 +277,20 @@ class IFCGraphGenerator:
         x_pos = 0
         y_pos = 0
 
-        rel_counter = 0
-        for entity in self.model:
+        node_border_colors = {"PrimaryNode": "#0062b1",
+                              "SecondaryNode": "#fcc400",
+                              "ConnectionNode": "#68bc00"}
+
+        # secondary nodes are skipped, only edges starting at visualized nodes are drawn
+        visualized_nodes = set()
+
+        for node in self.iter_node_rows():
 
-            # get node data
-            attr_dict, entity_type = self.extract_node_data(entity=entity)
+            node_type = node.node_type
+            if node_type == "SecondaryNode":
+                continue
+
+            attr_dict = node.properties()
 
             # escape lists into strings
             for key, val in attr_dict.items():
@@ -139,22 +302,9 @@ class IFCGraphGenerator:
                             if v is not None}
                 attr_dict = new_dict
 
-            # check if the primary_node_type is either an ObjectDef or Relationship or neither
-            if entity.is_a('IfcObjectDefinition'):
-                node_type = "PrimaryNode"
-            elif entity.is_a('IfcRelationship'):
-                node_type = "ConnectionNode"
-            else:
-                node_type = "SecondaryNode"
-                # skip secondary nodes
-                continue
-
             node_identifier = attr_dict['p21_id']
             attr_dict.pop("p21_id")
-
-            node_border_colors = {"PrimaryNode": "#0062b1",
-                                  "SecondaryNode": "#fcc400",
-                                  "ConnectionNode": "#68bc00"}
+            visualized_nodes.add(node_identifier)
 
             # build arrows expression
             arrows_node = {
@@ -176,79 +326,368 @@ class IFCGraphGenerator:
 
             x_pos += 100
 
-            _, single_associations, aggregated_associations = self.separate_attributes(
-                entity)
-
-            for assoc in single_associations:
-                # association may be set to None, then continue
+        rel_counter = 0
+        for edge in self.iter_edge_rows():
 
-                target = entity.get_info()[assoc]
-                if target is None:
-                    continue
+            if edge.source not in visualized_nodes:
+                continue
 
-                # build arrows expression
-                rel = {
-                    "id": "n" + str(rel_counter),
-                    "type": "REL",
-                    "style": {},
-                    "type": assoc,
-                    "fromId": "n" + str(node_identifier),
-                    "toId": "n" + str(target.get_info()["id"])
+            # build arrows expression
+            rel = {
+                "id": "n" + str(rel_counter),
+                "type": edge.rel_type,
+                "style": {},
+                "fromId": "n" + str(edge.source),
+                "toId": "n" + str(edge.target)
+            }
+            if edge.list_item is not None:
+                rel["properties"] = {
+                    "listItem": str(edge.list_item)
                 }
 
-                arrows["relationships"].append(rel)
+            arrows["relationships"].append(rel)
+            rel_counter += 1
 
-                rel_counter += 1
+        # save
+        model_path = self.model_path
+        save_path = model_path[:-4] + "_arrowsVis.json"
+        f = open(save_path, 'w')
+        f.write(jsonpickle.dumps(arrows, unpicklable=True))
+        f.close()
 
-            list_item = 0
-            for agg_assoc in aggregated_associations:
+    def build_compact_graph(self, include_properties: bool = True) -> CompactGraph:
+        """
+        translates the IFC model into a compact in-memory graph instead of a neo4j database.
+        The resulting CompactGraph provides local implementations of the path and hierarchy queries.
+        @param include_properties: if False, only the graph structure and entity types are kept
+        @return: finalized CompactGraph
+        """
+        print('[IFC_P21 > {} < ]: Generating compact graph... '.format(self.timestamp))
 
-                targets = entity.get_info()[agg_assoc]
-                if targets is None:
-                    print("Havent found target: TargetName: {}".format(agg_assoc))
-                    continue
+        graph = CompactGraph()
+        for node in self.iter_node_rows():
+            graph.add_node(node.p21_id,
+                           node.node_type,
+                           node.entity_type,
+                           node.properties() if include_properties else None)
+
+        for edge in self.iter_edge_rows():
+            graph.add_edge(edge.source, edge.target, edge.rel_type, edge.list_item)
+
+        graph.finalize()
+        print('[IFC_P21 > {} < ]: Generating compact graph - DONE. \n '.format(self.timestamp))
+        return graph
+
+    def save_snapshot(self, snapshot_path: str) -> GraphSnapshot:
+        """
+        persists the extracted node and edge rows, so later runs on the unchanged model can skip the parsing
+        @param snapshot_path: file path of the snapshot
+        @return: the written GraphSnapshot
+        """
+        if self.source_hash is None:
+            self.source_hash = file_hash(self.model_path)
+
+        snapshot = GraphSnapshot(source_hash=self.source_hash,
+                                 source_path=self.model_path,
+                                 schema=self.schema_name,
+                                 timestamp=self.timestamp)
+        for node in self.iter_node_rows():
+            snapshot.add_node(node)
+        for edge in self.iter_edge_rows():
+            snapshot.add_edge(edge)
+
+        snapshot.meta['selection'] = self.selection_settings()
+        snapshot.meta['header_timestamp'] = self.header_timestamp
+        snapshot.meta['skipped_entities'] = dict(self.skipped_entities)
+
+        snapshot.save(snapshot_path)
+        return snapshot
+
+    def export_parquet(self, directory: str, derive_shortcuts: bool = False, row_group_size: int = 10000):
+        """
+        writes the nodes (one table per entity type) and edges of the model into parquet files,
+        see ParquetGraphWriter. Requires pyarrow.
+        @param directory: output directory
+        @param derive_shortcuts: additionally write the shortcut edges, see iter_shortcut_rows()
+        @param row_group_size: number of rows per row group
+        @return: the ParquetGraphWriter holding the number of written nodes and edges
+        """
+        print('[IFC_P21 > {} < ]: Exporting graph to {}... '.format(self.timestamp, directory))
+
+        writer = ParquetGraphWriter(directory, row_group_size=row_group_size)
+        for node in self.iter_node_rows():
+            writer.add_node(node)
+        for edge in self.iter_edge_rows():
+            writer.add_edge(edge)
+        if derive_shortcuts:
+            for edge in self.iter_shortcut_rows():
+                writer.add_edge(edge, edge_type=SHORTCUT_EDGE_TYPE)
+        writer.close()
+
+        print('[IFC_P21 > {} < ]: Exporting graph - DONE. {} nodes, {} edges written.'.format(
+            self.timestamp, writer.nodes_written, writer.edges_written))
+        return writer
+
+    def entity_count(self) -> int:
+        """
+        @return: number of entities in the model, i.e., the number of nodes to be generated
+        """
+        if self.snapshot is not None:
+            return self.snapshot.node_count()
+
+        selection = self.select_entities()
+        if selection is None:
+            return len(list(self.model))
+        return len(selection)
+
+    def import_key(self, derive_shortcuts: bool, spatial_index: bool) -> str:
+        """
+        identifies an import of this model into the database by the file content and the translation settings
+        @return: hex digest
+        """
+        if self.source_hash is None:
+            self.source_hash = file_hash(self.model_path)
+        settings = dict(self.selection_settings(), derive_shortcuts=derive_shortcuts, spatial_index=spatial_index)
+        return hashlib.sha256((self.source_hash + json.dumps(settings, sort_keys=True)).encode()).hexdigest()
+
+    def selection_settings(self) -> dict:
+        """
+        @return: the entity filter and encoding settings, stored along with snapshots
+        """
+        return {'include_classes': sorted(self.include_classes),
+                'exclude_classes': sorted(self.exclude_classes),
+                'keep_reference_closure': self.keep_reference_closure,
+                'spatial_scope': sorted(self.spatial_scope),
+                'compact_list_threshold': self.compact_list_threshold}
 
-                for target in targets:
-                    if target is None:
+    def select_entities(self):
+        """
+        applies the spatial scope and the include/exclude filters to the model.
+        Runs once, before any node data gets extracted. Skipped entities are counted per class in skipped_entities.
+        @return: set of p21 ids to be translated or None if all entities are translated
+        """
+        if self._selection is not None:
+            return self._selection
+        if len(self.include_classes) == 0 and len(self.exclude_classes) == 0 and len(self.spatial_scope) == 0:
+            return None
+
+        scope = self.select_spatial_scope() if len(self.spatial_scope) > 0 else None
+
+        selection = set()
+        skipped = Counter()
+        for entity in self.model:
+            if (scope is None or entity.id() in scope) and self.__is_included(entity):
+                selection.add(entity.id())
+            else:
+                skipped[entity.is_a()] += 1
+
+        if self.keep_reference_closure:
+            # add everything that is (transitively) referenced by a selected entity
+            stack = list(selection)
+            while stack:
+                entity = self.model.by_id(stack.pop())
+                for referenced in self.model.traverse(entity, max_levels=1)[1:]:
+                    p21_id = referenced.id()
+                    if p21_id == 0 or p21_id in selection:
                         continue
+                    selection.add(p21_id)
+                    skipped[referenced.is_a()] -= 1
+                    stack.append(p21_id)
+            skipped = +skipped
 
-                    # build arrows expression
-                    rel = {
-                        "id": "n" + str(rel_counter),
-                        "type": "REL",
-                        "style": {},
-                        "type": agg_assoc,
-                        "properties": {
-                            "listItem": str(list_item)
-                        },
-                        "fromId": "n" + str(node_identifier),
-                        "toId": "n" + str(target.get_info()["id"])
-                    }
+        self._selection = selection
+        self.skipped_entities = skipped
+        return selection
 
-                    arrows["relationships"].append(rel)
-                    list_item += 1
+    def select_spatial_scope(self) -> set:
+        """
+        selects the entities within the spatial scope in linear time:
+        the spatial structure elements given by their GlobalIds and everything (transitively) decomposed from or
+        contained in them (see SCOPE_DECOMPOSITION), all relationships referencing one of these objects and all
+        entities referenced by the selection, apart from objects outside the scope.
+        @return: set of p21 ids
+        """
+        # decomposition tree, built from one pass over the decomposing relationships
+        parts = {}
+        for rel_class, (whole_attr, part_attr) in SCOPE_DECOMPOSITION.items():
+            try:
+                rels = self.model.by_type(rel_class)
+            except RuntimeError:
+                # relationship class not defined in the schema of the model
+                continue
+            for rel in rels:
+                whole = getattr(rel, whole_attr)
+                related = getattr(rel, part_attr)
+                if whole is None or related is None:
+                    continue
+                if isinstance(related, ifcopenshell.entity_instance):
+                    related = [related]
+                parts.setdefault(whole.id(), []).extend(part.id() for part in related)
 
-                rel_counter += 1
+        # objects within the scope
+        stack = []
+        for global_id in self.spatial_scope:
+            try:
+                root = self.model.by_guid(global_id)
+            except RuntimeError:
+                root = None
+            if root is None or not (root.is_a('IfcSpatialStructureElement') or root.is_a('IfcSpatialElement')):
+                raise Exception('Spatial scope {} is not a spatial structure element of {}'.format(
+                    global_id, self.model_path))
+            stack.append(root.id())
+
+        scope = set()
+        while stack:
+            p21_id = stack.pop()
+            if p21_id in scope:
+                continue
+            scope.add(p21_id)
+            stack.extend(parts.get(p21_id, ()))
+
+        # relationships of the objects, e.g. property sets, types and materials
+        selection = set(scope)
+        stack = list(scope)
+        for rel in self.model.by_type('IfcRelationship'):
+            if any(referenced.id() in scope for referenced in self.model.traverse(rel, max_levels=1)[1:]):
+                selection.add(rel.id())
+                stack.append(rel.id())
+
+        # referenced resources, objects outside the scope are not pulled in
+        while stack:
+            entity = self.model.by_id(stack.pop())
+            for referenced in self.model.traverse(entity, max_levels=1)[1:]:
+                p21_id = referenced.id()
+                if p21_id == 0 or p21_id in selection or referenced.is_a('IfcObject'):
+                    continue
+                selection.add(p21_id)
+                stack.append(p21_id)
 
-        # save
-        model_path = self.model_path
-        save_path = model_path[:-4] + "_arrowsVis.json"
-        f = open(save_path, 'w')
-        f.write(jsonpickle.dumps(arrows, unpicklable=True))
-        f.close()
+        return selection
+
+    def print_skipped_entities(self):
+        """
+        prints the number of entities skipped by the entity filters per class
+        """
+        print('[IFC_P21 > {} < ]: Skipped {} entities:'.format(self.timestamp, sum(self.skipped_entities.values())))
+        for cls_name, count in self.skipped_entities.most_common():
+            print('\t{}: {}'.format(cls_name, count))
+
+    def __is_included(self, entity) -> bool:
+        if len(self.include_classes) > 0 and not any(entity.is_a(c) for c in self.include_classes):
+            return False
+        return not any(entity.is_a(c) for c in self.exclude_classes)
+
+    def __iter_entities(self):
+        """
+        iterates the entities of the model that pass the entity filters
+        """
+        selection = self.select_entities()
+        for entity in self.model:
+            if selection is None or entity.id() in selection:
+                yield entity
+
+    def iter_node_rows(self):
+        """
+        provides the node rows of the model, either extracted from the model or replayed from the snapshot
+        @return: generator of NodeRecord
+        """
+        if self.snapshot is not None:
+            yield from self.snapshot.iter_node_rows()
+            return
+
+        for entity in self.__iter_entities():
+            yield self.extract_node_record(entity)
+
+    def iter_edge_rows(self):
+        """
+        provides the edge rows of the model, either extracted from the model or replayed from the snapshot
+        @return: generator of EdgeRecord
+        """
+        if self.snapshot is not None:
+            yield from self.snapshot.iter_edge_rows()
+            return
+
+        selection = self.select_entities()
+        for entity in self.__iter_entities():
+            for edge in self.extract_edge_data(entity):
+                # edges to skipped entities would dangle
+                if selection is None or edge.target in selection:
+                    yield edge
+
+    def iter_shortcut_rows(self, shortcut_types=None):
+        """
+        derives direct edges from the objectified relationships listed in ShortcutEdges.SHORTCUTS,
+        e.g. element -[HAS_PROPERTY_SET]-> property set instead of element <- IfcRelDefinesByProperties -> property set
+        @param shortcut_types: optional list of shortcut rel_types to be derived, e.g. ['CONTAINED_IN']
+        @return: generator of EdgeRecord
+        """
+        relationship_classes = [cls_name for cls_name, spec in SHORTCUTS.items()
+                                if shortcut_types is None or spec[2] in shortcut_types]
+
+        if self.snapshot is not None:
+            rel_types = {p21_id: entity_type
+                         for p21_id, entity_type in self.snapshot.entity_types_by_p21('ConnectionNode').items()
+                         if entity_type in relationship_classes}
+            current, edges = None, []
+            for edge in self.iter_edge_rows():
+                if edge.source not in rel_types:
+                    continue
+                # edges are grouped by their origin
+                if edge.source != current:
+                    if current is not None:
+                        yield from derive_shortcuts(current, rel_types[current], edges)
+                    current, edges = edge.source, []
+                edges.append(edge)
+            if current is not None:
+                yield from derive_shortcuts(current, rel_types[current], edges)
+            return
+
+        selection = self.select_entities()
+        for rel_type in relationship_classes:
+            try:
+                relationships = self.model.by_type(rel_type)
+            except RuntimeError:
+                # relationship class doesn't exist in the schema of the model
+                continue
+            for entity in relationships:
+                if selection is not None and entity.id() not in selection:
+                    continue
+                edges = [edge for edge in self.extract_edge_data(entity)
+                         if selection is None or edge.target in selection]
+                yield from derive_shortcuts(entity.id(), entity.is_a(), edges)
+
+    def build_spatial_hierarchy(self) -> SpatialHierarchy:
+        """
+        computes the spatial decomposition tree of the model from its aggregation and containment relationships
+        @return: encoded SpatialHierarchy
+        """
+        hierarchy = SpatialHierarchy()
+        for edge in self.iter_shortcut_rows(shortcut_types=['AGGREGATES', 'CONTAINED_IN']):
+            if edge.rel_type == 'AGGREGATES':
+                hierarchy.add_decomposition(edge.source, edge.target)
+            else:
+                # contained element -> spatial structure
+                hierarchy.add_decomposition(edge.target, edge.source)
+        return hierarchy.encode()
 
     def validate_parsing_result(self):
         """
-        Compares the number of entities in the model with the number of nodes in the graph
+        Compares the number of entities in the model with the number of nodes in the graph.
+        The node count is read from the registry node of the model, models without registry node are counted
+        by their label
         @return: boolean
         """
 
         # get number of nodes in the graph
-        cy = Neo4jQueryFactory.count_nodes(self.timestamp)
-        count_graph = self.connector.run_cypher_statement(cy, 'count')[0]
+        registry = ModelRegistry(self.connector).get(self.timestamp)
+        if registry is not None and registry.get('node_count') is not None:
+            count_graph = registry['node_count']
+        else:
+            cy = Neo4jQueryFactory.count_nodes(self.timestamp)
+            count_graph = self.connector.run_cypher_statement(cy, 'count')[0]
 
         # get number of entities in the model
-        count_model = len(list(self.model))
+        count_model = self.entity_count()
 
         # compare and calculate diff
         if count_graph == count_model:
@@ -261,131 +700,116 @@ class IFCGraphGenerator:
                   '\nDifference: {}'.format(abs(count_graph - count_model)))
             return False
 
-    def __map_entity(self, entity, label) -> str:
+    def build_node_rels(self, entity):
         """
-        translates an IFC instance into a neo4j node
+        translates the associations of an IFC instance into neo4j edges
         """
+        if self.sink is not None:
+            self.sink.write_edges(self.extract_edge_data(entity))
+            return
+
+        # no graph generation in progress, merge the edges one by one
+        for edge in self.extract_edge_data(entity):
+            cy = Neo4jGraphFactory.merge_on_p21(
+                edge.source, edge.target, edge.properties(), self.timestamp, without_match=self.write_to_file)
+            if self.write_to_file:
+                print(cy)
+            else:
+                self.connector.run_cypher_statement(cy)
+            self.cypher_statements.append(cy)
 
-        node_properties_dict, entity_type = self.extract_node_data(entity)
-
-        # run cypher command
-        cypher_statement = Neo4jGraphFactory.merge_node_with_attr(label=label,
-                                                                  attrs=node_properties_dict,
-                                                                  timestamp=self.timestamp,
-                                                                  entity_type=entity_type,
-                                                                  node_identifier=node_properties_dict['p21_id'],
-                                                                  skip_return=True)
-        if self.write_to_file:
-            print(cypher_statement)
+    @staticmethod
+    def get_node_type(entity) -> str:
+        """
+        checks if the entity is either an ObjectDef or Relationship or neither
+        @param entity: IFC entity instance
+        @return: PrimaryNode, ConnectionNode or SecondaryNode
+        """
+        if entity.is_a('IfcObjectDefinition'):
+            return "PrimaryNode"
+        elif entity.is_a('IfcRelationship'):
+            return "ConnectionNode"
         else:
-            self.connector.run_cypher_statement(cypher_statement)
-        self.cypher_statements.append(cypher_statement)
-
-        return cypher_statement
+            return "SecondaryNode"
 
-    def build_node_rels(self, entity):
-        # get info
+    def extract_edge_data(self, entity):
+        """
+        extracts the outgoing associations of a given IFC entity instance without touching the database
+        @param entity: IFC entity instance
+        @return: generator of EdgeRecord
+        """
         info = entity.get_info()
         p21_id = info['id']
 
-        # get attribute definitions
-        _, single_associations, aggregated_associations = self.separate_attributes(
-            entity)
+        _, single_associations, aggregated_associations = self.separate_attributes(entity)
 
         for association_name in single_associations:
-
-            # get associated entity
             associated_entity = info[association_name]
-
             if associated_entity is None:
                 continue
-
-            # traverse to the associated entity and query p21 id
-            p21_id_child = associated_entity.get_info()['id']
-
-            if not isinstance(p21_id_child, int):
-                raise Exception("help")
-
-            edge_attrs = {'rel_type': association_name}
-
-            # merge with existing
-            if self.write_to_file:
-                cy = Neo4jGraphFactory.merge_on_p21(
-                    p21_id, p21_id_child, edge_attrs, self.timestamp, without_match=True)
-                print(cy)
-            else:
-                cy = Neo4jGraphFactory.merge_on_p21(
-                    p21_id, p21_id_child, edge_attrs, self.timestamp, without_match=False)
-                self.connector.run_cypher_statement(cy)
-            self.cypher_statements.append(cy)
+            yield EdgeRecord(p21_id, associated_entity.id(), association_name)
 
         for association_name in aggregated_associations:
             entities = info[association_name]
-
             if entities is None:
-                # detected an array of associations but nothing was referenced within the given instance model
                 continue
-            self.build_aggregated_associations(association_name=association_name, parent_p21=p21_id,
-                                               child_entities=entities)
-
-    def build_aggregated_associations(self, association_name: str, parent_p21: int, child_entities):
-
-        select_problem = False
-
-        i = 0
-        for associated_entity in child_entities:
-
-            try:
-                p21_id_child = associated_entity.get_info()['id']
-
-                edge_attrs = {
-                    'rel_type': association_name,
-                    'listItem': i
-                }
-
-            except:
-                if type(child_entities) is tuple:
-                    print("Found issue when building relationships")
-                    print("Child entity is: ", child_entities)
-                elif type(child_entities) is str:
-                    print("Found issues when building relationship")
-                    print("Child entity is: ", child_entities)
-
-                if child_entities.is_a() == "IfcPropertySet":
-                    select_problem = True
-                # in some weird cases, ifcopenshell fails to traverse objectified relationships
-                child_guid = child_entities.GlobalId
-
-                cy = 'MATCH (n{{GlobalId: \"{}\"}}) RETURN n.p21_id'.format(
-                    child_guid)
-
-                if self.write_to_file:
-                    print(cy)
-                else:
-                    raw = self.connector.run_cypher_statement(cy)[0]
-                    p21_id_child = int(raw[0])
-
-                edge_attrs = {
-                    'rel_type': association_name
-                }
 
-            # merge with existing
+            if isinstance(entities, ifcopenshell.entity_instance):
+                # selects mixing entities and aggregations (e.g. IfcPropertySetDefinitionSelect)
+                # may hold a single entity
+                yield EdgeRecord(p21_id, entities.id(), association_name)
+                continue
 
-            if self.write_to_file:
-                cy = Neo4jGraphFactory.merge_on_p21(
-                    parent_p21, p21_id_child, edge_attrs, self.timestamp, without_match=True)
-                print(cy)
-            else:
-                cy = Neo4jGraphFactory.merge_on_p21(
-                    parent_p21, p21_id_child, edge_attrs, self.timestamp, without_match=False)
-                self.connector.run_cypher_statement(cy)
-            self.cypher_statements.append(cy)
+            # large aggregations are ordered by the list property of the node, if at all
+            compact = self.compact_list_threshold is not None and len(entities) >= self.compact_list_threshold
 
-            # increase counter
-            i += 1
+            for i, associated_entity in enumerate(entities):
+                # skip empty slots and inline values of mixed selects, which don't have a p21 id
+                if not isinstance(associated_entity, ifcopenshell.entity_instance) or associated_entity.id() == 0:
+                    continue
+                yield EdgeRecord(p21_id, associated_entity.id(), association_name, list_item=None if compact else i)
 
-            if select_problem:
-                break
+    def ordered_aggregations(self, entity) -> list:
+        """
+        @param entity: IFC entity instance
+        @return: names of the aggregated associations of the entity's class that are ordered (LIST or ARRAY)
+        """
+        cls_name = entity.is_a()
+        ordered = self._ordered_aggregations.get(cls_name)
+        if ordered is None:
+            _, _, aggregated_associations = self.separate_attributes(entity)
+            wrapper = ifcopenshell.ifcopenshell_wrapper
+            ordered = []
+            for attr in self.schema.declaration_by_name(cls_name).all_attributes():
+                if attr.name() not in aggregated_associations:
+                    continue
+                attr_type = attr.type_of_attribute()
+                while isinstance(attr_type, (wrapper.named_type, wrapper.type_declaration)):
+                    attr_type = attr_type.declared_type()
+                if isinstance(attr_type, wrapper.aggregation_type) \
+                        and attr_type.type_of_aggregation_string() in ('list', 'array'):
+                    ordered.append(attr.name())
+            self._ordered_aggregations[cls_name] = ordered
+        return ordered
+
+    def compact_lists(self, entity, info: dict) -> dict:
+        """
+        collects the ordered target p21 ids of the LIST and ARRAY aggregations of an entity
+        with at least compact_list_threshold members
+        @param entity: IFC entity instance
+        @param info: attributes of the entity
+        @return: dict property name -> list of p21 ids
+        """
+        lists = {}
+        for association_name in self.ordered_aggregations(entity):
+            entities = info[association_name]
+            if not isinstance(entities, tuple) or len(entities) < self.compact_list_threshold:
+                continue
+            # same members as the edges, see extract_edge_data()
+            members = [e.id() for e in entities if isinstance(e, ifcopenshell.entity_instance) and e.id() != 0]
+            if len(members) > 0:
+                lists[association_name + ORDERED_LIST_SUFFIX] = members
+        return lists
 
     def separate_attributes(self, entity) -> tuple:
         """"
@@ -398,6 +822,10 @@ class IFCGraphGenerator:
         clsName = info['type']
         entity_id = info['id']
 
+        # the separation only depends on the class definition
+        if clsName in self._attribute_cache:
+            return self._attribute_cache[clsName]
+
         # remove entity_id and type
         # info.pop('id')
         # info.pop('type')
@@ -565,6 +993,7 @@ class IFCGraphGenerator:
                                 'Please check your graph translator.'.format(entity_id, clsName, attr.name()))
         node_attributes.append('id')
         node_attributes.append('type')
+        self._attribute_cache[clsName] = (node_attributes, single_associations, aggregated_associations)
         return node_attributes, single_associations, aggregated_associations
 
     def extract_node_data(self, entity):
@@ -573,31 +1002,41 @@ class IFCGraphGenerator:
         @param entity:
         @return:
         """
+        node = self.extract_node_record(entity)
+        return node.properties(), node.entity_type
+
+    def extract_node_record(self, entity) -> NodeRecord:
+        """
+        extracts the node of a given IFC entity instance as compact record
+        @param entity: IFC entity instance
+        @return: NodeRecord
+        """
 
         # get some basic data
         info = entity.get_info()
 
-        # node_properties, single_associations, aggregated_associations = self.separate_attributes(primary_node_type)
         node_properties, _, _ = self.separate_attributes(entity)
-
-        # create a dictionary of properties
-        node_properties_dict = {}
-        for p_name in node_properties:
+        names = self._node_names.get(info['type'])
+        if names is None:
+            # id and type are stored as p21_id and EntityType
+            names = intern_names(p_name for p_name in node_properties if p_name not in ('id', 'type'))
+            self._node_names[info['type']] = names
+
+        values = []
+        for p_name in names:
             p_val = info[p_name]
 
-            if p_name == 'NominalValue':
+            if p_name == 'NominalValue' and p_val is not None:
+                # stored with its measure type, e.g. IfcLengthMeasure(0.3), see IFCP21Serializer.format_value
                 wrapped_val = p_val.wrappedValue
-                p_val = 'IfcLabel({})'.format(
-                    str(wrapped_val).replace("'", ""))
-                p_val = str(p_val)
-                # ToDo: consider this workaround when translating a graph back in its SPF representation
-
-            node_properties_dict[p_name] = p_val
-
-        # rename some keys
-        node_properties_dict['p21_id'] = node_properties_dict.pop('id')
-        node_properties_dict['EntityType'] = node_properties_dict.pop('type')
+                p_val = '{}({})'.format(p_val.is_a(),
+                                        str(wrapped_val).replace("'", ""))
 
-        entity_type = node_properties_dict['EntityType']
+            values.append(p_val)
 
-        return node_properties_dict, entity_type
+        node = NodeRecord(info['id'], self.get_node_type(entity), info['type'], names, tuple(values))
+        if self.compact_list_threshold is not None:
+            lists = self.compact_lists(entity, info)
+            if len(lists) > 0:
+                node.add_properties(lists)
+        return node
@@ -0,0 +1,691 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+from array import array
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
+
+from Ifc2GraphTranslator import IFCGraphGenerator
+from Neo4jBatchLoader import Neo4jBatchLoader, cypher_value
+from Neo4jQueryFactory import Neo4jQueryFactory
+from GraphTraversal import chunks
+from GraphSnapshot import is_plain
+from ModelRegistry import ModelRegistry
+
+# p21 ids within attribute values, e.g. in Trim1 of IfcTrimmedCurve: (#25=IfcCartesianPoint((1.,0.)), ...)
+P21_REFERENCE = re.compile(r'#(\d+)(=?)')
+
+
+def key_hash(*parts) -> int:
+    """
+    @return: signed 64 bit hash of the given parts, stable across processes and runs
+    """
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+def stored_values(values: tuple) -> tuple:
+    """
+    @return: the attribute values of a node as they are stored, i.e., values json can't encode (e.g. aggregations of
+             entity instances) by their string representation, the same way for extracted and replayed rows
+    """
+    return tuple(v if is_plain(v) else str(v) for v in values)
+
+
+def has_references(stored: tuple) -> bool:
+    """
+    @param stored: attribute values, see stored_values()
+    @return: True if a value contains p21 ids
+    """
+    return any(isinstance(v, str) and P21_REFERENCE.search(v) is not None for v in stored)
+
+
+def attribute_hash(stored: tuple, reference_key=None) -> int:
+    """
+    hashes the attribute values of a node for the modification check
+    @param stored: attribute values, see stored_values()
+    @param reference_key: maps the p21 ids within the values to the keys of the referenced entities,
+                          so that the hash only changes if a referenced entity does. Unknown entities map to None
+    @return: signed 64 bit hash
+    """
+    if reference_key is not None:
+        def replace(match):
+            key = reference_key(int(match.group(1)))
+            return '#{}{}'.format('?' if key is None else key, match.group(2))
+
+        stored = tuple(P21_REFERENCE.sub(replace, v) if isinstance(v, str) else v for v in stored)
+    return key_hash(stored)
+
+
+def attribute_identity(values: tuple) -> int:
+    """
+    hashes the attribute values of a node without the p21 ids they contain,
+    so that the structural fingerprint doesn't depend on the numbering of the file
+    @return: signed 64 bit hash
+    """
+    return key_hash(tuple(P21_REFERENCE.sub('#', str(v)) if isinstance(v, str) or not is_plain(v) else v
+                          for v in values))
+
+
+def sort_columns(keys: array, *columns) -> tuple:
+    """
+    sorts the key array and all columns by the keys
+    @return: tuple of sorted arrays, keys first
+    """
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return tuple(array(column.typecode, (column[i] for i in order)) for column in (keys,) + columns)
+
+
+class FingerprintRows:
+    """
+    Node and edge columns of a chunk of a model: every chunks-th entity, starting at the entity at position chunk.
+    The chunks are extracted in parallel and merged into a ModelFingerprint, see ModelFingerprint.of_rows()
+    """
+
+    def __init__(self, timestamp: str, schema: str):
+        self.timestamp = timestamp
+        self.schema = schema
+
+        # nodes in extraction order
+        self.p21s = array('q')
+        self.entity_types = []
+        # attribute hashes, see attribute_hash(). 0 for nodes whose values contain p21 ids
+        self.attrs = array('q')
+        # attribute hashes as stored for nodes whose values contain p21 ids, otherwise 0
+        self.texts = array('q')
+        # position within the chunk -> stored values containing p21 ids, hashed once all keys are known
+        self.references = {}
+        self.identities = array('q')
+        # keys of the nodes with GlobalId, otherwise 0
+        self.base = array('q')
+        self.has_guid = bytearray()
+
+        # edges in extraction order
+        self.edge_source = array('q')
+        self.edge_target = array('q')
+        self.edge_rel = array('H')
+        self.edge_item = array('q')
+        self.rel_types = []
+
+        self._rel_codes = {}
+        self._guid_index = {}
+
+    def add_node(self, node):
+        """
+        @param node: NodeRecord
+        """
+        stored = stored_values(node.values)
+        if has_references(stored):
+            self.references[len(self.p21s)] = stored
+            self.attrs.append(0)
+            self.texts.append(attribute_hash(stored))
+        else:
+            self.attrs.append(attribute_hash(stored))
+            self.texts.append(0)
+        self.p21s.append(node.p21_id)
+        self.entity_types.append(node.entity_type)
+        self.identities.append(attribute_identity(node.values))
+
+        # the attribute names are shared per class, so the position of GlobalId is looked up once
+        i = self._guid_index.get(node.names)
+        if i is None:
+            i = node.names.index('GlobalId') if 'GlobalId' in node.names else -1
+            self._guid_index[node.names] = i
+        global_id = node.values[i] if i >= 0 else None
+        if global_id:
+            self.base.append(key_hash('guid', global_id, node.entity_type))
+            self.has_guid.append(1)
+        else:
+            self.base.append(0)
+            self.has_guid.append(0)
+
+    def add_edge(self, edge):
+        """
+        @param edge: EdgeRecord
+        """
+        code = self._rel_codes.get(edge.rel_type)
+        if code is None:
+            code = len(self.rel_types)
+            self.rel_types.append(edge.rel_type)
+            self._rel_codes[edge.rel_type] = code
+        self.edge_source.append(edge.source)
+        self.edge_target.append(edge.target)
+        self.edge_rel.append(code)
+        self.edge_item.append(-1 if edge.list_item is None else edge.list_item)
+
+    def __getstate__(self):
+        # the lookup tables aren't needed once the chunk is complete
+        state = dict(self.__dict__)
+        state['_rel_codes'] = {}
+        state['_guid_index'] = {}
+        return state
+
+
+def extract_rows(args: tuple) -> FingerprintRows:
+    """
+    extracts the rows of a chunk of a model. Entry point of the worker processes
+    @param args: model path, snapshot path or None, chunk, number of chunks. A snapshot is replayed as a single chunk
+    @return: FingerprintRows
+    """
+    model_path, snapshot_path, chunk, chunks = args
+    generator = IFCGraphGenerator(None, model_path, write_to_file=True, snapshot_path=snapshot_path)
+    rows = FingerprintRows(generator.timestamp, generator.schema_name)
+    if chunks == 1:
+        for node in generator.iter_node_rows():
+            rows.add_node(node)
+        for edge in generator.iter_edge_rows():
+            rows.add_edge(edge)
+        return rows
+
+    # every worker parses the model, but only translates the entities of its chunk
+    for i, entity in enumerate(generator.model):
+        if i % chunks != chunk:
+            continue
+        rows.add_node(generator.extract_node_record(entity))
+        for edge in generator.extract_edge_data(entity):
+            rows.add_edge(edge)
+    return rows
+
+
+class ModelFingerprint:
+    """
+    Identity keys of all nodes and edges of a model, sorted by key.
+    Entities with a GlobalId are identified by GlobalId and entity type. Entities without GlobalId (i.e., resources)
+    are identified by a structural fingerprint, which hashes their entity type, attribute values and the
+    identities of the entities they reference (bottom-up, like a merkle tree). Identical resources are told apart
+    by their occurrence. Edges are identified by the keys of their end nodes, rel_type and listItem.
+    """
+
+    def __init__(self, model_path: str, timestamp: str, schema: str):
+        self.model_path = model_path
+        self.timestamp = timestamp
+        self.schema = schema
+
+        # nodes, sorted by node_key
+        self.node_key = array('q')
+        self.node_p21 = array('q')
+        self.node_attr = array('q')
+        # hash of the attribute values as stored, for nodes whose values contain p21 ids, otherwise 0
+        self.node_text = array('q')
+
+        # edges, sorted by edge_key
+        self.edge_key = array('q')
+        self.edge_source = array('q')
+        self.edge_target = array('q')
+        self.edge_rel = array('H')
+        self.edge_item = array('q')
+        self.rel_types = []
+
+    @classmethod
+    def of_model(cls, model_path: str, snapshot_path: str = None):
+        """
+        extracts the fingerprint of a model without database in the current process
+        @param model_path: path to the IFC model
+        @param snapshot_path: optional GraphSnapshot of the model, see IFCGraphGenerator
+        @return: ModelFingerprint
+        """
+        return cls.of_rows(model_path, [extract_rows((model_path, snapshot_path, 0, 1))])
+
+    @classmethod
+    def of_rows(cls, model_path: str, chunks: list):
+        """
+        merges the rows extracted in chunks and computes the keys of all nodes and edges
+        @param model_path: path to the IFC model
+        @param chunks: FingerprintRows of chunk 0, 1, ..., see extract_rows()
+        @return: ModelFingerprint
+        """
+        fingerprint = cls(model_path, chunks[0].timestamp, chunks[0].schema)
+
+        # nodes in extraction order, the entity at position pos has been extracted by chunk pos % len(chunks)
+        p21s = array('q')
+        attrs = array('q')
+        texts = array('q')
+        identities = array('q')
+        entity_types = []
+        base = array('q')
+        has_guid = bytearray()
+        position = {}
+        references = {}
+        n = sum(len(rows.p21s) for rows in chunks)
+        for pos in range(n):
+            rows = chunks[pos % len(chunks)]
+            i = pos // len(chunks)
+            position[rows.p21s[i]] = pos
+            p21s.append(rows.p21s[i])
+            entity_types.append(rows.entity_types[i])
+            attrs.append(rows.attrs[i])
+            texts.append(rows.texts[i])
+            identities.append(rows.identities[i])
+            base.append(rows.base[i])
+            has_guid.append(rows.has_guid[i])
+            stored = rows.references.get(i)
+            if stored is not None:
+                references[pos] = stored
+
+        # edges in extraction order per source, dangling edges are ignored
+        sources = array('q')
+        targets = array('q')
+        rels = array('H')
+        items = array('q')
+        rel_codes = {}
+        for rows in chunks:
+            codes = []
+            for rel_type in rows.rel_types:
+                code = rel_codes.get(rel_type)
+                if code is None:
+                    code = len(fingerprint.rel_types)
+                    fingerprint.rel_types.append(rel_type)
+                    rel_codes[rel_type] = code
+                codes.append(code)
+            for k in range(len(rows.edge_source)):
+                s = position.get(rows.edge_source[k])
+                t = position.get(rows.edge_target[k])
+                if s is None or t is None:
+                    continue
+                sources.append(s)
+                targets.append(t)
+                rels.append(codes[rows.edge_rel[k]])
+                items.append(rows.edge_item[k])
+
+        # outgoing edges per node position as CSR
+        offsets = array('q', bytes((n + 1) * 8))
+        for s in sources:
+            offsets[s + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        cursor = array('q', offsets[:-1])
+        out_edges = array('q', bytes(len(sources) * 8))
+        for k in range(len(sources)):
+            out_edges[cursor[sources[k]]] = k
+            cursor[sources[k]] += 1
+        del cursor
+
+        # structural fingerprints of the entities without GlobalId, children first
+        NEW, ACTIVE, DONE = 0, 1, 2
+        state = bytearray(DONE if g else NEW for g in has_guid)
+        for root in range(n):
+            if state[root] != NEW:
+                continue
+            state[root] = ACTIVE
+            stack = [[root, offsets[root]]]
+            while stack:
+                frame = stack[-1]
+                pos = frame[0]
+                if frame[1] < offsets[pos + 1]:
+                    t = targets[out_edges[frame[1]]]
+                    frame[1] += 1
+                    if state[t] == NEW:
+                        state[t] = ACTIVE
+                        stack.append([t, offsets[t]])
+                    continue
+                parts = []
+                for j in range(offsets[pos], offsets[pos + 1]):
+                    k = out_edges[j]
+                    t = targets[k]
+                    # references closing a cycle only contribute their entity type
+                    identity = base[t] if state[t] == DONE else entity_types[t]
+                    parts.append((fingerprint.rel_types[rels[k]], items[k], identity))
+                base[pos] = key_hash(entity_types[pos], identities[pos], parts)
+                state[pos] = DONE
+                stack.pop()
+        del state, offsets, out_edges, identities
+
+        # identical entities are told apart by their occurrence
+        keys = array('q')
+        occurrences = {}
+        for pos in range(n):
+            count = occurrences.get(base[pos], 0)
+            occurrences[base[pos]] = count + 1
+            keys.append(base[pos] if count == 0 else key_hash(base[pos], count))
+        del occurrences
+
+        # p21 ids within attribute values are replaced by the keys of the referenced entities,
+        # so that renumbering the file doesn't modify the referencing entity
+        def reference_key(p21_id):
+            pos = position.get(p21_id)
+            return None if pos is None else keys[pos]
+
+        for pos, stored in references.items():
+            attrs[pos] = attribute_hash(stored, reference_key)
+        del position, references
+
+        # edges point to the structural identity of their target, so that identical resources are interchangeable
+        edge_keys = array('q', (key_hash(keys[sources[k]], fingerprint.rel_types[rels[k]], items[k], base[targets[k]])
+                                for k in range(len(sources))))
+        edge_sources = array('q', (p21s[s] for s in sources))
+        edge_targets = array('q', (p21s[t] for t in targets))
+
+        fingerprint.node_key, fingerprint.node_p21, fingerprint.node_attr, fingerprint.node_text = \
+            sort_columns(keys, p21s, attrs, texts)
+        (fingerprint.edge_key, fingerprint.edge_source, fingerprint.edge_target,
+         fingerprint.edge_rel, fingerprint.edge_item) = sort_columns(edge_keys, edge_sources, edge_targets,
+                                                                     rels, items)
+        return fingerprint
+
+    def node_count(self) -> int:
+        return len(self.node_key)
+
+    def edge_count(self) -> int:
+        return len(self.edge_key)
+
+    def key_range(self, nodes: tuple, edges: tuple):
+        """
+        @param nodes: (start, stop) index range of the nodes
+        @param edges: (start, stop) index range of the edges
+        @return: ModelFingerprint holding the given ranges of the sorted nodes and edges
+        """
+        part = ModelFingerprint(self.model_path, self.timestamp, self.schema)
+        part.node_key = self.node_key[nodes[0]:nodes[1]]
+        part.node_p21 = self.node_p21[nodes[0]:nodes[1]]
+        part.node_attr = self.node_attr[nodes[0]:nodes[1]]
+        part.node_text = self.node_text[nodes[0]:nodes[1]]
+        part.edge_key = self.edge_key[edges[0]:edges[1]]
+        part.edge_source = self.edge_source[edges[0]:edges[1]]
+        part.edge_target = self.edge_target[edges[0]:edges[1]]
+        part.edge_rel = self.edge_rel[edges[0]:edges[1]]
+        part.edge_item = self.edge_item[edges[0]:edges[1]]
+        part.rel_types = self.rel_types
+        return part
+
+    def edge(self, i: int) -> tuple:
+        """
+        @return: edge i as (p21 id origin, rel_type, listItem or None, p21 id destination)
+        """
+        item = self.edge_item[i]
+        return self.edge_source[i], self.rel_types[self.edge_rel[i]], None if item < 0 else item, self.edge_target[i]
+
+
+def merge_rows(args: tuple) -> ModelFingerprint:
+    # entry point of the worker processes
+    model_path, chunks = args
+    return ModelFingerprint.of_rows(model_path, chunks)
+
+
+def compare_key_range(args: tuple):
+    # entry point of the worker processes
+    old, new = args
+    return ChangeSet.of_fingerprints(old, new)
+
+
+def key_boundaries(old_keys: array, new_keys: array, parts: int) -> list:
+    """
+    splits the key space of two sorted key arrays into parts of about the same number of keys
+    @return: parts - 1 ascending keys
+    """
+    keys = old_keys if len(old_keys) >= len(new_keys) else new_keys
+    if len(keys) == 0:
+        return [0] * (parts - 1)
+    return [keys[len(keys) * p // parts] for p in range(1, parts)]
+
+
+def key_cuts(keys: array, boundaries: list) -> list:
+    """
+    @return: index ranges of the parts of a sorted key array, see key_boundaries()
+    """
+    cuts = [0] + [bisect_left(keys, boundary) for boundary in boundaries] + [len(keys)]
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def diff_models(old_path: str, new_path: str, old_snapshot: str = None, new_snapshot: str = None,
+                processes: int = None):
+    """
+    compares two revisions of a model without database, in three steps:
+    - the extraction of the rows, which dominates the run time, is split into chunks of entities. Every model is
+      extracted by all worker processes: each of them parses the model, but only translates every processes-th entity.
+      Models with snapshot are replayed by a single worker, as writing the snapshot can't be split
+    - the chunks of a model are merged, which computes the structural fingerprints bottom-up and sorts the keys.
+      The two models are merged at the same time, one of them in the current process
+    - the sorted keys are split into key ranges, which are compared by all worker processes
+    @param old_path: path to the IFC model of the initial revision
+    @param new_path: path to the IFC model of the updated revision
+    @param old_snapshot: optional GraphSnapshot path of the initial revision, speeds up repeated diffs
+    @param new_snapshot: optional GraphSnapshot path of the updated revision
+    @param processes: number of worker processes, defaults to the number of cores.
+                      Set to 1 to run all steps one after the other in the current process
+    @return: ChangeSet
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+
+    def jobs(model_path, snapshot_path):
+        chunks = 1 if snapshot_path is not None or processes == 1 else processes
+        return [(model_path, snapshot_path, chunk, chunks) for chunk in range(chunks)]
+
+    old_jobs = jobs(old_path, old_snapshot)
+    new_jobs = jobs(new_path, new_snapshot)
+    if processes == 1:
+        old = ModelFingerprint.of_rows(old_path, [extract_rows(job) for job in old_jobs])
+        new = ModelFingerprint.of_rows(new_path, [extract_rows(job) for job in new_jobs])
+        return ChangeSet.of_fingerprints(old, new)
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        chunks = list(executor.map(extract_rows, old_jobs + new_jobs))
+        merged = executor.submit(merge_rows, (new_path, chunks[len(old_jobs):]))
+        old = ModelFingerprint.of_rows(old_path, chunks[:len(old_jobs)])
+        del chunks
+        new = merged.result()
+        return ChangeSet.of_fingerprints(old, new, executor=executor, parts=processes)
+
+
+class ChangeSet:
+    """
+    Added, removed and modified nodes and edges between two revisions of a model, nodes are given by their p21 ids.
+    Matched nodes keep their identity across the revisions, even if their p21 id has changed.
+    """
+
+    def __init__(self, old_path: str = None, new_path: str = None):
+        self.old_path = old_path
+        self.new_path = new_path
+
+        # matched nodes as pairs of p21 ids (old, new)
+        self.matched_old = array('q')
+        self.matched_new = array('q')
+        # matched nodes with different attribute values as (old, new)
+        self.modified_nodes = []
+        # matched nodes whose attribute values only differ in the p21 ids they contain, e.g. Trim1 of a renumbered
+        # IfcTrimmedCurve, as (old, new). Their properties are rewritten, but they don't count as modified
+        self.renumbered_nodes = []
+        # p21 ids of the initial revision
+        self.removed_nodes = array('q')
+        # p21 ids of the updated revision
+        self.added_nodes = array('q')
+        # edges as (p21 id origin, rel_type, listItem, p21 id destination)
+        self.removed_edges = []
+        self.added_edges = []
+
+    @classmethod
+    def of_fingerprints(cls, old: ModelFingerprint, new: ModelFingerprint, executor=None, parts: int = 1):
+        """
+        compares the fingerprints of two revisions by merging their sorted keys
+        @param executor: optional executor comparing the key ranges in parallel
+        @param parts: number of key ranges compared by the executor
+        @return: ChangeSet
+        """
+        if executor is not None and parts > 1:
+            node_boundaries = key_boundaries(old.node_key, new.node_key, parts)
+            edge_boundaries = key_boundaries(old.edge_key, new.edge_key, parts)
+            ranges = [(old.key_range(old_nodes, old_edges), new.key_range(new_nodes, new_edges))
+                      for old_nodes, old_edges, new_nodes, new_edges in zip(
+                          key_cuts(old.node_key, node_boundaries), key_cuts(old.edge_key, edge_boundaries),
+                          key_cuts(new.node_key, node_boundaries), key_cuts(new.edge_key, edge_boundaries))]
+            change_set = cls(old.model_path, new.model_path)
+            # the ranges are in key order, so the concatenated changes are the same as of a single merge
+            for part in executor.map(compare_key_range, ranges):
+                change_set.extend(part)
+            return change_set
+
+        change_set = cls(old.model_path, new.model_path)
+
+        i, j = 0, 0
+        while i < old.node_count() or j < new.node_count():
+            if j == new.node_count() or (i < old.node_count() and old.node_key[i] < new.node_key[j]):
+                change_set.removed_nodes.append(old.node_p21[i])
+                i += 1
+            elif i == old.node_count() or new.node_key[j] < old.node_key[i]:
+                change_set.added_nodes.append(new.node_p21[j])
+                j += 1
+            else:
+                change_set.matched_old.append(old.node_p21[i])
+                change_set.matched_new.append(new.node_p21[j])
+                if old.node_attr[i] != new.node_attr[j]:
+                    change_set.modified_nodes.append((old.node_p21[i], new.node_p21[j]))
+                elif old.node_text[i] != new.node_text[j]:
+                    change_set.renumbered_nodes.append((old.node_p21[i], new.node_p21[j]))
+                i += 1
+                j += 1
+
+        i, j = 0, 0
+        while i < old.edge_count() or j < new.edge_count():
+            if j == new.edge_count() or (i < old.edge_count() and old.edge_key[i] < new.edge_key[j]):
+                change_set.removed_edges.append(old.edge(i))
+                i += 1
+            elif i == old.edge_count() or new.edge_key[j] < old.edge_key[i]:
+                change_set.added_edges.append(new.edge(j))
+                j += 1
+            else:
+                i += 1
+                j += 1
+
+        return change_set
+
+    def extend(self, other):
+        """
+        appends the changes of another ChangeSet, e.g. of the next key range
+        @param other: ChangeSet
+        """
+        self.matched_old.extend(other.matched_old)
+        self.matched_new.extend(other.matched_new)
+        self.modified_nodes.extend(other.modified_nodes)
+        self.renumbered_nodes.extend(other.renumbered_nodes)
+        self.removed_nodes.extend(other.removed_nodes)
+        self.added_nodes.extend(other.added_nodes)
+        self.removed_edges.extend(other.removed_edges)
+        self.added_edges.extend(other.added_edges)
+
+    def summary(self) -> dict:
+        return {'matched_nodes': len(self.matched_old),
+                'modified_nodes': len(self.modified_nodes),
+                'removed_nodes': len(self.removed_nodes),
+                'added_nodes': len(self.added_nodes),
+                'removed_edges': len(self.removed_edges),
+                'added_edges': len(self.added_edges)}
+
+    def print_summary(self):
+        print('Changes from {} to {}:'.format(self.old_path, self.new_path))
+        for name, count in self.summary().items():
+            print('  {:<16}{:>10}'.format(name, count))
+
+    # -- persistence --
+
+    def save(self, path: str):
+        """
+        writes the change set as gzipped json
+        @param path: file path
+        """
+        content = {'old_path': self.old_path,
+                   'new_path': self.new_path,
+                   'matched_old': self.matched_old.tolist(),
+                   'matched_new': self.matched_new.tolist(),
+                   'modified_nodes': self.modified_nodes,
+                   'renumbered_nodes': self.renumbered_nodes,
+                   'removed_nodes': self.removed_nodes.tolist(),
+                   'added_nodes': self.added_nodes.tolist(),
+                   'removed_edges': self.removed_edges,
+                   'added_edges': self.added_edges}
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            json.dump(content, f)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        reads a change set written by save()
+        @param path: file path
+        @return: ChangeSet
+        """
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            content = json.load(f)
+        change_set = cls(content['old_path'], content['new_path'])
+        change_set.matched_old = array('q', content['matched_old'])
+        change_set.matched_new = array('q', content['matched_new'])
+        change_set.modified_nodes = [tuple(pair) for pair in content['modified_nodes']]
+        change_set.renumbered_nodes = [tuple(pair) for pair in content.get('renumbered_nodes', [])]
+        change_set.removed_nodes = array('q', content['removed_nodes'])
+        change_set.added_nodes = array('q', content['added_nodes'])
+        change_set.removed_edges = [tuple(edge) for edge in content['removed_edges']]
+        change_set.added_edges = [tuple(edge) for edge in content['added_edges']]
+        return change_set
+
+    # -- loading --
+
+    def apply(self, connector, label: str, new_generator: IFCGraphGenerator = None, batch_size: int = 5000):
+        """
+        patches the graph of the initial revision in the database into the graph of the updated revision:
+        removed edges and nodes are deleted, matched nodes get the p21 ids of the updated revision, modified and
+        renumbered nodes get their new properties, added nodes and edges are loaded with a Neo4jBatchLoader.
+        Shortcut edges and spatial hierarchy encodings are not updated. The patch can't be resumed if interrupted.
+        @param connector: Neo4jConnector instance
+        @param label: model label of the initial revision in the database
+        @param new_generator: IFCGraphGenerator of the updated revision, providing the added records
+        @param batch_size: number of rows per transaction
+        """
+        if new_generator is None:
+            new_generator = IFCGraphGenerator(connector, self.new_path)
+
+        print('[DIFF > {} < ]: Applying change set {}'.format(label, self.summary()))
+
+        # edges and nodes of the initial revision are addressed by their old p21 ids
+        rows = [{'s': s, 'rel_type': rel_type, 'listItem': item, 't': t} for s, rel_type, item, t in self.removed_edges]
+        for batch in chunks(rows, batch_size):
+            connector.run_cypher_statement(Neo4jQueryFactory.delete_edges_by_p21_batch(label),
+                                           parameters={'rows': batch})
+        for batch in chunks(self.removed_nodes.tolist(), batch_size):
+            connector.run_cypher_statement(Neo4jQueryFactory.delete_nodes_by_p21_batch(label),
+                                           parameters={'p21_ids': batch})
+
+        # renumber the remaining nodes
+        rows = [{'old': old, 'new': new} for old, new in zip(self.matched_old, self.matched_new) if old != new]
+        for batch in chunks(rows, batch_size):
+            connector.run_cypher_statement(Neo4jQueryFactory.set_p21_ids_batch(label), parameters={'rows': batch})
+        while len(rows) > 0:
+            updated = connector.run_cypher_statement(Neo4jQueryFactory.commit_p21_ids(label),
+                                                     parameters={'limit': batch_size})[0][0]
+            if updated == 0:
+                break
+
+        # from here on, the graph uses the p21 ids of the updated revision
+        loader = Neo4jBatchLoader(connector, label, import_key='diff:{}'.format(key_hash(self.old_path, self.new_path)),
+                                  batch_size=batch_size, create_only=True)
+        loader.clear_checkpoints()
+
+        added_nodes = set(self.added_nodes)
+        modified_nodes = set(new for _, new in self.modified_nodes + self.renumbered_nodes)
+        modified_rows = []
+
+        def added_node_rows():
+            for node in new_generator.iter_node_rows():
+                if node.p21_id in added_nodes:
+                    yield node
+                elif node.p21_id in modified_nodes:
+                    modified_rows.append({'p21_id': node.p21_id,
+                                          'props': {k: cypher_value(v) for k, v in node.properties().items()}})
+
+        loader.load_nodes(added_node_rows())
+        for batch in chunks(modified_rows, batch_size):
+            connector.run_cypher_statement(Neo4jQueryFactory.set_node_properties_by_p21_batch(label),
+                                           parameters={'rows': batch})
+
+        # edges between matched nodes need the ids of nodes that existed before
+        added_edges = set(self.added_edges)
+        loader.node_ids_complete = False
+        loader.load_edges(edge for edge in new_generator.iter_edge_rows()
+                          if (edge.source, edge.rel_type, edge.list_item, edge.target) in added_edges)
+        loader.clear_checkpoints()
+        ModelRegistry(connector).refresh(label, new_generator.model_info(), 'diff')
+
+        invalidate = getattr(connector, 'invalidate_label', None)
+        if invalidate is not None:
+            invalidate(label)
+
+        print('[DIFF > {} < ]: Applying change set - DONE.'.format(label))
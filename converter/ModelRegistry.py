@@ -0,0 +1,144 @@
+import datetime
+from collections import Counter
+
+from Neo4jQueryFactory import Neo4jQueryFactory
+
+
+class RegistryCounter:
+    """
+    Counts the nodes per EntityType and the edges per rel_type while the records are written.
+    """
+
+    def __init__(self):
+        self.entity_types = Counter()
+        self.rel_types = Counter()
+
+    def count_nodes(self, nodes):
+        """
+        @param nodes: iterable of NodeRecord
+        @return: generator passing the records through
+        """
+        for node in nodes:
+            self.entity_types[node.entity_type] += 1
+            yield node
+
+    def count_edges(self, edges, edge_type: str = 'rel'):
+        """
+        @param edges: iterable of EdgeRecord
+        @param edge_type: rel or shortcut. Shortcut rel_types are counted with the prefix 'shortcut:'
+        @return: generator passing the records through
+        """
+        prefix = '' if edge_type == 'rel' else edge_type + ':'
+        for edge in edges:
+            self.rel_types[prefix + edge.rel_type] += 1
+            yield edge
+
+
+class ModelRegistry:
+    """
+    Registry nodes (:ModelRegistry {label}) describe the models in the database: source path, content hash, schema,
+    header timestamp, import mode and time, and the number of nodes per EntityType and edges per rel_type.
+    Existence checks and statistics read a single indexed node instead of scanning the model label.
+    Counts are stored as parallel lists (entity_types / entity_type_counts, rel_types / rel_type_counts).
+    """
+
+    def __init__(self, connector):
+        """
+
+        @param connector: Neo4jConnector instance
+        """
+        self.connector = connector
+        self.connector.run_cypher_statement(Neo4jQueryFactory.create_model_registry_index())
+
+    def get(self, label: str) -> dict:
+        """
+        @param label: model label
+        @return: properties of the registry node or None if the model isn't registered
+        """
+        records = self.connector.run_cypher_statement(Neo4jQueryFactory.get_model_registry(label), 'r')
+        if len(records) == 0:
+            return None
+        return dict(records[0])
+
+    def exists(self, label: str) -> bool:
+        """
+        checks if a model is stored in the database. Models imported before the registry existed are detected
+        by looking up a single node
+        @param label: model label
+        @return: boolean
+        """
+        if self.get(label) is not None:
+            return True
+        return len(self.connector.run_cypher_statement('MATCH (n:{}) RETURN ID(n) LIMIT 1'.format(label))) > 0
+
+    def list(self) -> list:
+        """
+        @return: list of dicts describing the registered models
+        """
+        return [dict(record) for record in self.connector.run_cypher_statement(Neo4jQueryFactory.list_models())]
+
+    def entity_type_counts(self, label: str) -> dict:
+        """
+        @param label: model label
+        @return: dict EntityType -> number of nodes
+        """
+        registry = self.get(label)
+        if registry is None:
+            return {}
+        return dict(zip(registry['entity_types'], registry['entity_type_counts']))
+
+    def rel_type_counts(self, label: str) -> dict:
+        """
+        @param label: model label
+        @return: dict rel_type -> number of edges
+        """
+        registry = self.get(label)
+        if registry is None:
+            return {}
+        return dict(zip(registry['rel_types'], registry['rel_type_counts']))
+
+    def write(self, label: str, model_info: dict, entity_types: Counter, rel_types: Counter, import_mode: str):
+        """
+        creates or replaces the registry node of a model
+        @param label: model label
+        @param model_info: source_path, file_hash, schema and header_timestamp of the model
+        @param entity_types: number of nodes per EntityType
+        @param rel_types: number of edges per rel_type
+        @param import_mode: e.g. create, merge or diff
+        """
+        entity_types = sorted(entity_types.items())
+        rel_types = sorted(rel_types.items())
+        props = dict(model_info,
+                     import_mode=import_mode,
+                     imported_at=datetime.datetime.now().isoformat(timespec='seconds'),
+                     node_count=sum(count for _, count in entity_types),
+                     edge_count=sum(count for _, count in rel_types),
+                     entity_types=[name for name, _ in entity_types],
+                     entity_type_counts=[count for _, count in entity_types],
+                     rel_types=[name for name, _ in rel_types],
+                     rel_type_counts=[count for _, count in rel_types])
+        # neo4j doesn't store null properties
+        props = {k: v for k, v in props.items() if v is not None}
+        self.connector.run_cypher_statement(Neo4jQueryFactory.merge_model_registry(),
+                                            parameters={'label': label, 'props': props})
+
+    def refresh(self, label: str, model_info: dict, import_mode: str):
+        """
+        recounts the nodes and edges of a model in the database and rewrites its registry node,
+        e.g. after the model has been patched
+        @param label: model label
+        @param model_info: see write()
+        @param import_mode: see write()
+        """
+        entity_types = Counter({record['entity_type']: record['count'] for record in
+                                self.connector.run_cypher_statement(Neo4jQueryFactory.count_entity_types(label))})
+        rel_types = Counter({record['rel_type']: record['count'] for record in
+                             self.connector.run_cypher_statement(Neo4jQueryFactory.count_rel_types(label))})
+        self.write(label, model_info, entity_types, rel_types, import_mode)
+
+    def delete(self, label: str):
+        """
+        removes the registry node of a model
+        @param label: model label
+        """
+        self.connector.run_cypher_statement(Neo4jQueryFactory.delete_model_registry(label))
@@ -0,0 +1,577 @@
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+
+def cypher_value(val):
+    """
+    converts an attribute value into a value neo4j can store as property,
+    following the conventions of Neo4jGraphFactory.formatDict
+    @param val: attribute value
+    @return: bool, int, float, str or list of int
+    """
+    if isinstance(val, (bool, int, float)):
+        return val
+    if isinstance(val, list):
+        # ordered p21 ids of compact aggregations. Aggregated attribute values are tuples and stored as string
+        return val
+    return str(val)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    checks if an error raised by the connector has been caused by a transient neo4j error (e.g. a deadlock),
+    i.e., if the transaction can be retried
+    @param error: exception raised by Neo4jConnector.run_cypher_statement
+    @return: boolean
+    """
+    while error is not None:
+        code = getattr(error, 'code', None) or ''
+        if 'TransientError' in code or 'DeadlockDetected' in code:
+            return True
+        error = error.__cause__
+    return False
+
+
+def is_memory_error(error: Exception) -> bool:
+    """
+    checks if an error raised by the connector has been caused by a transaction exceeding the memory limits
+    of the database, i.e., if the batch may succeed when split into smaller ones
+    @param error: exception raised by Neo4jConnector.run_cypher_statement
+    @return: boolean
+    """
+    while error is not None:
+        code = getattr(error, 'code', None) or ''
+        if 'MemoryPoolOutOfMemoryError' in code or 'TransactionMemoryLimit' in code or 'OutOfMemory' in code:
+            return True
+        if isinstance(error, MemoryError):
+            return True
+        error = error.__cause__
+    return False
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size per key (e.g. per node type and entity type, or per edge type) adapted to the commit latency.
+    Rows differ a lot in size: a batch of IfcCartesianPoint rows is small, whereas IfcPropertySingleValue rows
+    with long strings or coordinate lists may exceed the transaction memory at the same number of rows.
+    A key's batch size doubles while its commits take less than half the target latency, and shrinks in
+    proportion to the latency once a commit takes longer than the target. A batch exceeding the memory
+    limits halves the size, which then becomes the upper bound of the key.
+    """
+
+    def __init__(self, initial: int = 5000, target_latency: float = 2.0, min_size: int = 100,
+                 max_size: int = 100000):
+        """
+
+        @param initial: batch size of keys without commits yet
+        @param target_latency: seconds a commit should take at most. None keeps the initial batch size
+        @param min_size: lower bound of the batch size
+        @param max_size: upper bound of the batch size
+        """
+        self.initial = initial
+        self.target_latency = target_latency
+        self.min_size = min(min_size, initial)
+        self.max_size = max(max_size, initial)
+        self.sizes = {}
+        # key -> upper bound of the batch size after memory errors
+        self.ceilings = {}
+        self._lock = threading.Lock()
+
+    def size_of(self, key: str) -> int:
+        with self._lock:
+            return self.sizes.get(key, self.initial)
+
+    def on_commit(self, key: str, rows: int, latency: float):
+        """
+        adapts the batch size of a key to the latency of a commit
+        @param key: batch size key
+        @param rows: number of rows of the committed batch
+        @param latency: seconds the commit took
+        """
+        if self.target_latency is None:
+            return
+        with self._lock:
+            size = self.sizes.get(key, self.initial)
+            if rows < size:
+                # the last batch of a group is usually not full, its latency doesn't tell much
+                return
+            if latency < self.target_latency / 2:
+                self.sizes[key] = min(size * 2, self.max_size, self.ceilings.get(key, self.max_size))
+            elif latency > self.target_latency:
+                self.sizes[key] = max(int(size * self.target_latency / latency), self.min_size)
+                if self.sizes[key] < size:
+                    print('WARNING: slow commit of {} rows of {} ({:.1f}s), batch size reduced to {}.'.format(
+                        rows, key, latency, self.sizes[key]))
+
+    def on_memory_error(self, key: str, rows: int) -> int:
+        """
+        halves the batch size of a key after a batch exceeded the memory limits
+        @param key: batch size key
+        @param rows: number of rows of the failed batch
+        @return: new batch size
+        """
+        with self._lock:
+            size = max(min(self.sizes.get(key, self.initial), rows) // 2, 1)
+            self.sizes[key] = size
+            self.ceilings[key] = size
+        print('WARNING: batch of {} rows of {} exceeded the memory limits, batch size reduced to {}.'.format(
+            rows, key, size))
+        return size
+
+    def print_summary(self):
+        """
+        prints the batch sizes chosen per key
+        """
+        if len(self.sizes) == 0:
+            return
+        print('Batch sizes:')
+        for key, size in sorted(self.sizes.items()):
+            print('  {:<60} {:>8}'.format(key, size))
+
+
+def round_robin_pairs(n: int) -> list:
+    """
+    schedules all pairs of n buckets (n even) into rounds, such that no bucket appears twice within a round
+    (circle method). The pairs of a bucket with itself form an additional round.
+    @param n: number of buckets
+    @return: list of rounds, each round a list of (i, j) with i <= j
+    """
+    rounds = [[(i, i) for i in range(n)]]
+    others = list(range(1, n))
+    for _ in range(n - 1):
+        ring = [0] + others
+        rounds.append([tuple(sorted((ring[k], ring[n - 1 - k]))) for k in range(n // 2)])
+        # rotate all but the first bucket
+        others = others[-1:] + others[:-1]
+    return rounds
+
+
+class NodeIdentityMap:
+    """
+    Compact map from p21 ids to the ids of the nodes created in the database.
+    Backed by a single int64 array indexed by p21 id, so it costs 8 bytes per p21 id instead of a python dict entry.
+    """
+
+    MISSING = -1
+
+    def __init__(self):
+        self._ids = array('q')
+
+    def __len__(self):
+        return sum(1 for node_id in self._ids if node_id != self.MISSING)
+
+    def set(self, p21_id: int, node_id: int):
+        if p21_id >= len(self._ids):
+            # grow geometrically to keep appends amortized
+            grow = max(p21_id + 1 - len(self._ids), len(self._ids) // 2, 1024)
+            self._ids.extend(array('q', [self.MISSING]) * grow)
+        elif self._ids[p21_id] != self.MISSING and self._ids[p21_id] != node_id:
+            raise Exception('Node #{} has been created twice.'.format(p21_id))
+        self._ids[p21_id] = node_id
+
+    def get(self, p21_id: int):
+        """
+        @param p21_id: p21 id of the node
+        @return: database node id or None if the node is unknown
+        """
+        if 0 <= p21_id < len(self._ids):
+            node_id = self._ids[p21_id]
+            if node_id != self.MISSING:
+                return node_id
+        return None
+
+
+class Neo4jBatchLoader:
+    """
+    Loads node and edge rows into neo4j using UNWIND batches.
+    Rows are grouped (nodes by node type and entity type, edges by rel_type), so that labels can be static
+    within a batch statement. Every batch commits together with a checkpoint node holding the number of rows
+    committed so far for its group. An interrupted import can thus be resumed from the last committed batch.
+    The node pass records the database ids of the created nodes, so that the edge pass addresses both ends of
+    an edge by their id directly instead of looking them up by p21 id.
+    These are the internal ids of ID(n) rather than elementId(n): they fit into the int64 NodeIdentityMap and the
+    query factories address nodes by ID() throughout. Neo4j may reuse the id of a deleted node, so the ids are only
+    valid while nothing deletes nodes of the model between the node and the edge pass. That holds for a single
+    import; a resumed import reads the ids again, see fetch_node_ids().
+    Edges can be written by several threads, see load_edges_parallel().
+    Into a fresh model label, nodes and edges can be CREATEd instead of MERGEd, as nothing could match anyway.
+    Uniqueness is then guaranteed by the translator (every entity is translated once, see NodeIdentityMap.set)
+    and the checkpoints (every row is committed once).
+    The batch size adapts per entity type and per edge type to the commit latency, see AdaptiveBatchSize.
+    As checkpoints count rows rather than batches, an import can be resumed with different batch sizes.
+    """
+
+    def __init__(self, connector, timestamp: str, import_key: str, batch_size: int = 5000,
+                 max_retries: int = 5, create_only: bool = False, target_latency: float = 2.0, metrics=None):
+        """
+
+        @param connector: Neo4jConnector instance
+        @param timestamp: model label
+        @param import_key: identifies the import run (e.g. derived from the content hash of the model).
+                            Checkpoints written with another key are not resumed.
+        @param batch_size: initial number of rows per transaction
+        @param max_retries: number of retries of a batch that failed with a transient error (e.g. a deadlock)
+        @param create_only: CREATE nodes and edges instead of MERGE. Only valid if the model label is empty
+                            apart from the rows committed by previous runs of the same import
+        @param target_latency: seconds a commit should take at most, see AdaptiveBatchSize.
+                               None keeps the batch size fixed
+        @param metrics: optional ConversionMetrics recording commits, retries and queued rows
+        """
+        self.connector = connector
+        self.timestamp = timestamp
+        self.import_key = import_key
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.create_only = create_only
+        self.batch_sizes = AdaptiveBatchSize(batch_size, target_latency=target_latency)
+
+        # (phase, group) -> number of committed rows
+        self.checkpoints = {}
+
+        # p21 id -> database node id, filled by the node pass
+        self.node_ids = NodeIdentityMap()
+        self.node_ids_complete = True
+
+        self.batches_committed = 0
+        self.rows_committed = 0
+        self.commit_time = 0.0
+        self.retries = 0
+
+        # guards the statistics and checkpoints when edges are written by several threads
+        self._lock = threading.Lock()
+
+        # rows handed to the loader but not yet committed, per buffer
+        self._queued = {}
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.queue_depth_of = self.queued_rows
+
+    def queued_rows(self) -> int:
+        """
+        @return: number of rows buffered by the loader that haven't been committed yet (approximately)
+        """
+        return sum(list(self._queued.values()))
+
+    # -- checkpoints --
+
+    def load_checkpoints(self) -> bool:
+        """
+        reads the checkpoints of a previous, interrupted import of the same model
+        @return: True if the import can be resumed
+        """
+        self.connector.run_cypher_statement(
+            'CREATE INDEX import_checkpoint_label IF NOT EXISTS FOR (c:ImportCheckpoint) ON (c.label)')
+
+        records = self.connector.run_cypher_statement(
+            'MATCH (c:ImportCheckpoint {label: $label}) RETURN c.import_key, c.phase, c.group, c.rows',
+            parameters={'label': self.timestamp})
+
+        self.checkpoints = {}
+        if any(record[0] != self.import_key for record in records):
+            # checkpoints of another file or configuration can't be resumed
+            return False
+        for record in records:
+            self.checkpoints[(record[1], record[2])] = record[3]
+        return len(self.checkpoints) > 0
+
+    def clear_checkpoints(self):
+        """
+        removes all checkpoints of the model, e.g. once the import is complete
+        """
+        self.connector.run_cypher_statement(
+            'MATCH (c:ImportCheckpoint {label: $label}) DELETE c', parameters={'label': self.timestamp})
+        self.checkpoints = {}
+
+    # -- loading --
+
+    def load_nodes(self, rows, phase: str = 'nodes'):
+        """
+        creates a node for every row
+        @param rows: iterable of NodeRecord
+        @param phase: name of the checkpoint phase
+        """
+        grouped_rows = (('{}:{}'.format(node.node_type, node.entity_type),
+                         {k: cypher_value(v) for k, v in node.properties().items()})
+                        for node in rows)
+        self.__load(grouped_rows, 'nodes', phase, self.__node_statement, self.__store_node_ids)
+
+    def fetch_node_ids(self):
+        """
+        reads the ids of all nodes of the model from the database, e.g. if the node pass has been resumed
+        """
+        cy = 'MATCH (n:{}) RETURN n.p21_id, ID(n)'.format(self.timestamp)
+        for chunk in self.connector.stream_cypher_statement(cy, chunk_size=self.batch_size):
+            for record in chunk:
+                self.node_ids.set(record[0], record[1])
+        self.node_ids_complete = True
+
+    def load_edges(self, rows, edge_type: str = 'rel', phase: str = 'edges'):
+        """
+        creates an edge for every row
+        @param rows: iterable of EdgeRecord
+        @param edge_type: relationship type of the edges
+        @param phase: name of the checkpoint phase
+        """
+        if not self.node_ids_complete:
+            self.fetch_node_ids()
+
+        grouped_rows = ((edge.rel_type,
+                         {'s': self.node_ids.get(edge.source),
+                          't': self.node_ids.get(edge.target),
+                          'props': {k: cypher_value(v) for k, v in edge.properties().items()}})
+                        for edge in rows)
+        self.__load(grouped_rows, 'edges', phase, lambda group: self.__edge_statement(edge_type),
+                    size_key_of=lambda group: '{}:{}'.format(edge_type, group))
+
+    def load_edges_parallel(self, rows, edge_type: str = 'rel', phase: str = 'edges', writer_threads: int = 4,
+                            hub_degree: int = 1000):
+        """
+        creates an edge for every row using several writer threads.
+        Creating an edge locks both of its end nodes, so concurrent transactions touching the same node may deadlock.
+        Therefore, edges incident to hub nodes (e.g. IfcOwnerHistory or the representation context) are written first
+        in a serial phase. The remaining edges are partitioned by the buckets of their end nodes into cells (i, j) and
+        the cells are processed in rounds, such that the cells of a round never share a bucket and thus never
+        share a node. Batches aborted by a deadlock nevertheless are retried, see max_retries.
+        The checkpoints count the rows per partition, so a resumed phase has to be partitioned the same way as the
+        interrupted one. Otherwise, the committed rows would be counted against other partitions and created again.
+        A resumed phase therefore keeps the partitioning of its checkpoints, see edge_partitioning(),
+        regardless of writer_threads and hub_degree.
+        @param rows: iterable of EdgeRecord
+        @param edge_type: relationship type of the edges
+        @param phase: name of the checkpoint phase
+        @param writer_threads: number of concurrent transactions
+        @param hub_degree: min number of edges in rows incident to a node to treat it as hub
+        """
+        # two buckets per thread, so that a round consists of as many cells as there are threads
+        requested = 'serial' if writer_threads <= 1 else (2 * writer_threads, hub_degree)
+        partitioning = self.edge_partitioning(phase)
+        if partitioning is None:
+            partitioning = requested
+        elif partitioning != requested:
+            print('WARNING: {} resumed with the partitioning of the interrupted import: {}.'.format(phase, partitioning))
+        if partitioning == 'serial':
+            self.load_edges(rows, edge_type=edge_type, phase=phase)
+            return
+        n_buckets, hub_degree = partitioning
+
+        if not self.node_ids_complete:
+            self.fetch_node_ids()
+
+        # the partitioning needs the degrees, so the rows are resolved once and kept as compact columns
+        sources = array('q')
+        targets = array('q')
+        props = []
+        degree = {}
+        for edge in rows:
+            s = self.node_ids.get(edge.source)
+            t = self.node_ids.get(edge.target)
+            if s is None or t is None:
+                # edges to entities that haven't been translated can't be created
+                continue
+            sources.append(s)
+            targets.append(t)
+            props.append({k: cypher_value(v) for k, v in edge.properties().items()})
+            degree[s] = degree.get(s, 0) + 1
+            degree[t] = degree.get(t, 0) + 1
+
+        hubs = {node_id for node_id, d in degree.items() if d >= hub_degree}
+        del degree
+
+        cells = {}
+        hub_rows = []
+        for k in range(len(sources)):
+            s, t = sources[k], targets[k]
+            row = {'s': s, 't': t, 'props': props[k]}
+            if s in hubs or t in hubs:
+                hub_rows.append(row)
+            else:
+                cells.setdefault(tuple(sorted((s % n_buckets, t % n_buckets))), []).append(row)
+        del sources, targets, props
+        self._queued['partitioned'] = len(hub_rows) + sum(len(rows) for rows in cells.values())
+
+        statement = self.__edge_statement(edge_type)
+
+        # serial phase. Group names carry the partitioning, see edge_partitioning()
+        group = 'hubs:{}:{}'.format(n_buckets, hub_degree)
+        self._queued['partitioned'] -= len(hub_rows)
+        self.__load(((group, row) for row in hub_rows), 'edges', phase, lambda g: statement,
+                    size_key_of=lambda g: edge_type)
+
+        # parallel phase
+        def load_cell(cell):
+            group = 'cell:{}:{}:{}:{}'.format(n_buckets, hub_degree, cell[0], cell[1])
+            with self._lock:
+                self._queued['partitioned'] -= len(cells.get(cell, []))
+            self.__load(((group, row) for row in cells.get(cell, [])), 'edges', phase, lambda g: statement,
+                        size_key_of=lambda g: edge_type)
+
+        with ThreadPoolExecutor(max_workers=max(writer_threads, 1)) as executor:
+            for cells_of_round in round_robin_pairs(n_buckets):
+                # wait for the round to complete before the next one locks the same buckets
+                for future in [executor.submit(load_cell, cell) for cell in cells_of_round if cell in cells]:
+                    future.result()
+        self._queued.pop('partitioned', None)
+
+    def edge_partitioning(self, phase: str):
+        """
+        reads the partitioning of the edges committed by a previous run of a phase from its checkpoint groups.
+        load_edges() groups by rel_type, load_edges_parallel() names its groups 'hubs:<buckets>:<hub degree>' and
+        'cell:<buckets>:<hub degree>:<i>:<j>'
+        @param phase: name of the checkpoint phase
+        @return: None if nothing of the phase has been committed, 'serial' if the edges have been grouped by rel_type,
+                 otherwise (number of buckets, hub degree)
+        """
+        for checkpoint_phase, group in self.checkpoints:
+            if checkpoint_phase != phase:
+                continue
+            parts = group.split(':')
+            if parts[0] in ('hubs', 'cell') and len(parts) >= 3:
+                return int(parts[1]), int(parts[2])
+            return 'serial'
+        return None
+
+    def __node_statement(self, group: str) -> str:
+        # group is 'NodeType:EntityType'
+        if self.create_only:
+            return 'UNWIND $rows AS row ' \
+                   'CREATE (n:{}:{}) ' \
+                   'SET n = row ' \
+                   'WITH collect([row.p21_id, ID(n)]) AS ids'.format(self.timestamp, group)
+        return 'UNWIND $rows AS row ' \
+               'MERGE (n:{}:{} {{p21_id: row.p21_id}}) ' \
+               'SET n += row ' \
+               'WITH collect([row.p21_id, ID(n)]) AS ids'.format(self.timestamp, group)
+
+    def __edge_statement(self, edge_type: str) -> str:
+        # both ends are addressed by their node id, which is a direct record access
+        if self.create_only:
+            return 'UNWIND $rows AS row ' \
+                   'MATCH (source) WHERE ID(source) = row.s ' \
+                   'MATCH (target) WHERE ID(target) = row.t ' \
+                   'CREATE (source)-[r:{}]->(target) ' \
+                   'SET r = row.props ' \
+                   'WITH count(*) AS batch, [] AS ids'.format(edge_type)
+        return 'UNWIND $rows AS row ' \
+               'MATCH (source) WHERE ID(source) = row.s ' \
+               'MATCH (target) WHERE ID(target) = row.t ' \
+               'MERGE (source)-[r:{}]->(target) ' \
+               'SET r += row.props ' \
+               'WITH count(*) AS batch, [] AS ids'.format(edge_type)
+
+    def __store_node_ids(self, records):
+        for p21_id, node_id in records[0]['ids']:
+            self.node_ids.set(p21_id, node_id)
+
+    def __load(self, grouped_rows, kind: str, phase: str, statement_of, on_commit=None, size_key_of=None):
+        """
+        buffers the rows per group and commits a group's buffer once it reaches the batch size
+        @param kind: nodes or edges, edge rows carry the node ids of their ends as s and t
+        @param size_key_of: maps a group to the key of its batch size, defaults to the group itself
+        """
+        if size_key_of is None:
+            size_key_of = lambda group: group
+        buffers = {}
+        seen = {}
+        token = object()
+        buffered = 0
+
+        for group, row in grouped_rows:
+            # edges to entities that haven't been translated can't be created
+            if kind == 'edges' and (row['s'] is None or row['t'] is None):
+                continue
+
+            # skip rows committed by a previous run
+            seen[group] = seen.get(group, 0) + 1
+            if seen[group] <= self.checkpoints.get((phase, group), 0):
+                if on_commit is not None:
+                    # ids of nodes committed by the previous run are unknown
+                    self.node_ids_complete = False
+                continue
+
+            buffer = buffers.setdefault(group, [])
+            buffer.append(row)
+            buffered += 1
+            if buffered % 1000 == 0:
+                self._queued[token] = buffered
+            if len(buffer) >= self.batch_sizes.size_of(size_key_of(group)):
+                self.__commit(phase, group, buffer, statement_of(group), on_commit, size_key_of(group), kind)
+                buffers[group] = []
+                buffered -= len(buffer)
+                self._queued[token] = buffered
+
+        self._queued[token] = buffered
+        for group, buffer in buffers.items():
+            if len(buffer) > 0:
+                self.__commit(phase, group, buffer, statement_of(group), on_commit, size_key_of(group), kind)
+                buffered -= len(buffer)
+                self._queued[token] = buffered
+        self._queued.pop(token, None)
+
+    def __commit(self, phase: str, group: str, rows: list, statement: str, on_commit=None, size_key: str = None,
+                 kind: str = 'edges'):
+        """
+        writes a batch and its checkpoint within one transaction.
+        A batch exceeding the memory limits of the database gets split and committed in parts
+        """
+        size_key = group if size_key is None else size_key
+        key = (phase, group)
+        with self._lock:
+            committed = self.checkpoints.get(key, 0) + len(rows)
+
+        # the batch statement ends with 'WITH ..., ids'
+        cy = statement + ' ' \
+            'MERGE (c:ImportCheckpoint {label: $label, phase: $phase, group: $group}) ' \
+            'SET c.import_key = $import_key, c.rows = $committed ' \
+            'RETURN ids'
+
+        parameters = {'rows': rows,
+                      'label': self.timestamp,
+                      'phase': phase,
+                      'group': group,
+                      'import_key': self.import_key,
+                      'committed': committed}
+
+        attempt = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                records = self.connector.run_cypher_statement(cy, parameters=parameters)
+                break
+            except Exception as e:
+                # the batch has been rolled back as a whole, including its checkpoint
+                if is_memory_error(e) and len(rows) > 1:
+                    size = self.batch_sizes.on_memory_error(size_key, len(rows))
+                    # equal parts, so that the last part isn't a tiny remainder
+                    parts = -(-len(rows) // size)
+                    for i in range(parts):
+                        self.__commit(phase, group, rows[i * len(rows) // parts:(i + 1) * len(rows) // parts],
+                                      statement, on_commit, size_key, kind)
+                    return
+                if attempt >= self.max_retries or not is_transient_error(e):
+                    raise
+                attempt += 1
+                with self._lock:
+                    self.retries += 1
+                if self.metrics is not None:
+                    self.metrics.batch_retried()
+                print('WARNING: batch of {} up to row {} aborted by a transient error, retry {}/{}.'.format(
+                    group, committed, attempt, self.max_retries))
+                time.sleep(0.1 * 2 ** attempt)
+            finally:
+                with self._lock:
+                    self.commit_time += time.perf_counter() - start
+
+        latency = time.perf_counter() - start
+        self.batch_sizes.on_commit(size_key, len(rows), latency)
+        if self.metrics is not None:
+            self.metrics.batch_committed(kind, len(rows), latency)
+
+        if on_commit is not None:
+            on_commit(records)
+
+        with self._lock:
+            self.checkpoints[key] = committed
+            self.batches_committed += 1
+            self.rows_committed += len(rows)
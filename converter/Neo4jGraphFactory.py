@@ -1,5 +1,5 @@
 
-def BuildMultiStatement(cls, cypherCMDs):
+def BuildMultiStatement(cypherCMDs):
     """
     constructs a multi-statement cypher command
     @param cypherCMDs:
@@ -8,7 +8,7 @@ def BuildMultiStatement(cls, cypherCMDs):
     return ' '.join(cypherCMDs)
 
 
-def formatDict(cls, dictionary):
+def formatDict(dictionary):
     """
     formats a given dictionary to be understood in a cypher query
     @param dictionary: dict to be formatted
@@ -276,9 +276,11 @@ class Neo4jGraphFactory:
         return BuildMultiStatement([matchObjRel, matchRootedObj, merge1, merge2, returnID])
 
     @classmethod
-    def merge_on_p21(cls, from_p21: int, to_p21: int, rel_attrs, timestamp, without_match: bool = False):
+    def merge_on_p21(cls, from_p21: int, to_p21: int, rel_attrs, timestamp, without_match: bool = False,
+                     edge_type: str = 'rel'):
         """
         Provides the cypher command to merge two nodes based on their P21 vals
+        @param edge_type: relationship type of the edge
         @param without_match:
         @param from_p21: p21 id origin
         @param to_p21: p21 id destination
@@ -292,7 +294,7 @@ class Neo4jGraphFactory:
                 timestamp, from_p21)
             to_node = 'MATCH (target:{}) WHERE target.p21_id = {}'.format(
                 timestamp, to_p21)
-            merge = 'MERGE (source)-[r:rel ]->(target)'
+            merge = 'MERGE (source)-[r:{} ]->(target)'.format(edge_type)
             attrs = []
             for attr, val in rel_attrs.items():
                 if isinstance(val, str):
@@ -307,8 +309,7 @@ class Neo4jGraphFactory:
 
         else:
             attrs_str: str = formatDict(rel_attrs)
-            cy: str = "MERGE (n{})-[:{} {}]->(n{})".format(from_p21,
-                                                           rel_attrs["rel_type"], attrs_str, to_p21)
+            cy: str = "MERGE (n{})-[:{} {}]->(n{})".format(from_p21, edge_type, attrs_str, to_p21)
 
         return cy
 
@@ -0,0 +1,153 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# statements containing one of these clauses modify the graph and are never served from the cache
+WRITE_CLAUSES = re.compile(r'\b(CREATE|MERGE|DELETE|SET|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b', re.IGNORECASE)
+
+# model labels are generated by the translator as 'ts' + header timestamp
+MODEL_LABEL = re.compile(r':\s*(ts[0-9A-Za-z_]+)')
+
+
+def freeze_parameters(value):
+    """
+    converts query parameters into a hashable representation
+    @param value: parameter dict, list or atomic value
+    @return: hashable value
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_parameters(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze_parameters(v) for v in value)
+    return value
+
+
+class Neo4jQueryCache:
+    """
+    client-side cache for read queries sent to a Neo4jConnector.
+    Results are keyed by (query, parameters, model label), bounded in size (LRU) and expire after a TTL.
+    The cache can be used as a drop-in replacement for the connector it wraps.
+    """
+
+    def __init__(self, connector, max_entries: int = 1024, ttl: float = 300.0):
+        """
+
+        @param connector: the Neo4jConnector instance executing the queries
+        @param max_entries: max number of cached results, the least recently used result is evicted first
+        @param ttl: time to live of a cached result in seconds. Set to None to disable expiry
+        """
+        self.connector = connector
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._keys_by_label = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __getattr__(self, item):
+        # delegate everything else (connect_driver, disconnect_driver, ...) to the wrapped connector
+        return getattr(self.connector, item)
+
+    def run_cypher_statement(self, statement, postStatement=None, parameters=None, label: str = None):
+        """
+        executes a given cypher statement or returns the cached response of a previous identical read query
+        @param statement: cypher command
+        @param postStatement: post processing of response
+        @param parameters: optional query parameters
+        @param label: model label the query refers to. Extracted from the statement if not provided
+        @return: list of records
+        """
+        labels = [label] if label is not None else MODEL_LABEL.findall(statement)
+
+        if WRITE_CLAUSES.search(statement):
+            # write queries bypass the cache and invalidate everything cached for the affected models
+            for l in labels:
+                self.invalidate_label(l)
+            return self.connector.run_cypher_statement(statement, postStatement, parameters)
+
+        key = (statement, postStatement, freeze_parameters(parameters), tuple(sorted(set(labels))))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if self.ttl is None or time.monotonic() - created < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return list(result)
+                # entry expired
+                self._remove(key)
+                self.expirations += 1
+            self.misses += 1
+
+        result = self.connector.run_cypher_statement(statement, postStatement, parameters)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            for l in key[3] or (None,):
+                self._keys_by_label.setdefault(l, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+        return list(result)
+
+    def invalidate_label(self, label: str):
+        """
+        drops all cached results that refer to the given model label.
+        Results of label-less queries (e.g. lookups by node id) are dropped as well,
+        as node ids may be reused once a model gets reloaded.
+        @param label: model label
+        @return: number of removed entries
+        """
+        with self._lock:
+            keys = self._keys_by_label.get(label, set()) | self._keys_by_label.get(None, set())
+            for key in list(keys):
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        """
+        drops all cached results. Statistics are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_label.clear()
+
+    def get_statistics(self) -> dict:
+        """
+        returns the hit/miss statistics of the cache
+        @return: dict
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / requests if requests > 0 else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'size': len(self._entries)
+            }
+
+    def _remove(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        for l in key[3] or (None,):
+            keys = self._keys_by_label.get(l)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_label[l]
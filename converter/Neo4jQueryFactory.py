@@ -1,7 +1,9 @@
 from typing import List
 
+from GraphRecords import ORDERED_LIST_SUFFIX
 
-def BuildMultiStatement(cls, cypherCMDs):
+
+def BuildMultiStatement(cypherCMDs):
     """
     constructs a multi-statement cypher command
     @param cypherCMDs:
@@ -99,7 +101,7 @@ class Neo4jQueryFactory:
         @return: cypher query string
         """
 
-        getModel = 'MATCH(n)'.format(label)
+        getModel = 'MATCH(n:{})'.format(label)
         where = 'WHERE ID(n) = {}'.format(nodeId)
 
         open_sub = 'CALL {WITH n'
@@ -192,7 +194,8 @@ class Neo4jQueryFactory:
     @classmethod
     def get_pattern_by_node_id(cls, node_id: int) -> str:
         """
-
+        Enumerates every path of up to 10 edges, which grows exponentially with shared nodes.
+        See GraphTraversal.fetch_subgraph() for the distinct nodes and edges instead
         @param node_id:
         @return: cypher query string
         """
@@ -216,7 +219,9 @@ class Neo4jQueryFactory:
     @classmethod
     def get_distinct_paths_from_node(cls, node_id: int) -> str:
         """
-        Queries all distinct paths outgoing from a specified node
+        Queries all distinct paths outgoing from a specified node.
+        Enumerates every path, which grows exponentially with shared nodes.
+        See GraphTraversal.fetch_subgraph() for the distinct nodes and edges instead
         @param node_id:
         @return: cypher query string
         """
@@ -234,7 +239,7 @@ class Neo4jQueryFactory:
         @param label: model label
         @return: cypher query string
         """
-        pattern = 'MATCH pattern = (n:{}}:PrimaryNode)<--(con)'.format(label)
+        pattern = 'MATCH pattern = (n:{}:PrimaryNode)<--(con)'.format(label)
         ret = 'RETURN pattern'
         return BuildMultiStatement([pattern, ret])
 
@@ -271,6 +276,407 @@ class Neo4jQueryFactory:
         return 'MATCH path = (c:ConnectionNode)-[r]->(n) WHERE ID(n)={} ' \
                'RETURN path, NODES(path), RELATIONSHIPS(path)'.format(node_id)
 
+    @classmethod
+    def get_nodes_by_ids(cls) -> str:
+        """
+        batched variant of get_node_by_id. Expects the node ids as query parameter $node_ids
+        @return: cypher query string
+        """
+        return 'UNWIND $node_ids AS node_id MATCH (n) WHERE ID(n) = node_id RETURN node_id, n'
+
+    @classmethod
+    def get_nodes_by_p21_ids(cls, label: str) -> str:
+        """
+        queries the nodes of a model by their p21 ids. Expects the p21 ids as query parameter $p21_ids
+        @param label: model identifier
+        @return: cypher query string
+        """
+        return 'UNWIND $p21_ids AS p21 MATCH (n:{} {{p21_id: p21}}) RETURN p21, ID(n) AS node_id, n'.format(label)
+
+    @classmethod
+    def get_child_nodes_batch(cls, label: str) -> str:
+        """
+        batched variant of get_child_nodes. Expects the parent node ids as query parameter $node_ids
+        @param label: model identifier
+        @return: cypher query string
+        """
+        return 'UNWIND $node_ids AS parent_id ' \
+               'MATCH (n:{})-[r:rel]->(c) WHERE ID(n) = parent_id ' \
+               'RETURN parent_id, ID(c) AS child_id, c, PROPERTIES(r)'.format(label)
+
+    @classmethod
+    def get_child_nodes_by_p21_batch(cls, label: str) -> str:
+        """
+        batched variant of get_child_nodes addressing the parent nodes by p21 id.
+        Expects the p21 ids as query parameter $p21_ids
+        @param label: model identifier
+        @return: cypher query string
+        """
+        return 'UNWIND $p21_ids AS p21 ' \
+               'MATCH (n:{} {{p21_id: p21}})-[r:rel]->(c) ' \
+               'RETURN p21, c.p21_id AS child_p21, ID(c) AS child_id, c, PROPERTIES(r)'.format(label)
+
+    @classmethod
+    def get_parent_connection_nodes_batch(cls) -> str:
+        """
+        batched variant of get_parent_connection_node. Expects the node ids as query parameter $node_ids
+        @return: cypher query string
+        """
+        return 'UNWIND $node_ids AS node_id ' \
+               'MATCH path = (c:ConnectionNode)-[r]->(n) WHERE ID(n) = node_id ' \
+               'RETURN node_id, path, NODES(path), RELATIONSHIPS(path)'
+
+    @classmethod
+    def get_conNodes_patterns_batch(cls) -> str:
+        """
+        batched variant of get_conNodes_patterns. Expects the connection node ids as query parameter $node_ids
+        @return: cypher query string
+        """
+        return 'UNWIND $node_ids AS node_id ' \
+               'MATCH paths = (c:ConnectionNode)-[r]->(n) WHERE ID(c) = node_id ' \
+               'RETURN node_id, paths, NODES(paths), RELATIONSHIPS(paths)'
+
+    @classmethod
+    def get_subgraph_frontier(cls, label: str, edge_types=('rel',), direction: str = 'out') -> str:
+        """
+        expands one level of a subgraph, see GraphTraversal.fetch_subgraph(). Expects the query parameters
+        $node_ids (frontier), $rel_types and $labels (lists of allowed rel_types and node labels, or null)
+        @param label: model identifier
+        @param edge_types: relationship types to follow, e.g. rel and shortcut
+        @param direction: out, in or both
+        @return: cypher query string returning edge_id, source, target, edge_type, props and neighbor
+        """
+        pattern = {'out': '-[r:{}]->', 'in': '<-[r:{}]-', 'both': '-[r:{}]-'}[direction].format('|'.join(edge_types))
+        return 'UNWIND $node_ids AS node_id ' \
+               'MATCH (n:{0}){1}(m:{0}) WHERE ID(n) = node_id ' \
+               'AND ($rel_types IS NULL OR r.rel_type IN $rel_types) ' \
+               'AND ($labels IS NULL OR any(l IN labels(m) WHERE l IN $labels)) ' \
+               'RETURN ID(r) AS edge_id, ID(startNode(r)) AS source, ID(endNode(r)) AS target, ' \
+               'type(r) AS edge_type, properties(r) AS props, ID(m) AS neighbor'.format(label, pattern)
+
+    @classmethod
+    def get_subgraph_apoc(cls, label: str, max_depth: int, edge_types=('rel',), direction: str = 'out',
+                          labels=None) -> str:
+        """
+        queries the distinct nodes and relationships reachable from the start nodes within max_depth levels
+        on the server. Expects the start node ids as query parameter $node_ids.
+        !! APOC library needs to be installed in the database instance !!
+        @param label: model identifier
+        @param max_depth: max number of levels
+        @param edge_types: relationship types to follow, e.g. rel and shortcut
+        @param direction: out, in or both
+        @param labels: optional list of node labels (e.g. entity types) the expansion is restricted to
+        @return: cypher query string returning node_ids, nodes and edges as [edge_id, source, target, edge_type, props]
+        """
+        arrow = {'out': '>', 'in': '<', 'both': ''}[direction]
+        rel_filter = '|'.join(
+            (arrow + edge_type if direction == 'in' else edge_type + arrow) for edge_type in edge_types)
+        label_filter = '|'.join('+' + l for l in (labels or [label]))
+        return """
+        MATCH (n:{0}) WHERE ID(n) IN $node_ids
+        WITH collect(n) AS starts
+        CALL apoc.path.subgraphAll(starts, {{maxLevel: {1}, relationshipFilter: '{2}', labelFilter: '{3}'}})
+        YIELD nodes, relationships
+        RETURN [x IN nodes | ID(x)] AS node_ids, nodes,
+               [r IN relationships | [ID(r), ID(startNode(r)), ID(endNode(r)), type(r), properties(r)]] AS edges
+        """.format(label, max_depth, rel_filter, label_filter)
+
+    @classmethod
+    def get_shortcut_targets(cls, node_id: int, rel_type: str) -> str:
+        """
+        queries the nodes connected to a node by a derived shortcut edge,
+        e.g. rel_type HAS_PROPERTY_SET for the property sets or CONTAINED_IN for the spatial container of an element.
+        Requires a graph generated with derive_shortcuts=True
+        @param node_id: the node id
+        @param rel_type: rel_type of the shortcut edge
+        @return: cypher query string
+        """
+        return 'MATCH (n)-[:shortcut {{rel_type: \'{}\'}}]->(m) WHERE ID(n) = {} RETURN m'.format(rel_type, node_id)
+
+    @classmethod
+    def get_shortcut_sources(cls, node_id: int, rel_type: str) -> str:
+        """
+        queries the nodes pointing to a node by a derived shortcut edge,
+        e.g. rel_type CONTAINED_IN for all elements contained in a storey.
+        Requires a graph generated with derive_shortcuts=True
+        @param node_id: the node id
+        @param rel_type: rel_type of the shortcut edge
+        @return: cypher query string
+        """
+        return 'MATCH (m)-[:shortcut {{rel_type: \'{}\'}}]->(n) WHERE ID(n) = {} RETURN m'.format(rel_type, node_id)
+
+    @classmethod
+    def create_spatial_hierarchy_indexes(cls) -> list:
+        """
+        Provides the cypher commands to index the spatial hierarchy encodings of primary nodes
+        @return: list of cypher command strings
+        """
+        return ['CREATE INDEX primary_node_hierarchy_left IF NOT EXISTS FOR (n:PrimaryNode) ON (n.hierarchy_left)',
+                'CREATE INDEX primary_node_hierarchy_path IF NOT EXISTS FOR (n:PrimaryNode) ON (n.hierarchy_path)']
+
+    @classmethod
+    def create_p21_uniqueness_constraint(cls, label: str) -> str:
+        """
+        provides the constraint that enforces unique p21 ids within a model. Also serves as index for p21 lookups
+        @param label: model label
+        @return: cypher statement
+        """
+        return 'CREATE CONSTRAINT unique_p21_{0} IF NOT EXISTS FOR (n:{0}) REQUIRE n.p21_id IS UNIQUE'.format(label)
+
+    @classmethod
+    def get_spatial_subtree(cls, label: str, node_id: int) -> str:
+        """
+        queries all primary nodes decomposed from or contained in the given node (e.g. a building storey),
+        using the nested-set interval of the node. Requires a graph generated with spatial_index=True
+        @param label: model label
+        @param node_id: node id of the root of the subtree
+        @return: cypher query string
+        """
+        return """
+        MATCH (root:{0}:PrimaryNode) WHERE ID(root) = {1}
+        MATCH (n:{0}:PrimaryNode)
+        WHERE n.hierarchy_left > root.hierarchy_left AND n.hierarchy_left < root.hierarchy_right
+        RETURN n
+        """.format(label, node_id)
+
+    @classmethod
+    def get_spatial_subtree_by_guid(cls, label: str, global_id: str) -> str:
+        """
+        queries all primary nodes decomposed from or contained in the entity with the given GlobalId.
+        Requires a graph generated with spatial_index=True
+        @param label: model label
+        @param global_id: GlobalId of the root of the subtree
+        @return: cypher query string
+        """
+        return """
+        MATCH (root:{0}:PrimaryNode {{GlobalId: "{1}"}})
+        MATCH (n:{0}:PrimaryNode)
+        WHERE n.hierarchy_left > root.hierarchy_left AND n.hierarchy_left < root.hierarchy_right
+        RETURN n
+        """.format(label, global_id)
+
+    @classmethod
+    def get_spatial_ancestors(cls, label: str, node_id: int) -> str:
+        """
+        queries all spatial ancestors of a primary node ordered from the root (i.e., the project) downwards,
+        using the materialized path of the node. Requires a graph generated with spatial_index=True
+        @param label: model label
+        @param node_id: node id
+        @return: cypher query string
+        """
+        return """
+        MATCH (n:{0}:PrimaryNode) WHERE ID(n) = {1}
+        UNWIND split(substring(n.hierarchy_path, 1), '/')[..-1] AS ancestor_p21
+        MATCH (a:{0}:PrimaryNode {{p21_id: toInteger(ancestor_p21)}})
+        RETURN a ORDER BY a.hierarchy_depth
+        """.format(label, node_id)
+
+    @classmethod
+    def get_entities_with_edges(cls, label: str) -> str:
+        """
+        queries all nodes of a model together with their outgoing associations.
+        The associations are collected per node within a subquery, so the result can be streamed node by node.
+        @param label: model label
+        @return: cypher query string returning p21_id, entity_type, attrs and edges as [rel_type, listItem, p21_id]
+        """
+        return """
+        MATCH (n:{0})
+        CALL {{
+            WITH n
+            MATCH (n)-[r:rel]->(m:{0})
+            RETURN collect([r.rel_type, r.listItem, m.p21_id]) AS edges
+        }}
+        RETURN n.p21_id AS p21_id, n.EntityType AS entity_type, properties(n) AS attrs, edges
+        """.format(label)
+
+    @classmethod
+    def get_aggregation_members(cls, label: str, rel_type: str) -> str:
+        """
+        queries the members of an aggregated association of a node, in one row. Expects the query parameter $node_id.
+        Compactly encoded LIST aggregations provide the ordered p21 ids of the members as list property
+        (see IFCGraphGenerator(compact_list_threshold)), otherwise the order is given by the listItem of the edges.
+        See GraphTraversal.get_ordered_members()
+        @param label: model label
+        @param rel_type: name of the aggregated association, e.g. Polygon
+        @return: cypher query string returning order (list of p21 ids or null) and members as
+                 [p21_id, listItem, node id]
+        """
+        return """
+        MATCH (n:{0}) WHERE ID(n) = $node_id
+        OPTIONAL MATCH (n)-[r:rel {{rel_type: '{1}'}}]->(m)
+        RETURN n.`{1}{2}` AS order, collect([m.p21_id, r.listItem, ID(m)]) AS members
+        """.format(label, rel_type, ORDERED_LIST_SUFFIX)
+
+    @classmethod
+    def create_model_registry_index(cls) -> str:
+        """
+        provides the index on the model labels of the registry nodes, see ModelRegistry
+        @return: cypher statement
+        """
+        return 'CREATE INDEX model_registry_label IF NOT EXISTS FOR (r:ModelRegistry) ON (r.label)'
+
+    @classmethod
+    def list_models(cls) -> str:
+        """
+        queries the registry nodes of all models in the database
+        @return: cypher query string returning label, source path, schema, import time and number of nodes and edges
+        """
+        return 'MATCH (r:ModelRegistry) ' \
+               'RETURN r.label AS label, r.source_path AS source_path, r.schema AS schema, ' \
+               'r.imported_at AS imported_at, r.node_count AS node_count, r.edge_count AS edge_count ' \
+               'ORDER BY r.imported_at'
+
+    @classmethod
+    def get_model_registry(cls, label: str) -> str:
+        """
+        queries the registry node of a model
+        @param label: model label
+        @return: cypher query string returning the registry node r
+        """
+        return "MATCH (r:ModelRegistry {{label: '{}'}}) RETURN r".format(label)
+
+    @classmethod
+    def merge_model_registry(cls) -> str:
+        """
+        creates or replaces the registry node of a model. Expects the query parameters $label and $props
+        @return: cypher statement
+        """
+        return 'MERGE (r:ModelRegistry {label: $label}) SET r = $props SET r.label = $label'
+
+    @classmethod
+    def delete_model_registry(cls, label: str) -> str:
+        """
+        deletes the registry node of a model
+        @param label: model label
+        @return: cypher statement
+        """
+        return "MATCH (r:ModelRegistry {{label: '{}'}}) DELETE r".format(label)
+
+    @classmethod
+    def count_entity_types(cls, label: str) -> str:
+        """
+        counts the nodes of a model per EntityType
+        @param label: model label
+        @return: cypher query string returning entity_type and count
+        """
+        return 'MATCH (n:{}) RETURN n.EntityType AS entity_type, count(n) AS count'.format(label)
+
+    @classmethod
+    def count_rel_types(cls, label: str) -> str:
+        """
+        counts the edges of a model per rel_type. Shortcut rel_types are prefixed with 'shortcut:'
+        @param label: model label
+        @return: cypher query string returning rel_type and count
+        """
+        return "MATCH (n:{})-[r]->() WHERE type(r) IN ['rel', 'shortcut'] " \
+               "RETURN CASE type(r) WHEN 'rel' THEN r.rel_type ELSE 'shortcut:' + r.rel_type END AS rel_type, " \
+               "count(r) AS count".format(label)
+
+    @classmethod
+    def create_database(cls, database: str) -> str:
+        """
+        creates a database if it doesn't exist yet. Run it against the system database, see
+        Neo4jConnector.run_system_statement(). Requires a server that supports multiple databases
+        @param database: name of the database
+        @return: cypher statement
+        """
+        return 'CREATE DATABASE `{}` IF NOT EXISTS WAIT'.format(database)
+
+    @classmethod
+    def list_databases(cls) -> str:
+        """
+        queries the names of all databases. Run it against the system database
+        @return: cypher query string returning name
+        """
+        return 'SHOW DATABASES YIELD name RETURN DISTINCT name'
+
+    @classmethod
+    def create_model_route_index(cls) -> str:
+        """
+        provides the index on the model labels of the route nodes, see DatabaseRouter
+        @return: cypher statement
+        """
+        return 'CREATE INDEX model_route_label IF NOT EXISTS FOR (r:ModelRoute) ON (r.label)'
+
+    @classmethod
+    def get_model_route(cls, label: str) -> str:
+        """
+        queries the database a model has been routed to
+        @param label: model label
+        @return: cypher query string returning database and project
+        """
+        return "MATCH (r:ModelRoute {{label: '{}'}}) RETURN r.database AS database, r.project AS project".format(label)
+
+    @classmethod
+    def merge_model_route(cls) -> str:
+        """
+        stores the database a model is routed to. Expects the query parameters $label, $database and $project
+        @return: cypher statement
+        """
+        return 'MERGE (r:ModelRoute {label: $label}) SET r.database = $database, r.project = $project'
+
+    @classmethod
+    def list_model_routes(cls) -> str:
+        """
+        queries the databases all models have been routed to
+        @return: cypher query string returning label, database and project
+        """
+        return 'MATCH (r:ModelRoute) RETURN r.label AS label, r.database AS database, r.project AS project ' \
+               'ORDER BY r.database, r.label'
+
+    @classmethod
+    def delete_edges_by_p21_batch(cls, label: str) -> str:
+        """
+        deletes rel edges of a model. Expects the query parameter $rows as list of maps {s, t, rel_type, listItem},
+        s and t being the p21 ids of the end nodes. listItem is null for edges of single associations
+        @param label: model identifier
+        @return: cypher statement
+        """
+        return 'UNWIND $rows AS row ' \
+               'MATCH (s:{0} {{p21_id: row.s}})-[r:rel {{rel_type: row.rel_type}}]->(t:{0} {{p21_id: row.t}}) ' \
+               'WHERE (r.listItem IS NULL AND row.listItem IS NULL) OR r.listItem = row.listItem ' \
+               'DELETE r'.format(label)
+
+    @classmethod
+    def delete_nodes_by_p21_batch(cls, label: str) -> str:
+        """
+        deletes nodes of a model including their edges. Expects the p21 ids as query parameter $p21_ids
+        @param label: model identifier
+        @return: cypher statement
+        """
+        return 'UNWIND $p21_ids AS p21 MATCH (n:{} {{p21_id: p21}}) DETACH DELETE n'.format(label)
+
+    @classmethod
+    def set_p21_ids_batch(cls, label: str) -> str:
+        """
+        renumbers nodes of a model. Expects the query parameter $rows as list of maps {old, new}.
+        The new ids are staged in p21_next, see commit_p21_ids(), so that renumbering never matches a node twice
+        @param label: model identifier
+        @return: cypher statement
+        """
+        return 'UNWIND $rows AS row MATCH (n:{} {{p21_id: row.old}}) WHERE n.p21_next IS NULL ' \
+               'SET n.p21_next = row.new'.format(label)
+
+    @classmethod
+    def commit_p21_ids(cls, label: str) -> str:
+        """
+        applies the p21 ids staged by set_p21_ids_batch() to at most $limit nodes.
+        Run it repeatedly until it returns 0
+        @param label: model identifier
+        @return: cypher statement returning the number of updated nodes
+        """
+        return 'MATCH (n:{}) WHERE n.p21_next IS NOT NULL WITH n LIMIT $limit ' \
+               'SET n.p21_id = n.p21_next REMOVE n.p21_next RETURN count(n)'.format(label)
+
+    @classmethod
+    def set_node_properties_by_p21_batch(cls, label: str) -> str:
+        """
+        updates the properties of nodes of a model. Expects the query parameter $rows as list of maps {p21_id, props}
+        @param label: model identifier
+        @return: cypher statement
+        """
+        return 'UNWIND $rows AS row MATCH (n:{} {{p21_id: row.p21_id}}) SET n += row.props'.format(label)
+
     @classmethod
     def get_all_nodes_wou_EQUIVALENTTO_rel(cls, timestamp: str) -> str:
         """
@@ -278,10 +684,9 @@ class Neo4jQueryFactory:
         @param timestamp: the model's identifier
         @return: cypher query string
         """
+        # checks the edges of each node instead of collecting the ids of all matched nodes into one list
         cy = """
-        Match (n)-[r:EQUIVALENT_TO]-(m) 
-        WITH collect(ID(n)) as nodeIds
-        MATCH (a:{0}) WHERE NOT ID(a) IN nodeIds
+        MATCH (a:{0}) WHERE NOT (a)-[:EQUIVALENT_TO]-()
         RETURN a
         """.format(timestamp)
         return cy
@@ -326,6 +731,48 @@ class Neo4jQueryFactory:
         RETURN ID(mod_init) as modifiedEdgeIDs_init, ID(mod_updt) as modifiedEdgeIDs_updated
         """.format(ts_init, ts_updt)
 
+    @classmethod
+    def load_SIMILAR_TO_rectangles_anchored(cls, ts_init: str, ts_updt: str) -> str:
+        """
+        equivalent of load_SIMILAR_TO_rectangles that starts from the SIMILAR_TO pairs and expands the
+        rel edges of both models from there instead of joining two independent scans over all rel edges
+        @param ts_init: label of the initial model
+        @param ts_updt: label of the updated model
+        @return: cypher query string
+        """
+        return """
+        MATCH (init_start:{0})-[:SIMILAR_TO]-(updt_start:{1})
+        MATCH (init_start)-[r1:rel]->(init_end:{0})-[:SIMILAR_TO]-(updt_end:{1})
+        MATCH (updt_start)-[r2:rel]->(updt_end)
+
+        RETURN ID(init_start), ID(init_end), ID(updt_start), ID(updt_end)
+        """.format(ts_init, ts_updt)
+
+    @classmethod
+    def get_modified_edge_IDs_anchored(cls, ts_init: str, ts_updt: str) -> str:
+        """
+        equivalent of get_modified_edge_IDs that checks for each rel edge whether a SIMILAR_TO rectangle exists
+        instead of collecting all edge ids into lists. Modified edges of both models are returned row by row.
+        @param ts_init: label of the initial model
+        @param ts_updt: label of the updated model
+        @return: cypher query string
+        """
+        return """
+        MATCH (a:{0})-[mod:rel]->(b:{0})
+        WHERE NOT EXISTS {{
+            MATCH (a)-[:SIMILAR_TO]-(:{1})-[:rel]->(:{1})-[:SIMILAR_TO]-(b)
+        }}
+        RETURN ID(mod) AS modifiedEdgeID, '{0}' AS label
+
+        UNION ALL
+
+        MATCH (c:{1})-[mod:rel]->(d:{1})
+        WHERE NOT EXISTS {{
+            MATCH (c)-[:SIMILAR_TO]-(:{0})-[:rel]->(:{0})-[:SIMILAR_TO]-(d)
+        }}
+        RETURN ID(mod) AS modifiedEdgeID, '{1}' AS label
+        """.format(ts_init, ts_updt)
+
 # ticket_PostEvent-VerifyParsedModel
     @classmethod
     def count_nodes(cls, timestamp):
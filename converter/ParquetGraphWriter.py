@@ -0,0 +1,269 @@
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    # optional dependency, only needed for the parquet export
+    pa = None
+    pq = None
+
+
+class ParquetGraphWriter:
+    """
+    Writes node and edge records into parquet files, so that a translated model can be analysed with
+    columnar engines (e.g. DuckDB or Spark) without a neo4j instance.
+    Nodes are written into one table per entity type (nodes/<EntityType>.parquet) with one typed column per
+    attribute, edges are written into a single table (edges.parquet). Records are buffered per table and
+    flushed as row groups, so the translation can stream into the files.
+    The columns of a node table are the union of the attribute names of its records. If a row group adds a column
+    or needs a wider type (e.g. float after int, string after mixed values), the following row groups go into a
+    part file with the widened schema and the parts are merged when the writer gets closed.
+    """
+
+    EDGE_SCHEMA_FIELDS = [
+        ('source', 'int64'),
+        ('target', 'int64'),
+        ('rel_type', 'string'),
+        ('list_item', 'int32'),
+        ('edge_type', 'string'),
+        ('derived_from', 'int64'),
+    ]
+
+    def __init__(self, directory: str, row_group_size: int = 10000, compression: str = 'zstd'):
+        """
+
+        @param directory: output directory, gets created if it doesn't exist
+        @param row_group_size: number of rows per row group
+        @param compression: parquet compression codec
+        """
+        if pa is None:
+            raise Exception('The parquet export requires pyarrow. Please install it via pip install pyarrow')
+
+        self.directory = directory
+        self.row_group_size = row_group_size
+        self.compression = compression
+        os.makedirs(os.path.join(directory, 'nodes'), exist_ok=True)
+
+        # entity type -> (ParquetWriter, attribute names, arrow schema) of the current part file
+        self._node_writers = {}
+        # entity type -> list of (path, arrow schema) of its part files, see __merge_parts()
+        self._node_parts = {}
+        self._node_buffers = {}
+
+        self._edge_writer = None
+        self._edge_buffer = []
+
+        self.nodes_written = 0
+        self.edges_written = 0
+
+    def add_node(self, node):
+        """
+        appends a node record, flushes the table of its entity type once a row group is complete
+        @param node: NodeRecord
+        """
+        buffer = self._node_buffers.setdefault(node.entity_type, [])
+        buffer.append(node)
+        if len(buffer) >= self.row_group_size:
+            self.__flush_nodes(node.entity_type)
+
+    def add_edge(self, edge, edge_type: str = 'rel'):
+        """
+        appends an edge record, flushes the edge table once a row group is complete
+        @param edge: EdgeRecord
+        @param edge_type: rel for the translated associations or shortcut for derived edges
+        """
+        self._edge_buffer.append((edge, edge_type))
+        if len(self._edge_buffer) >= self.row_group_size:
+            self.__flush_edges()
+
+    def close(self):
+        """
+        flushes all buffers and finalizes the files
+        """
+        for entity_type in list(self._node_buffers.keys()):
+            self.__flush_nodes(entity_type)
+        self.__flush_edges()
+
+        for writer, _, _ in self._node_writers.values():
+            writer.close()
+        for entity_type in self._node_parts:
+            self.__merge_parts(entity_type)
+        if self._edge_writer is not None:
+            self._edge_writer.close()
+        self._node_writers = {}
+        self._edge_writer = None
+
+    # -- helpers --
+
+    def __flush_nodes(self, entity_type: str):
+        nodes = self._node_buffers.pop(entity_type, [])
+        if len(nodes) == 0:
+            return
+
+        writer, names, schema = self._node_writers.get(entity_type, (None, (), None))
+
+        # union of the attribute names, e.g. records with additional properties
+        group_names = list(names)
+        known = set(names)
+        for node in nodes:
+            if node.names is not names:
+                for name in node.names:
+                    if name not in known:
+                        known.add(name)
+                        group_names.append(name)
+
+        rows = []
+        for node in nodes:
+            if node.names is names:
+                rows.append(node.values)
+            else:
+                attrs = dict(zip(node.names, node.values))
+                rows.append([attrs.get(name) for name in group_names])
+
+        group_types = [self.__infer_type([row[i] for row in rows if i < len(row)])
+                       for i in range(len(group_names))]
+        fits = schema is not None and len(group_names) == len(names) and \
+            all(self.__widen(schema.field(name).type, t) == schema.field(name).type
+                for name, t in zip(group_names, group_types))
+
+        if not fits:
+            # the columns of the written row groups can't hold this one, continue in a new part file
+            # with the widened schema, the parts get merged on close()
+            fields = [pa.field('p21_id', pa.int64()), pa.field('node_type', pa.string())]
+            for name, t in zip(group_names, group_types):
+                if schema is not None and name in names:
+                    t = self.__widen(schema.field(name).type, t)
+                fields.append(pa.field(name, t))
+            schema = pa.schema(fields)
+            if writer is not None:
+                writer.close()
+            parts = self._node_parts.setdefault(entity_type, [])
+            path = os.path.join(self.directory, 'nodes', '{}.parquet'.format(entity_type))
+            if len(parts) > 0:
+                path += '.part{}'.format(len(parts))
+            parts.append((path, schema))
+            writer = pq.ParquetWriter(path, schema, compression=self.compression)
+            names = tuple(group_names)
+            self._node_writers[entity_type] = (writer, names, schema)
+
+        columns = {'p21_id': [node.p21_id for node in nodes],
+                   'node_type': [node.node_type for node in nodes]}
+        for i, name in enumerate(names):
+            field_type = schema.field(name).type
+            columns[name] = [self.__coerce(row[i], field_type) if i < len(row) else None for row in rows]
+
+        writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+        self.nodes_written += len(nodes)
+
+    def __merge_parts(self, entity_type: str):
+        """
+        rewrites the part files of an entity type into a single table with the widened schema of all parts
+        """
+        parts = self._node_parts.get(entity_type, [])
+        if len(parts) < 2:
+            return
+
+        schema = parts[0][1]
+        for _, part_schema in parts[1:]:
+            fields = []
+            for field in schema:
+                if field.name in part_schema.names:
+                    field = pa.field(field.name, self.__widen(field.type, part_schema.field(field.name).type))
+                fields.append(field)
+            fields += [field for field in part_schema if field.name not in schema.names]
+            schema = pa.schema(fields)
+
+        path = parts[0][0]
+        tmp_path = path + '.tmp'
+        with pq.ParquetWriter(tmp_path, schema, compression=self.compression) as writer:
+            for part_path, _ in parts:
+                part = pq.ParquetFile(part_path)
+                for i in range(part.num_row_groups):
+                    values = part.read_row_group(i).to_pydict()
+                    count = len(values['p21_id'])
+                    columns = {field.name: [self.__coerce(v, field.type)
+                                            for v in values.get(field.name, [None] * count)]
+                               for field in schema}
+                    writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+        os.replace(tmp_path, path)
+        for part_path, _ in parts[1:]:
+            os.remove(part_path)
+        self._node_parts[entity_type] = [(path, schema)]
+
+    def __flush_edges(self):
+        if len(self._edge_buffer) == 0:
+            return
+
+        if self._edge_writer is None:
+            schema = pa.schema([pa.field(name, getattr(pa, type_name)())
+                                for name, type_name in self.EDGE_SCHEMA_FIELDS])
+            self._edge_writer = pq.ParquetWriter(os.path.join(self.directory, 'edges.parquet'),
+                                                 schema, compression=self.compression)
+
+        columns = {
+            'source': [edge.source for edge, _ in self._edge_buffer],
+            'target': [edge.target for edge, _ in self._edge_buffer],
+            'rel_type': [edge.rel_type for edge, _ in self._edge_buffer],
+            'list_item': [edge.list_item for edge, _ in self._edge_buffer],
+            'edge_type': [edge_type for _, edge_type in self._edge_buffer],
+            'derived_from': [edge.derived_from for edge, _ in self._edge_buffer],
+        }
+        self._edge_writer.write_table(pa.Table.from_pydict(columns, schema=self._edge_writer.schema))
+        self.edges_written += len(self._edge_buffer)
+        self._edge_buffer = []
+
+    @staticmethod
+    def __infer_type(values: list):
+        """
+        @param values: attribute values of a column
+        @return: arrow type holding all values, mixed values and aggregations are stored as string,
+                 null if all values are None
+        """
+        values = [v for v in values if v is not None]
+        if len(values) == 0:
+            return pa.null()
+        if all(isinstance(v, list) for v in values):
+            # ordered p21 ids of compact aggregations
+            return pa.list_(pa.int64())
+        if all(isinstance(v, bool) for v in values):
+            return pa.bool_()
+        if all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+            return pa.int64()
+        if all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            return pa.float64()
+        return pa.string()
+
+    @staticmethod
+    def __widen(a, b):
+        """
+        @return: arrow type holding the values of both types: integers widen to floats, everything else to string
+        """
+        if a == b or b == pa.null():
+            return a
+        if a == pa.null():
+            return b
+        if {a, b} == {pa.int64(), pa.float64()}:
+            return pa.float64()
+        return pa.string()
+
+    @staticmethod
+    def __coerce(val, field_type):
+        """
+        converts a value into the type of its column, raises a ValueError if the value doesn't fit
+        """
+        if val is None:
+            return None
+        if field_type == pa.string():
+            # same representation as the node properties in neo4j
+            return str(val)
+        if field_type == pa.list_(pa.int64()) and isinstance(val, list):
+            return val
+        if field_type == pa.bool_() and isinstance(val, bool):
+            return val
+        if field_type == pa.int64() and isinstance(val, int) and not isinstance(val, bool):
+            return val
+        if field_type == pa.float64() and isinstance(val, (int, float)) and not isinstance(val, bool):
+            return float(val)
+        raise ValueError('Value {!r} does not fit into a column of type {}'.format(val, field_type))
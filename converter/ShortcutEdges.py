@@ -0,0 +1,40 @@
+from GraphRecords import EdgeRecord
+
+# objectified relationships that get materialized as direct edges:
+# relationship class -> (attribute of the edge origin, attribute of the edge destination, shortcut rel_type)
+SHORTCUTS = {
+    'IfcRelDefinesByProperties': ('RelatedObjects', 'RelatingPropertyDefinition', 'HAS_PROPERTY_SET'),
+    'IfcRelDefinesByType': ('RelatedObjects', 'RelatingType', 'HAS_TYPE'),
+    'IfcRelContainedInSpatialStructure': ('RelatedElements', 'RelatingStructure', 'CONTAINED_IN'),
+    'IfcRelAggregates': ('RelatingObject', 'RelatedObjects', 'AGGREGATES'),
+    'IfcRelNests': ('RelatingObject', 'RelatedObjects', 'NESTS'),
+    'IfcRelAssociatesMaterial': ('RelatedObjects', 'RelatingMaterial', 'HAS_MATERIAL'),
+    'IfcRelAssociatesClassification': ('RelatedObjects', 'RelatingClassification', 'HAS_CLASSIFICATION'),
+    'IfcRelVoidsElement': ('RelatingBuildingElement', 'RelatedOpeningElement', 'HAS_OPENING'),
+    'IfcRelFillsElement': ('RelatedBuildingElement', 'RelatingOpeningElement', 'FILLS'),
+    'IfcRelAssignsToGroup': ('RelatedObjects', 'RelatingGroup', 'ASSIGNED_TO_GROUP'),
+}
+
+# relationship type of shortcut edges in the graph, the translated associations use 'rel'
+SHORTCUT_EDGE_TYPE = 'shortcut'
+
+
+def derive_shortcuts(rel_p21: int, rel_entity_type: str, edges: list):
+    """
+    derives the shortcut edges of an objectified relationship from its outgoing edges
+    @param rel_p21: p21 id of the relationship entity (i.e., the connection node)
+    @param rel_entity_type: class name of the relationship entity
+    @param edges: outgoing edges of the connection node as EdgeRecord
+    @return: generator of EdgeRecord
+    """
+    spec = SHORTCUTS.get(rel_entity_type)
+    if spec is None:
+        return
+    origin_attr, destination_attr, rel_type = spec
+
+    origins = [edge.target for edge in edges if edge.rel_type == origin_attr]
+    destinations = [edge.target for edge in edges if edge.rel_type == destination_attr]
+
+    for origin in origins:
+        for destination in destinations:
+            yield EdgeRecord(origin, destination, rel_type, derived_from=rel_p21)
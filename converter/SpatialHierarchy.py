@@ -0,0 +1,73 @@
+# relationships decomposing a spatial scope: relationship class -> (attribute of the whole, attribute of the parts)
+SCOPE_DECOMPOSITION = {
+    'IfcRelAggregates': ('RelatingObject', 'RelatedObjects'),
+    'IfcRelNests': ('RelatingObject', 'RelatedObjects'),
+    'IfcRelContainedInSpatialStructure': ('RelatingStructure', 'RelatedElements'),
+    'IfcRelVoidsElement': ('RelatingBuildingElement', 'RelatedOpeningElement'),
+    'IfcRelFillsElement': ('RelatingOpeningElement', 'RelatedBuildingElement'),
+}
+
+
+class SpatialHierarchy:
+    """
+    Spatial decomposition tree of a model (IfcProject > IfcSite > IfcBuilding > IfcBuildingStorey > ... > elements)
+    built from aggregation and containment relationships. Every node of the tree is encoded by
+    - a materialized path of p21 ids from the root, e.g. '/1/25/37'
+    - nested-set interval [left, right], so that all descendants of a node have left < their left < right
+    - the depth within the tree
+    These encodings are attached to the primary nodes, so that subtree and ancestor queries become range lookups.
+    """
+
+    def __init__(self):
+        self.children = {}
+        self.parent = {}
+        self.encodings = {}
+
+    def add_decomposition(self, parent_p21: int, child_p21: int):
+        """
+        adds a parent-child pair. Each node can only have one parent, further parents are ignored.
+        @param parent_p21: p21 id of the decomposed or containing entity
+        @param child_p21: p21 id of the part or contained entity
+        """
+        if child_p21 in self.parent or child_p21 == parent_p21:
+            return
+        self.parent[child_p21] = parent_p21
+        self.children.setdefault(parent_p21, []).append(child_p21)
+
+    def encode(self):
+        """
+        calculates path, interval and depth of every node in the tree
+        @return: the hierarchy itself
+        """
+        roots = sorted(p for p in self.children if p not in self.parent)
+        counter = 0
+
+        for root in roots:
+            # iterative depth-first traversal, children are visited in p21 order
+            stack = [(root, '/{}'.format(root), 0, False)]
+            while stack:
+                node, path, depth, visited = stack.pop()
+                if visited:
+                    self.encodings[node]['hierarchy_right'] = counter
+                    counter += 1
+                    continue
+                if node in self.encodings:
+                    # guard against cyclic decompositions
+                    continue
+
+                self.encodings[node] = {'hierarchy_path': path,
+                                        'hierarchy_left': counter,
+                                        'hierarchy_depth': depth}
+                counter += 1
+                stack.append((node, path, depth, True))
+                for child in sorted(self.children.get(node, []), reverse=True):
+                    stack.append((child, '{}/{}'.format(path, child), depth + 1, False))
+
+        return self
+
+    def get_encoding(self, p21_id: int) -> dict:
+        """
+        @param p21_id: p21 id of a node
+        @return: dict of hierarchy properties or None if the node isn't part of the spatial decomposition
+        """
+        return self.encodings.get(p21_id)
@@ -1,3 +1,5 @@
+import copy
+
 from dotenv import dotenv_values
 from neo4j import GraphDatabase
 
@@ -15,10 +17,13 @@ class Neo4jConnector:
             self.uri = "bolt:localhost:7687"
             self.user = "neo4j"
             self.password = "password"
+            self.database = None
         else:
             self.uri = config["NEO4J-URI"]
             self.user = config["NEO4J-USER"]
             self.password = config["NEO4J-PASSWORD"]
+            # None addresses the default database of the server
+            self.database = config.get("NEO4J-DATABASE")
 
     # methods
     def connect_driver(self):
@@ -32,18 +37,19 @@ class Neo4jConnector:
         except self.my_driver:
             raise Exception("Oops!  Connection failed.  Try again...")
 
-    def run_cypher_statement(self, statement, postStatement=None):
+    def run_cypher_statement(self, statement, postStatement=None, parameters=None):
         """
         executes a given cypher statement and does some post processing if stated
         @statement: cypher command
         @postStatement: post processing of response
+        @parameters: optional dict of query parameters referenced as $name in the statement
         @return
         """
 
         try:
-            with self.my_driver.session() as session:
+            with self.my_driver.session(database=self.database) as session:
                 with session.begin_transaction() as tx:
-                    res = tx.run(statement)
+                    res = tx.run(statement, parameters)
                     return_val = []
 
                     if postStatement != None:
@@ -56,8 +62,56 @@ class Neo4jConnector:
                             # print(record)
                             return_val.append(record)
                 return return_val
-        except:
-            raise Exception('Error in neo4j Connector.')
+        except Exception as e:
+            # keep the driver error as cause, e.g. to detect transient errors that can be retried
+            raise Exception('Error in neo4j Connector.') from e
+
+    def stream_cypher_statement(self, statement, chunk_size=1000, parameters=None):
+        """
+        executes a given cypher statement and yields the response in chunks of records.
+        Records are pulled from the server while the chunks are consumed, so large results never
+        have to be held in memory at once.
+        @statement: cypher command
+        @chunk_size: number of records per yielded chunk
+        @parameters: optional dict of query parameters
+        @return: generator of record lists
+        """
+
+        with self.my_driver.session(database=self.database, fetch_size=chunk_size) as session:
+            with session.begin_transaction() as tx:
+                res = tx.run(statement, parameters)
+                chunk = []
+                for record in res:
+                    chunk.append(record)
+                    if len(chunk) == chunk_size:
+                        yield chunk
+                        chunk = []
+                if len(chunk) > 0:
+                    yield chunk
+
+    def for_database(self, database):
+        """
+        returns a connector sharing the driver of this instance, which runs all statements against another database
+        @database: name of the database, None for the default database
+        @return: Neo4jConnector
+        """
+        connector = copy.copy(self)
+        connector.database = database
+        return connector
+
+    def run_system_statement(self, statement, parameters=None):
+        """
+        executes an administration command (e.g. CREATE DATABASE) against the system database.
+        Administration commands are run in an auto-commit transaction
+        @statement: cypher command
+        @parameters: optional dict of query parameters
+        @return: list of records
+        """
+        try:
+            with self.my_driver.session(database='system') as session:
+                return list(session.run(statement, parameters))
+        except Exception as e:
+            raise Exception('Error in neo4j Connector.') from e
 
     def disconnect_driver(self):
         """
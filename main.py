@@ -1,6 +1,7 @@
 from dotenv import dotenv_values
 from converter.neo4jConnector import Neo4jConnector
 from converter.Ifc2GraphTranslator import IFCGraphGenerator
+from converter.ConversionMetrics import ConversionMetrics
 
 
 def run_translation():
@@ -15,9 +16,14 @@ def run_translation():
     connector = Neo4jConnector(config=config)
     connector.connect_driver()
 
+    # optional metrics endpoint, e.g. to scrape a running container
+    metrics = None
+    if config.get("METRICS-PORT"):
+        metrics = ConversionMetrics(port=int(config["METRICS-PORT"]), host="0.0.0.0")
+
     graph_generator = IFCGraphGenerator(
         connector, file_file_path, write_to_file=True)
-    graph_generator.generateGraph()
+    graph_generator.generateGraph(metrics=metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,14 @@
+import os
+
+import pytest
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+
+@pytest.fixture
+def sample_model():
+    """
+    path of a small IFC4 model with a spatial structure, a wall with a property set, a trimmed curve
+    and a polyline
+    """
+    return os.path.join(DATA_DIR, 'sample.ifc')
@@ -0,0 +1,128 @@
+import re
+import threading
+
+
+class Interrupted(Exception):
+    """
+    raised by FakeNeo4j once the configured number of rows has been committed
+    """
+
+
+class FakeNeo4j:
+    """
+    connector stand-in understanding the statements of Neo4jBatchLoader, Neo4jSink and ModelRegistry.
+    A batch and its checkpoint are committed together, as in a transaction.
+    """
+
+    def __init__(self):
+        # node id -> (labels, properties)
+        self.nodes = {}
+        # list of (source node id, relationship type, properties, target node id)
+        self.edges = []
+        # (label, phase, group) -> (import key, rows)
+        self.checkpoints = {}
+        # label -> properties of the registry node
+        self.registry = {}
+        self.statements = []
+        self.next_id = 0
+        # number of batch rows after which commits fail, None never interrupts
+        self.interrupt_after = None
+        self.rows_committed = 0
+        self._lock = threading.Lock()
+
+    def run_cypher_statement(self, statement, postStatement=None, parameters=None):
+        parameters = parameters or {}
+        with self._lock:
+            self.statements.append(statement)
+            if statement.startswith('UNWIND $rows'):
+                return self.__commit_batch(statement, parameters)
+            if 'RETURN c.import_key, c.phase, c.group, c.rows' in statement:
+                return [[key, phase, group, rows] for (label, phase, group), (key, rows) in self.checkpoints.items()
+                        if label == parameters['label']]
+            if statement.startswith('MATCH (c:ImportCheckpoint'):
+                self.checkpoints = {k: v for k, v in self.checkpoints.items() if k[0] != parameters['label']}
+                return []
+            if statement.startswith('MERGE (r:ModelRegistry'):
+                self.registry[parameters['label']] = dict(parameters['props'], label=parameters['label'])
+                return []
+            match = re.match(r"MATCH \(r:ModelRegistry \{label: '(\w+)'\}\) (RETURN|DELETE) r", statement)
+            if match is not None:
+                if match.group(2) == 'DELETE':
+                    self.registry.pop(match.group(1), None)
+                    return []
+                return [self.registry[match.group(1)]] if match.group(1) in self.registry else []
+            match = re.match(r'MATCH ?\(n:(\w+)\) (DETACH DELETE n|RETURN ID\(n\) LIMIT 1|RETURN n.EntityType)',
+                             statement)
+            if match is not None:
+                ids = self.node_ids(match.group(1))
+                if match.group(2) == 'DETACH DELETE n':
+                    for node_id in ids:
+                        del self.nodes[node_id]
+                    self.edges = [edge for edge in self.edges if edge[0] not in ids and edge[3] not in ids]
+                    return []
+                if match.group(2).startswith('RETURN ID'):
+                    return [[node_id] for node_id in sorted(ids)[:1]]
+                counts = {}
+                for node_id in ids:
+                    entity_type = self.nodes[node_id][1]['EntityType']
+                    counts[entity_type] = counts.get(entity_type, 0) + 1
+                return [{'entity_type': k, 'count': v} for k, v in counts.items()]
+            match = re.match(r'MATCH \(n:(\w+)\)-\[r\]->\(\)', statement)
+            if match is not None:
+                ids = self.node_ids(match.group(1))
+                counts = {}
+                for source, rel, props, _ in self.edges:
+                    if source in ids:
+                        rel_type = props['rel_type'] if rel == 'rel' else '{}:{}'.format(rel, props['rel_type'])
+                        counts[rel_type] = counts.get(rel_type, 0) + 1
+                return [{'rel_type': k, 'count': v} for k, v in counts.items()]
+            # indexes and constraints
+            return []
+
+    def stream_cypher_statement(self, statement, chunk_size=1000, parameters=None):
+        # node ids of a model, see Neo4jBatchLoader.fetch_node_ids
+        label = re.match(r'MATCH \(n:(\w+)\) RETURN n.p21_id, ID\(n\)', statement).group(1)
+        with self._lock:
+            records = [[self.nodes[node_id][1]['p21_id'], node_id] for node_id in sorted(self.node_ids(label))]
+        for i in range(0, len(records), chunk_size):
+            yield records[i:i + chunk_size]
+
+    def node_ids(self, label: str) -> set:
+        return {node_id for node_id, (labels, _) in self.nodes.items() if label in labels}
+
+    def edge_rows(self) -> list:
+        """
+        @return: edges as (source p21 id, relationship type, rel_type, listItem, target p21 id)
+        """
+        return [(self.nodes[s][1]['p21_id'], rel, props['rel_type'], props.get('listItem'), self.nodes[t][1]['p21_id'])
+                for s, rel, props, t in self.edges]
+
+    def __commit_batch(self, statement, parameters):
+        rows = parameters['rows']
+        if self.interrupt_after is not None and self.rows_committed + len(rows) > self.interrupt_after:
+            raise Interrupted()
+        ids = []
+        if 'MATCH (source)' in statement:
+            rel = re.search(r'\[r:(\w+)\]', statement).group(1)
+            for row in rows:
+                if 'MERGE (source)' in statement and any(
+                        edge[0] == row['s'] and edge[1] == rel and edge[3] == row['t'] for edge in self.edges):
+                    continue
+                self.edges.append((row['s'], rel, dict(row['props']), row['t']))
+        else:
+            labels = tuple(re.search(r'\(n:([\w:]+)', statement).group(1).split(':'))
+            for row in rows:
+                existing = [node_id for node_id in self.node_ids(labels[0])
+                            if 'MERGE (n' in statement and self.nodes[node_id][1]['p21_id'] == row['p21_id']]
+                if existing:
+                    node_id = existing[0]
+                    self.nodes[node_id][1].update(row)
+                else:
+                    node_id = self.next_id
+                    self.next_id += 1
+                    self.nodes[node_id] = (labels, dict(row))
+                ids.append([row['p21_id'], node_id])
+        self.rows_committed += len(rows)
+        self.checkpoints[(parameters['label'], parameters['phase'], parameters['group'])] = \
+            (parameters['import_key'], parameters['committed'])
+        return [{'ids': ids}]
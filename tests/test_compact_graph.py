@@ -0,0 +1,112 @@
+import pytest
+
+from CompactGraph import CompactGraph, PropertyColumn
+
+
+def build_graph() -> CompactGraph:
+    """
+    wall 10 and slab 11 contained in storey 20 via the connection node 30, wall 10 placed by 40 relative to 41
+    """
+    graph = CompactGraph()
+    graph.add_node(20, 'PrimaryNode', 'IfcBuildingStorey', {'Name': 'Level 1', 'Elevation': 0.0})
+    graph.add_node(10, 'PrimaryNode', 'IfcWall', {'Name': 'Wall 1', 'p21_id': 10, 'EntityType': 'IfcWall'})
+    graph.add_node(11, 'PrimaryNode', 'IfcSlab', {'Name': None})
+    graph.add_node(30, 'ConnectionNode', 'IfcRelContainedInSpatialStructure', {})
+    graph.add_node(40, 'SecondaryNode', 'IfcLocalPlacement', None)
+    graph.add_node(41, 'SecondaryNode', 'IfcLocalPlacement', None)
+    graph.add_edge(30, 20, 'RelatingStructure')
+    graph.add_edge(30, 10, 'RelatedElements', 0)
+    graph.add_edge(30, 11, 'RelatedElements', 1)
+    graph.add_edge(10, 40, 'ObjectPlacement')
+    graph.add_edge(40, 41, 'PlacementRelTo')
+    # dangling edges are dropped
+    graph.add_edge(41, 99, 'RelativePlacement')
+    return graph.finalize()
+
+
+def test_structure():
+    graph = build_graph()
+    assert graph.node_count() == 6
+    assert graph.edge_count() == 5
+    assert graph.has_node(30) and not graph.has_node(99)
+    assert graph.get_node_type(30) == 'ConnectionNode'
+    assert graph.get_entity_type(40) == 'IfcLocalPlacement'
+    assert sorted(graph.get_child_nodes(30)) == [(10, 'RelatedElements', 0), (11, 'RelatedElements', 1),
+                                                 (20, 'RelatingStructure', None)]
+    assert graph.get_parent_nodes(10) == [(30, 'RelatedElements', 0)]
+    assert graph.get_child_nodes(41) == []
+
+
+def test_get_node():
+    graph = build_graph()
+    assert graph.get_node(20) == {'p21_id': 20, 'EntityType': 'IfcBuildingStorey', 'NodeType': 'PrimaryNode',
+                                  'Name': 'Level 1', 'Elevation': 0.0}
+    assert graph.get_node(11) == {'p21_id': 11, 'EntityType': 'IfcSlab', 'NodeType': 'PrimaryNode'}
+    with pytest.raises(Exception):
+        graph.get_node(99)
+
+
+def test_traversals():
+    graph = build_graph()
+    assert graph.get_directed_path(30, 41) == [30, 10, 40, 41]
+    assert graph.get_directed_path(30, 41, max_length=2) is None
+    assert graph.get_directed_path(41, 30) is None
+    assert sorted(graph.get_distinct_paths_from_node(30)) == [[30, 10, 40, 41], [30, 11], [30, 20]]
+    assert sorted(graph.get_hierarchical_prim_nodes(10)) == [11, 20]
+    assert graph.get_hierarchical_prim_nodes(10, exclude_p21_ids=[20]) == [11]
+
+
+def test_requires_finalize():
+    graph = CompactGraph()
+    graph.add_node(1, 'PrimaryNode', 'IfcWall')
+    with pytest.raises(Exception):
+        graph.get_node(1)
+    graph.finalize()
+    with pytest.raises(Exception):
+        graph.add_node(2, 'PrimaryNode', 'IfcWall')
+
+
+def test_property_columns_are_typed():
+    column = PropertyColumn(1.5)
+    for pos, val in enumerate([1.5, 2.0, -3.25]):
+        column.append(pos, val)
+    assert column.values.typecode == 'd'
+    assert [column.get(i) for i in range(len(column))] == [1.5, 2.0, -3.25]
+
+    column = PropertyColumn(True)
+    column.append(0, True)
+    column.append(1, False)
+    assert column.values.typecode == 'b'
+    assert column.get(1) is False
+
+    column = PropertyColumn('Level 1')
+    for pos, val in enumerate(['Level 1', 'Level 2', 'Level 1']):
+        column.append(pos, val)
+    # strings are stored once, nodes hold codes
+    assert column.table == ['Level 1', 'Level 2']
+    assert list(column.values) == [0, 1, 0]
+
+
+def test_property_column_falls_back_to_code_table():
+    column = PropertyColumn(1)
+    values = [1, 2, 2.5, True, 'x', (0.0, 1.0), [1, 2], (0.0, 1.0)]
+    for pos, val in enumerate(values):
+        column.append(pos, val)
+    assert column.values.typecode == 'L'
+    restored = [column.get(i) for i in range(len(column))]
+    assert restored == values
+    assert [type(v) for v in restored] == [type(v) for v in values]
+    assert column.table.count((0.0, 1.0)) == 1
+
+
+def test_build_from_model(sample_model):
+    pytest.importorskip('ifcopenshell')
+    from Ifc2GraphTranslator import IFCGraphGenerator
+
+    graph = IFCGraphGenerator(None, sample_model, write_to_file=True).build_compact_graph()
+    assert graph.node_count() == 35
+    # wall -> placement -> storey placement -> building placement -> site placement
+    assert graph.get_directed_path(17, 7) == [17, 16, 11, 9, 7]
+    assert graph.get_node(17)['Name'] == 'Wall 1'
+    assert graph.get_node(1)['Coordinates'] == (0.0, 0.0, 0.0)
+    assert sorted(graph.get_hierarchical_prim_nodes(17)) == [12]
@@ -0,0 +1,117 @@
+import pytest
+
+pytest.importorskip('ifcopenshell')
+
+from Ifc2GraphTranslator import IFCGraphGenerator
+
+# placement chain of the wall: local placements #16 > #11 > #9 > #7, their axis placement #2 and its origin #1
+WALL_CLOSURE = [1, 2, 7, 9, 11, 16, 17]
+REPRESENTATION_ITEMS = [1, 2, 25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35]
+
+
+def translate(sample_model, **selection):
+    generator = IFCGraphGenerator(None, sample_model, write_to_file=True, **selection)
+    nodes = [node.p21_id for node in generator.iter_node_rows()]
+    edges = [(edge.source, edge.rel_type, edge.target) for edge in generator.iter_edge_rows()]
+    return generator, nodes, edges
+
+
+def assert_no_dangling_edges(nodes, edges):
+    assert all(source in nodes and target in nodes for source, _, target in edges)
+
+
+def test_without_filters_everything_is_translated(sample_model):
+    generator, nodes, _ = translate(sample_model)
+    assert generator.select_entities() is None
+    assert sorted(nodes) == list(range(1, 36))
+    assert len(generator.skipped_entities) == 0
+
+
+def test_include_classes(sample_model):
+    generator, nodes, edges = translate(sample_model, include_classes=['IfcWall'])
+    assert nodes == [17]
+    # edges to skipped entities are dropped
+    assert edges == []
+    assert sum(generator.skipped_entities.values()) == 34
+    assert generator.skipped_entities['IfcCartesianPoint'] == 8
+    assert 'IfcWall' not in generator.skipped_entities
+
+
+def test_include_classes_with_reference_closure(sample_model):
+    generator, nodes, edges = translate(sample_model, include_classes=['IfcWall'], keep_reference_closure=True)
+    assert sorted(nodes) == WALL_CLOSURE
+    assert (17, 'ObjectPlacement', 16) in edges and (16, 'PlacementRelTo', 11) in edges
+    assert_no_dangling_edges(nodes, edges)
+    # entities pulled in by the closure don't count as skipped
+    assert sum(generator.skipped_entities.values()) == 35 - len(WALL_CLOSURE)
+    assert generator.skipped_entities['IfcCartesianPoint'] == 7
+    assert 'IfcLocalPlacement' not in generator.skipped_entities
+
+
+def test_exclude_classes(sample_model):
+    generator, nodes, edges = translate(sample_model, exclude_classes=['IfcRepresentationItem'])
+    assert sorted(nodes) == [p21_id for p21_id in range(1, 36) if p21_id not in REPRESENTATION_ITEMS]
+    assert_no_dangling_edges(nodes, edges)
+    assert generator.skipped_entities == {'IfcCartesianPoint': 8, 'IfcAxis2Placement3D': 1, 'IfcAxis2Placement2D': 1,
+                                          'IfcCircle': 1, 'IfcTrimmedCurve': 1, 'IfcPolyline': 1}
+
+    # the closure brings back the placement referenced by the local placements, but not the unreferenced geometry
+    generator, nodes, edges = translate(sample_model, exclude_classes=['IfcRepresentationItem'],
+                                        keep_reference_closure=True)
+    assert sorted(nodes) == list(range(1, 25))
+    assert (7, 'RelativePlacement', 2) in edges
+    assert_no_dangling_edges(nodes, edges)
+    assert sum(generator.skipped_entities.values()) == 11
+
+
+def test_include_and_exclude_classes(sample_model):
+    # subclasses are included and excluded as well
+    _, nodes, _ = translate(sample_model, include_classes=['IfcProduct'], exclude_classes=['IfcSpatialElement'])
+    assert nodes == [17]
+
+
+def test_selection_is_part_of_the_import_key(sample_model):
+    keys = {translate(sample_model, **selection)[0].import_key(False, False)
+            for selection in [{}, {'include_classes': ['IfcWall']},
+                              {'include_classes': ['IfcWall'], 'keep_reference_closure': True}]}
+    assert len(keys) == 3
+
+
+STOREY = '2j$IDTaab4jhouhINFmNyf'
+SITE = '2mbfOP9g5Etwm_jf0HSZh8'
+
+
+def test_spatial_scope_of_a_storey(sample_model):
+    generator, nodes, edges = translate(sample_model, spatial_scope=[STOREY])
+    # the storey, its wall, their relationships, the property set and the placements
+    assert sorted(nodes) == [1, 2, 7, 9, 11, 12, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24]
+    # the aggregation of the storey is kept, but not the building outside the scope
+    assert 10 not in nodes
+    assert (15, 'RelatedObjects', 12) in edges and (15, 'RelatingObject', 10) not in edges
+    assert_no_dangling_edges(nodes, edges)
+    assert generator.skipped_entities['IfcBuilding'] == 1
+    assert generator.skipped_entities['IfcRelAggregates'] == 2
+    # geometry that isn't referenced by the scope is skipped
+    assert 35 not in nodes and 29 not in nodes
+
+
+def test_spatial_scope_of_a_site(sample_model):
+    _, nodes, edges = translate(sample_model, spatial_scope=[SITE])
+    # building and storey are decomposed from the site, the wall is contained in the storey
+    assert {8, 10, 12, 17} <= set(nodes)
+    assert (14, 'RelatedObjects', 10) in edges and (18, 'RelatedElements', 17) in edges
+    assert_no_dangling_edges(nodes, edges)
+    assert 35 not in nodes
+
+
+def test_spatial_scope_combined_with_class_filter(sample_model):
+    _, nodes, _ = translate(sample_model, spatial_scope=[STOREY], include_classes=['IfcProduct'])
+    assert sorted(nodes) == [12, 17]
+
+
+def test_spatial_scope_must_be_a_spatial_element(sample_model):
+    wall = '3q7q0skWLBS98XuGvYn2MC'
+    for scope in [[wall], ['0000000000000000000000']]:
+        generator = IFCGraphGenerator(None, sample_model, write_to_file=True, spatial_scope=scope)
+        with pytest.raises(Exception, match='is not a spatial structure element'):
+            generator.select_entities()
@@ -0,0 +1,82 @@
+import pytest
+
+ifcopenshell = pytest.importorskip('ifcopenshell')
+
+from Graph2IfcSerializer import IFCP21Serializer, split_aggregate
+from Ifc2GraphTranslator import IFCGraphGenerator
+from Neo4jBatchLoader import cypher_value
+
+
+class GraphConnector:
+    """
+    serves the records of IFCGraphGenerator the way the database returns them to the serializer
+    """
+
+    def __init__(self, generator):
+        edges = {}
+        for edge in generator.iter_edge_rows():
+            edges.setdefault(edge.source, []).append([edge.rel_type, edge.list_item, edge.target])
+        self.records = []
+        for node in generator.iter_node_rows():
+            # neo4j doesn't store null properties
+            attrs = {k: cypher_value(v) for k, v in node.properties().items() if v is not None}
+            self.records.append({'p21_id': node.p21_id, 'entity_type': node.entity_type, 'attrs': attrs,
+                                 'edges': edges.get(node.p21_id, [])})
+
+    def stream_cypher_statement(self, statement, chunk_size=1000, parameters=None):
+        for i in range(0, len(self.records), chunk_size):
+            yield self.records[i:i + chunk_size]
+
+
+def normalize(value):
+    """
+    comparable form of an attribute value: references by p21 id, typed values with their type
+    """
+    if isinstance(value, ifcopenshell.entity_instance):
+        if value.id() != 0:
+            return '#{}'.format(value.id())
+        return value.is_a(), normalize(value.wrappedValue)
+    if isinstance(value, (tuple, list)):
+        return tuple(normalize(v) for v in value)
+    if isinstance(value, float):
+        return round(value, 9)
+    return value
+
+
+def entity_values(entity) -> list:
+    return [normalize(entity[i]) for i in range(len(entity))]
+
+
+def test_split_aggregate():
+    assert split_aggregate("(#25=IfcCartesianPoint((1.,0.)), IfcParameterValue(0.))") == \
+        ['#25=IfcCartesianPoint((1.,0.))', 'IfcParameterValue(0.)']
+    assert split_aggregate('(IfcParameterValue(90.),)') == ['IfcParameterValue(90.)']
+    assert split_aggregate("('a, b', 'c')") == ["'a, b'", "'c'"]
+    assert split_aggregate('abc') is None
+
+
+def test_round_trip(tmp_path, sample_model):
+    generator = IFCGraphGenerator(None, sample_model, write_to_file=True)
+    serializer = IFCP21Serializer(GraphConnector(generator), generator.timestamp, schema=generator.schema_name,
+                                  page_size=10)
+    path = str(tmp_path / 'serialized.ifc')
+    count = serializer.serialize(path)
+
+    original = ifcopenshell.open(sample_model)
+    serialized = ifcopenshell.open(path)
+    assert count == len(list(original))
+    assert sorted((e.id(), e.is_a()) for e in serialized) == sorted((e.id(), e.is_a()) for e in original)
+    for entity in original:
+        assert entity_values(serialized.by_id(entity.id())) == entity_values(entity), entity
+
+
+def test_nominal_value_keeps_its_measure_type(sample_model):
+    generator = IFCGraphGenerator(None, sample_model, write_to_file=True)
+    values = {node.p21_id: dict(zip(node.names, node.values)) for node in generator.iter_node_rows()
+              if node.entity_type == 'IfcPropertySingleValue'}
+    assert values[19]['NominalValue'] == 'IfcLengthMeasure(0.3)'
+
+    serializer = IFCP21Serializer(None, generator.timestamp, schema=generator.schema_name)
+    attrs = {'Name': 'Width', 'NominalValue': values[19]['NominalValue']}
+    assert serializer.format_entity(19, 'IfcPropertySingleValue', attrs, []) == \
+        "#19=IFCPROPERTYSINGLEVALUE('Width',$,IFCLENGTHMEASURE(0.3),$);"
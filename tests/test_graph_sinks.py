@@ -0,0 +1,125 @@
+from collections import Counter
+
+import pytest
+
+pytest.importorskip('ifcopenshell')
+
+from GraphSinks import NullSink, RecordingSink, CypherFileSink, Neo4jSink
+from Ifc2GraphTranslator import IFCGraphGenerator
+from ShortcutEdges import SHORTCUT_EDGE_TYPE
+from fake_neo4j import FakeNeo4j, Interrupted
+
+NODES = 35
+EDGES = 38
+SHORTCUTS = 5
+
+
+def write(sink, generator, derive_shortcuts: bool = False):
+    """
+    writes the records of a model into a sink in the order of IFCGraphGenerator.generateGraph
+    """
+    sink.begin(generator.timestamp)
+    sink.write_nodes(generator.iter_node_rows())
+    sink.write_edges(generator.iter_edge_rows())
+    if derive_shortcuts:
+        sink.write_edges(generator.iter_shortcut_rows(), edge_type=SHORTCUT_EDGE_TYPE, phase='shortcuts')
+    sink.close()
+    return sink
+
+
+@pytest.fixture
+def generator(sample_model):
+    return IFCGraphGenerator(None, sample_model, write_to_file=True)
+
+
+def test_null_sink(generator):
+    sink = write(NullSink(), generator, derive_shortcuts=True)
+    assert (sink.node_count, sink.edge_count) == (NODES, EDGES + SHORTCUTS)
+
+
+def test_recording_sink(generator):
+    sink = write(RecordingSink(), generator, derive_shortcuts=True)
+    assert sink.closed and sink.timestamp == generator.timestamp
+    assert len(sink.nodes) == NODES
+    assert Counter(edge_type for _, edge_type in sink.edges) == {'rel': EDGES, SHORTCUT_EDGE_TYPE: SHORTCUTS}
+    assert [node.p21_id for node in sink.nodes] == [node.p21_id for node in generator.iter_node_rows()]
+
+
+def test_cypher_file_sink(generator, capsys):
+    sink = write(CypherFileSink(), generator, derive_shortcuts=True)
+    assert len(sink.statements) == NODES + EDGES + SHORTCUTS
+    assert capsys.readouterr().out.splitlines() == sink.statements
+
+    # nodes first, then the edges addressing them by the variables of their nodes
+    assert sink.statements[0] == \
+        'MERGE(n35:{}:SecondaryNode:IfcPolyline {{p21_id:35, EntityType:"IfcPolyline"}}) '.format(generator.timestamp)
+    assert all(statement.startswith('MERGE(n') for statement in sink.statements[:NODES])
+    assert all(statement.startswith('MERGE (n') for statement in sink.statements[NODES:])
+
+
+def test_cypher_file_sink_relationship_types(generator):
+    # exported edges are typed rel and shortcut like the loaded ones, carrying the attribute name as rel_type
+    sink = write(CypherFileSink(), generator, derive_shortcuts=True)
+    edges = sink.statements[NODES:]
+    assert edges[0] == 'MERGE (n35)-[:rel {rel_type:"Points", listItem:0}]->(n30)'
+    assert edges[-1] == 'MERGE (n10)-[:shortcut {rel_type:"AGGREGATES", derived_from:15}]->(n12)'
+    rel_types = Counter(statement.split('-[:')[1].split(' ')[0] for statement in edges)
+    assert rel_types == {'rel': EDGES, SHORTCUT_EDGE_TYPE: SHORTCUTS}
+
+
+def test_neo4j_sink(generator):
+    database = FakeNeo4j()
+    sink = write(Neo4jSink(database, 'key', model_info=generator.model_info()), generator, derive_shortcuts=True)
+    assert sink.import_key == 'key:create' and not sink.resumed
+    assert len(database.nodes) == NODES
+    assert Counter(rel for _, rel, _, _, _ in database.edge_rows()) == {'rel': EDGES, SHORTCUT_EDGE_TYPE: SHORTCUTS}
+    # the import is complete and registered
+    assert database.checkpoints == {}
+    registry = database.registry[generator.timestamp]
+    assert (registry['node_count'], registry['edge_count'], registry['import_mode']) == \
+        (NODES, EDGES + SHORTCUTS, 'create')
+    # the label was empty, so the batches CREATE
+    batches = [statement for statement in database.statements if statement.startswith('UNWIND $rows')]
+    assert len(batches) > 0 and not any('MERGE (n' in batch or 'MERGE (source)' in batch for batch in batches)
+
+
+def test_neo4j_sink_overwrites_existing_graph(generator):
+    database = FakeNeo4j()
+    write(Neo4jSink(database, 'key'), generator)
+    write(Neo4jSink(database, 'other key'), generator)
+    assert any(statement.endswith('DETACH DELETE n') for statement in database.statements)
+    assert len(database.nodes) == NODES
+    assert len(database.edges) == EDGES
+
+
+def test_neo4j_sink_resumes_interrupted_import(generator):
+    database = FakeNeo4j()
+    database.interrupt_after = NODES + 10
+    with pytest.raises(Interrupted):
+        write(Neo4jSink(database, 'key', batch_size=5, target_latency=None), generator)
+    assert len(database.checkpoints) > 0 and generator.timestamp not in database.registry
+
+    database.interrupt_after = None
+    sink = write(Neo4jSink(database, 'key', batch_size=5, target_latency=None), generator)
+    assert sink.resumed
+    assert not any(statement.endswith('DETACH DELETE n') for statement in database.statements)
+    assert len(database.nodes) == NODES
+    assert Counter(database.edge_rows()) == Counter((e.source, 'rel', e.rel_type, e.list_item, e.target)
+                                                    for e in generator.iter_edge_rows())
+    assert database.registry[generator.timestamp]['node_count'] == NODES
+
+
+def test_neo4j_sink_merge_mode_doesnt_resume_create_mode(generator):
+    database = FakeNeo4j()
+    database.interrupt_after = NODES + 10
+    with pytest.raises(Interrupted):
+        write(Neo4jSink(database, 'key', batch_size=5, target_latency=None), generator)
+
+    # an import in merge mode has another key, it merges into the partial graph instead of resuming it
+    database.interrupt_after = None
+    sink = write(Neo4jSink(database, 'key', batch_size=5, target_latency=None, merge=True), generator)
+    assert sink.import_key == 'key:merge' and not sink.resumed
+    assert not any(statement.endswith('DETACH DELETE n') for statement in database.statements)
+    assert len(database.nodes) == NODES
+    assert database.registry[generator.timestamp]['import_mode'] == 'merge'
+    assert any('MERGE (n:' in statement for statement in database.statements if statement.startswith('UNWIND $rows'))
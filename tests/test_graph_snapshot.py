@@ -0,0 +1,88 @@
+import pytest
+
+from GraphRecords import NodeRecord, EdgeRecord, intern_names
+from GraphSnapshot import GraphSnapshot, file_hash
+from Neo4jBatchLoader import cypher_value
+
+
+def node_rows(records):
+    return [(node.p21_id, node.node_type, node.entity_type, node.names, node.values) for node in records]
+
+
+def edge_rows(records):
+    return [(edge.source, edge.target, edge.rel_type, edge.list_item) for edge in records]
+
+
+def test_round_trip(tmp_path):
+    nodes = [
+        NodeRecord(1, 'SecondaryNode', 'IfcCartesianPoint', intern_names(['Coordinates']), ((0.0, 1.0, 2.0),)),
+        NodeRecord(2, 'PrimaryNode', 'IfcWall', intern_names(['GlobalId', 'Name']), ('3q7q0skWLBS98XuGvYn2MC', None)),
+        NodeRecord(3, 'SecondaryNode', 'IfcPolyline', intern_names(['Points_p21_ids']), ([4, 5, 6],)),
+        NodeRecord(7, 'SecondaryNode', 'IfcCartesianPoint', intern_names(['Coordinates']), ((1.0, 1.0, 2.0),)),
+    ]
+    edges = [EdgeRecord(2, 1, 'ObjectPlacement'), EdgeRecord(3, 4, 'Points', 0), EdgeRecord(3, 5, 'Points', 1)]
+
+    snapshot = GraphSnapshot(source_hash='abc', timestamp='ts1')
+    for node in nodes:
+        snapshot.add_node(node)
+    for edge in edges:
+        snapshot.add_edge(edge)
+    path = str(tmp_path / 'model.snapshot')
+    snapshot.save(path)
+
+    loaded = GraphSnapshot.load(path)
+    assert loaded.node_count() == 4
+    assert loaded.edge_count() == 3
+    assert node_rows(loaded.iter_node_rows()) == node_rows(nodes)
+    assert edge_rows(loaded.iter_edge_rows()) == edge_rows(edges)
+    assert loaded.entity_types_by_p21('SecondaryNode') == {1: 'IfcCartesianPoint', 3: 'IfcPolyline',
+                                                           7: 'IfcCartesianPoint'}
+
+
+def test_ordered_p21_ids_stay_lists(tmp_path):
+    snapshot = GraphSnapshot()
+    snapshot.add_node(NodeRecord(3, 'SecondaryNode', 'IfcPolyline', intern_names(['Points_p21_ids']), ([4, 5, 6],)))
+    path = str(tmp_path / 'model.snapshot')
+    snapshot.save(path)
+
+    node = next(GraphSnapshot.load(path).iter_node_rows())
+    assert node.values == ([4, 5, 6],)
+    assert cypher_value(node.values[0]) == [4, 5, 6]
+
+
+def test_is_valid_for(tmp_path):
+    model = tmp_path / 'model.ifc'
+    model.write_text('ISO-10303-21;')
+    snapshot = GraphSnapshot(source_hash=None)
+    assert not snapshot.is_valid_for(str(model))
+
+    snapshot = GraphSnapshot(source_hash=file_hash(str(model)))
+    snapshot.meta['selection'] = {'include_classes': None}
+    assert snapshot.is_valid_for(str(model))
+    assert not snapshot.is_valid_for(str(model), selection={'include_classes': ['IfcWall']})
+
+
+def test_replay_matches_fresh_run(tmp_path, sample_model):
+    pytest.importorskip('ifcopenshell')
+    from Ifc2GraphTranslator import IFCGraphGenerator
+
+    def database_rows(generator):
+        nodes = [(node.p21_id, node.node_type, node.entity_type,
+                  {name: cypher_value(value) for name, value in zip(node.names, node.values)})
+                 for node in generator.iter_node_rows()]
+        return nodes, edge_rows(generator.iter_edge_rows())
+
+    snapshot_path = str(tmp_path / 'sample.snapshot')
+    fresh = IFCGraphGenerator(None, sample_model, write_to_file=True, compact_list_threshold=2)
+    # the first run writes the snapshot, the second one replays it from disk
+    IFCGraphGenerator(None, sample_model, write_to_file=True, compact_list_threshold=2, snapshot_path=snapshot_path)
+    replay = IFCGraphGenerator(None, sample_model, write_to_file=True, compact_list_threshold=2,
+                               snapshot_path=snapshot_path)
+    assert replay.snapshot is not None
+
+    fresh_nodes, fresh_edges = database_rows(fresh)
+    replay_nodes, replay_edges = database_rows(replay)
+    assert replay_nodes == fresh_nodes
+    assert replay_edges == fresh_edges
+    # the polyline's points are stored as list property, not as its string representation
+    assert any(isinstance(props.get('Points_p21_ids'), list) for _, _, _, props in replay_nodes)
@@ -0,0 +1,201 @@
+import re
+
+import pytest
+
+ifcopenshell = pytest.importorskip('ifcopenshell')
+
+from Ifc2GraphTranslator import IFCGraphGenerator
+from ModelDiff import ModelFingerprint, ChangeSet, diff_models, extract_rows
+from Neo4jBatchLoader import cypher_value
+from Neo4jQueryFactory import Neo4jQueryFactory
+
+
+class InMemoryGraph:
+    """
+    connector stand-in holding the graph of one model, understands the statements run by ChangeSet.apply
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        # node id -> properties
+        self.nodes = {}
+        # (source node id, rel_type, listItem, target node id)
+        self.edges = set()
+        self.next_id = 0
+
+    def add_node(self, props: dict) -> int:
+        node_id = self.next_id
+        self.next_id += 1
+        # neo4j doesn't store null properties
+        self.nodes[node_id] = {k: v for k, v in props.items() if v is not None}
+        return node_id
+
+    def node_by_p21(self, p21_id: int) -> int:
+        return next(node_id for node_id, props in self.nodes.items() if props['p21_id'] == p21_id)
+
+    def load(self, generator):
+        for node in generator.iter_node_rows():
+            self.add_node({k: cypher_value(v) for k, v in node.properties().items()})
+        for edge in generator.iter_edge_rows():
+            self.edges.add((self.node_by_p21(edge.source), edge.rel_type, edge.list_item,
+                            self.node_by_p21(edge.target)))
+
+    def graph(self) -> tuple:
+        """
+        @return: node properties by p21 id and edges by p21 ids
+        """
+        p21 = {node_id: props['p21_id'] for node_id, props in self.nodes.items()}
+        return ({props['p21_id']: props for props in self.nodes.values()},
+                {(p21[s], rel_type, item, p21[t]) for s, rel_type, item, t in self.edges})
+
+    def run_cypher_statement(self, statement, postStatement=None, parameters=None):
+        parameters = parameters or {}
+        if statement == Neo4jQueryFactory.delete_edges_by_p21_batch(self.label):
+            for row in parameters['rows']:
+                self.edges.discard((self.node_by_p21(row['s']), row['rel_type'], row['listItem'],
+                                    self.node_by_p21(row['t'])))
+        elif statement == Neo4jQueryFactory.delete_nodes_by_p21_batch(self.label):
+            for p21_id in parameters['p21_ids']:
+                node_id = self.node_by_p21(p21_id)
+                del self.nodes[node_id]
+                self.edges = {edge for edge in self.edges if node_id not in (edge[0], edge[3])}
+        elif statement == Neo4jQueryFactory.set_p21_ids_batch(self.label):
+            for row in parameters['rows']:
+                node = self.nodes[self.node_by_p21(row['old'])]
+                node.setdefault('p21_next', row['new'])
+        elif statement == Neo4jQueryFactory.commit_p21_ids(self.label):
+            pending = [props for props in self.nodes.values() if 'p21_next' in props][:parameters['limit']]
+            for props in pending:
+                props['p21_id'] = props.pop('p21_next')
+            return [[len(pending)]]
+        elif statement == Neo4jQueryFactory.set_node_properties_by_p21_batch(self.label):
+            for row in parameters['rows']:
+                self.nodes[self.node_by_p21(row['p21_id'])].update(row['props'])
+        elif 'CREATE (n:' in statement:
+            ids = [[row['p21_id'], self.add_node(row)] for row in parameters['rows']]
+            return [{'ids': ids}]
+        elif 'ID(source) = row.s' in statement:
+            for row in parameters['rows']:
+                self.edges.add((row['s'], row['props']['rel_type'], row['props'].get('listItem'), row['t']))
+            return [{'ids': []}]
+        # indexes, checkpoints and the registry node
+        return []
+
+    def stream_cypher_statement(self, statement, chunk_size=1000, parameters=None):
+        # node ids of the model, see Neo4jBatchLoader.fetch_node_ids
+        yield [[props['p21_id'], node_id] for node_id, props in self.nodes.items()]
+
+
+def shift_p21_ids(source: str, target: str, offset: int):
+    """
+    writes a copy of a model with all p21 ids shifted, i.e., the same content numbered differently
+    """
+    with open(source) as f:
+        content = f.read()
+    header, data = content.split('DATA;', 1)
+    data = re.sub(r'#(\d+)', lambda match: '#{}'.format(int(match.group(1)) + offset), data)
+    with open(target, 'w') as f:
+        f.write(header + 'DATA;' + data)
+
+
+def revise(source: str, target: str):
+    """
+    writes an updated revision: a renamed wall, a removed property and a polyline with an additional point
+    """
+    model = ifcopenshell.open(source)
+    model.by_type('IfcWall')[0].Name = 'Wall 1a'
+    pset = model.by_type('IfcPropertySet')[0]
+    layers = [prop for prop in pset.HasProperties if prop.Name == 'Layers'][0]
+    pset.HasProperties = [prop for prop in pset.HasProperties if prop != layers]
+    model.remove(layers)
+    polyline = model.by_type('IfcPolyline')[0]
+    polyline.Points = polyline.Points + (model.createIfcCartesianPoint((5., 1.)),)
+    model.write(target)
+
+
+def test_identical_models_have_no_changes(sample_model):
+    fingerprint = ModelFingerprint.of_model(sample_model)
+    assert fingerprint.node_count() == 35
+    assert list(fingerprint.node_key) == sorted(fingerprint.node_key)
+
+    summary = diff_models(sample_model, sample_model, processes=1).summary()
+    assert summary['matched_nodes'] == 35
+    assert summary['modified_nodes'] == summary['added_nodes'] == summary['removed_nodes'] == 0
+    assert summary['added_edges'] == summary['removed_edges'] == 0
+
+
+def test_snapshot_replay_has_the_same_fingerprint(tmp_path, sample_model):
+    snapshot_path = str(tmp_path / 'sample.snapshot')
+    fresh = ModelFingerprint.of_model(sample_model)
+    ModelFingerprint.of_model(sample_model, snapshot_path)
+    replayed = ModelFingerprint.of_model(sample_model, snapshot_path)
+    assert replayed.node_key == fresh.node_key
+    assert replayed.node_attr == fresh.node_attr
+    assert replayed.edge_key == fresh.edge_key
+
+
+def test_renumbered_model_matches(tmp_path, sample_model):
+    shifted = str(tmp_path / 'shifted.ifc')
+    shift_p21_ids(sample_model, shifted, 100)
+
+    change_set = diff_models(sample_model, shifted, processes=1)
+    assert change_set.summary()['matched_nodes'] == 35
+    assert len(change_set.added_nodes) == len(change_set.removed_nodes) == 0
+    assert sorted(zip(change_set.matched_old, change_set.matched_new)) == [(i, i + 100) for i in range(1, 36)]
+    # the trimmed curve #29 references its trimming point by p21 id within Trim1
+    assert change_set.modified_nodes == []
+    assert change_set.renumbered_nodes == [(29, 129)]
+    assert change_set.added_edges == change_set.removed_edges == []
+
+
+def test_changes(tmp_path, sample_model):
+    revised = str(tmp_path / 'revised.ifc')
+    revise(sample_model, revised)
+
+    change_set = diff_models(sample_model, revised, processes=1)
+    # resources without GlobalId are identified by their content, so the polyline #35 is replaced
+    assert sorted(change_set.removed_nodes) == [22, 35]
+    assert sorted(change_set.added_nodes) == [35, 36]
+    assert change_set.modified_nodes == [(17, 17)]
+    assert (23, 'HasProperties', 3, 22) in change_set.removed_edges
+    assert (35, 'Points', 5, 36) in change_set.added_edges
+
+    path = str(tmp_path / 'changes.json.gz')
+    change_set.save(path)
+    assert ChangeSet.load(path).summary() == change_set.summary()
+
+
+@pytest.mark.parametrize('revision', [revise, lambda source, target: shift_p21_ids(source, target, 100)])
+def test_chunked_diff_matches_serial_diff(tmp_path, sample_model, revision):
+    revised = str(tmp_path / 'revised.ifc')
+    revision(sample_model, revised)
+
+    serial = diff_models(sample_model, revised, processes=1)
+    # 3 chunks per model, 3 key ranges
+    chunked = diff_models(sample_model, revised, processes=3)
+    assert vars(chunked) == vars(serial)
+
+    fingerprint = ModelFingerprint.of_model(revised)
+    rows = [extract_rows((revised, None, chunk, 4)) for chunk in range(4)]
+    assert sum(len(chunk.p21s) for chunk in rows) == fingerprint.node_count()
+    merged = ModelFingerprint.of_rows(revised, rows)
+    assert (merged.node_key, merged.node_p21, merged.node_attr, merged.edge_key) == \
+        (fingerprint.node_key, fingerprint.node_p21, fingerprint.node_attr, fingerprint.edge_key)
+    assert [merged.edge(i) for i in range(merged.edge_count())] == \
+        [fingerprint.edge(i) for i in range(fingerprint.edge_count())]
+
+
+@pytest.mark.parametrize('revision', [revise, lambda source, target: shift_p21_ids(source, target, 100)])
+def test_apply(tmp_path, sample_model, revision):
+    revised = str(tmp_path / 'revised.ifc')
+    revision(sample_model, revised)
+    old = IFCGraphGenerator(None, sample_model, write_to_file=True)
+    new = IFCGraphGenerator(None, revised, write_to_file=True)
+
+    database = InMemoryGraph(old.timestamp)
+    database.load(old)
+    expected = InMemoryGraph(new.timestamp)
+    expected.load(new)
+
+    diff_models(sample_model, revised, processes=1).apply(database, old.timestamp, new_generator=new)
+    assert database.graph() == expected.graph()
@@ -0,0 +1,94 @@
+import itertools
+from collections import Counter
+
+import pytest
+
+from GraphRecords import NodeRecord, EdgeRecord, intern_names
+from Neo4jBatchLoader import AdaptiveBatchSize, Neo4jBatchLoader, round_robin_pairs
+from fake_neo4j import FakeNeo4j, Interrupted
+
+
+@pytest.mark.parametrize('n', [2, 4, 8])
+def test_round_robin_pairs(n):
+    rounds = round_robin_pairs(n)
+    assert len(rounds) == n
+    for pairs in rounds:
+        buckets = [bucket for pair in pairs for bucket in set(pair)]
+        # no two writers of a round touch the same bucket
+        assert len(buckets) == len(set(buckets))
+    scheduled = [pair for pairs in rounds for pair in pairs]
+    assert sorted(scheduled) == list(itertools.combinations_with_replacement(range(n), 2))
+
+
+def test_adaptive_batch_size():
+    sizes = AdaptiveBatchSize(initial=1000, target_latency=2.0, min_size=100, max_size=4000)
+    assert sizes.size_of('IfcCartesianPoint') == 1000
+
+    # fast commits double the size up to the upper bound
+    for _ in range(5):
+        sizes.on_commit('IfcCartesianPoint', sizes.size_of('IfcCartesianPoint'), 0.1)
+    assert sizes.size_of('IfcCartesianPoint') == 4000
+
+    # partial batches are ignored, slow commits shrink the size in proportion to the latency
+    sizes.on_commit('IfcPropertySingleValue', 10, 8.0)
+    assert sizes.size_of('IfcPropertySingleValue') == 1000
+    sizes.on_commit('IfcPropertySingleValue', 1000, 8.0)
+    assert sizes.size_of('IfcPropertySingleValue') == 250
+    sizes.on_commit('IfcPropertySingleValue', 250, 100.0)
+    assert sizes.size_of('IfcPropertySingleValue') == 100
+
+    # a memory error halves the size, which then caps further growth
+    assert sizes.on_memory_error('IfcPolyline', 1000) == 500
+    for _ in range(3):
+        sizes.on_commit('IfcPolyline', sizes.size_of('IfcPolyline'), 0.1)
+    assert sizes.size_of('IfcPolyline') == 500
+
+    # keys are independent of each other
+    assert sizes.size_of('IfcCartesianPoint') == 4000
+
+
+def test_fixed_batch_size():
+    sizes = AdaptiveBatchSize(initial=1000, target_latency=None)
+    sizes.on_commit('IfcWall', 1000, 0.1)
+    sizes.on_commit('IfcSlab', 1000, 60.0)
+    assert sizes.size_of('IfcWall') == sizes.size_of('IfcSlab') == 1000
+
+
+def records(n_nodes: int = 100, n_edges: int = 1000) -> tuple:
+    """
+    nodes and edges of a synthetic model, node 0 is a hub referenced by every tenth edge
+    """
+    names = intern_names(['GlobalId'])
+    nodes = [NodeRecord(p21_id, 'SecondaryNode', 'IfcCartesianPoint', names, ('g{}'.format(p21_id),))
+             for p21_id in range(n_nodes)]
+    edges = [EdgeRecord(k % n_nodes, 0 if k % 10 == 0 else (k * 7 + 1) % n_nodes,
+                        'Points' if k % 3 else 'Location', k)
+             for k in range(n_edges)]
+    return nodes, edges
+
+
+def load(database, nodes, edges, writer_threads: int) -> Neo4jBatchLoader:
+    loader = Neo4jBatchLoader(database, 'ts1', import_key='key', batch_size=50, create_only=True,
+                              target_latency=None)
+    loader.load_checkpoints()
+    loader.load_nodes(nodes)
+    loader.load_edges_parallel(edges, writer_threads=writer_threads, hub_degree=50)
+    return loader
+
+
+@pytest.mark.parametrize('first, second', [(1, 2), (2, 1), (2, 3), (3, 2)])
+def test_resume_with_other_writer_threads(first, second):
+    nodes, edges = records()
+    database = FakeNeo4j()
+    database.interrupt_after = len(nodes) + 200
+    with pytest.raises(Interrupted):
+        load(database, nodes, edges, first)
+    assert 0 < len(database.edges) < len(edges)
+
+    database.interrupt_after = None
+    loader = load(database, nodes, edges, second)
+    # the resumed import keeps the partitioning of the interrupted one and creates every edge once
+    assert len(database.nodes) == len(nodes)
+    assert Counter(database.edge_rows()) == Counter((e.source, 'rel', e.rel_type, e.list_item, e.target)
+                                                    for e in edges)
+    assert loader.edge_partitioning('edges') == ('serial' if first == 1 else (2 * first, 50))
@@ -0,0 +1,78 @@
+import pytest
+
+import Neo4jQueryCache as cache_module
+from Neo4jQueryCache import Neo4jQueryCache
+
+
+class CountingConnector:
+    """
+    connector stand-in answering every statement with the number of statements it has run so far
+    """
+
+    def __init__(self):
+        self.statements = []
+
+    def run_cypher_statement(self, statement, postStatement=None, parameters=None):
+        self.statements.append(statement)
+        return [len(self.statements)]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_hits_and_parameters():
+    cache = Neo4jQueryCache(CountingConnector())
+    query = 'MATCH (n:tsA) WHERE n.p21_id = $p21_id RETURN n'
+    assert cache.run_cypher_statement(query, parameters={'p21_id': 1}) == [1]
+    assert cache.run_cypher_statement(query, parameters={'p21_id': 1}) == [1]
+    assert cache.run_cypher_statement(query, parameters={'p21_id': 2}) == [2]
+    statistics = cache.get_statistics()
+    assert (statistics['hits'], statistics['misses'], statistics['size']) == (1, 2, 2)
+
+
+def test_lru_eviction():
+    cache = Neo4jQueryCache(CountingConnector(), max_entries=2)
+    for query in ['MATCH (a:tsA) RETURN a', 'MATCH (b:tsA) RETURN b']:
+        cache.run_cypher_statement(query)
+    # touching the first query makes the second one the least recently used
+    assert cache.run_cypher_statement('MATCH (a:tsA) RETURN a') == [1]
+    cache.run_cypher_statement('MATCH (c:tsA) RETURN c')
+    assert cache.get_statistics()['evictions'] == 1
+    assert cache.run_cypher_statement('MATCH (a:tsA) RETURN a') == [1]
+    assert cache.run_cypher_statement('MATCH (b:tsA) RETURN b') == [4]
+
+
+def test_ttl(clock):
+    cache = Neo4jQueryCache(CountingConnector(), ttl=10.0)
+    query = 'MATCH (n:tsA) RETURN count(n)'
+    assert cache.run_cypher_statement(query) == [1]
+    clock[0] = 9.0
+    assert cache.run_cypher_statement(query) == [1]
+    clock[0] = 10.0
+    assert cache.run_cypher_statement(query) == [2]
+    assert cache.get_statistics()['expirations'] == 1
+
+    cache = Neo4jQueryCache(CountingConnector(), ttl=None)
+    cache.run_cypher_statement(query)
+    clock[0] = 1e9
+    assert cache.run_cypher_statement(query) == [1]
+
+
+def test_writes_invalidate_their_model():
+    connector = CountingConnector()
+    cache = Neo4jQueryCache(connector)
+    cache.run_cypher_statement('MATCH (n:tsA) RETURN n')
+    cache.run_cypher_statement('MATCH (n:tsB) RETURN n')
+    cache.run_cypher_statement('MATCH (n) WHERE ID(n) = 5 RETURN n')
+
+    cache.run_cypher_statement('MATCH (n:tsA) SET n.Name = "x"')
+    cache.run_cypher_statement('MATCH (n:tsA) SET n.Name = "x"')
+    # writes are never cached, label-less results are dropped with the written model
+    assert len(connector.statements) == 5
+    assert cache.get_statistics()['size'] == 1
+    assert cache.run_cypher_statement('MATCH (n:tsB) RETURN n') == [2]
+    assert cache.run_cypher_statement('MATCH (n:tsA) RETURN n') == [6]
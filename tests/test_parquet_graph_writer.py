@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+pq = pytest.importorskip('pyarrow.parquet')
+
+from GraphRecords import NodeRecord, EdgeRecord, intern_names
+from ParquetGraphWriter import ParquetGraphWriter
+
+NAMES = intern_names(['Name', 'Elevation'])
+
+
+def read_nodes(directory, entity_type):
+    return pq.read_table(os.path.join(directory, 'nodes', '{}.parquet'.format(entity_type)))
+
+
+def test_single_row_group(tmp_path):
+    writer = ParquetGraphWriter(str(tmp_path))
+    writer.add_node(NodeRecord(1, 'PrimaryNode', 'IfcBuildingStorey', NAMES, ('Level 1', 0.0)))
+    writer.add_node(NodeRecord(2, 'PrimaryNode', 'IfcBuildingStorey', NAMES, ('Level 2', 3.5)))
+    writer.add_edge(EdgeRecord(1, 2, 'RelatedObjects', 0))
+    writer.close()
+
+    table = read_nodes(str(tmp_path), 'IfcBuildingStorey')
+    assert table.schema.field('Elevation').type == pa.float64()
+    assert table.column('Name').to_pylist() == ['Level 1', 'Level 2']
+    edges = pq.read_table(os.path.join(str(tmp_path), 'edges.parquet'))
+    assert edges.column('list_item').to_pylist() == [0]
+    assert writer.nodes_written == 2 and writer.edges_written == 1
+
+
+def test_later_row_groups_widen_the_schema(tmp_path):
+    writer = ParquetGraphWriter(str(tmp_path), row_group_size=2)
+    rows = [('Level 1', 0), ('Level 2', 3), ('Level 3', 6.5), (None, None), ('Level 5', 'unknown'), ('Level 6', 7)]
+    for p21_id, values in enumerate(rows, start=1):
+        writer.add_node(NodeRecord(p21_id, 'PrimaryNode', 'IfcBuildingStorey', NAMES, values))
+    # a record with an additional property, e.g. a spatial hierarchy encoding
+    node = NodeRecord(7, 'PrimaryNode', 'IfcBuildingStorey', NAMES, ('Level 7', 9))
+    node.add_properties({'spatial_path': '/1/2'})
+    writer.add_node(node)
+    writer.close()
+
+    table = read_nodes(str(tmp_path), 'IfcBuildingStorey')
+    assert table.schema.field('Elevation').type == pa.string()
+    # values keep their python representation, like the node properties in neo4j
+    assert table.column('Elevation').to_pylist() == ['0', '3', '6.5', None, 'unknown', '7', '9']
+    assert table.column('spatial_path').to_pylist() == [None] * 6 + ['/1/2']
+    assert table.column('p21_id').to_pylist() == list(range(1, 8))
+    assert sorted(os.listdir(os.path.join(str(tmp_path), 'nodes'))) == ['IfcBuildingStorey.parquet']
+
+
+def test_ints_widen_to_floats(tmp_path):
+    writer = ParquetGraphWriter(str(tmp_path), row_group_size=1)
+    writer.add_node(NodeRecord(1, 'SecondaryNode', 'IfcCircle', intern_names(['Radius']), (1,)))
+    writer.add_node(NodeRecord(2, 'SecondaryNode', 'IfcCircle', intern_names(['Radius']), (0.5,)))
+    writer.close()
+
+    table = read_nodes(str(tmp_path), 'IfcCircle')
+    assert table.schema.field('Radius').type == pa.float64()
+    assert table.column('Radius').to_pylist() == [1.0, 0.5]
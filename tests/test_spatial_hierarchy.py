@@ -0,0 +1,41 @@
+import pytest
+
+from SpatialHierarchy import SpatialHierarchy
+
+
+def test_encode():
+    # project 1 > site 2 > building 3 > storeys 5, 4 > elements
+    hierarchy = SpatialHierarchy()
+    for parent, child in [(1, 2), (2, 3), (3, 5), (3, 4), (4, 10), (5, 11), (4, 12)]:
+        hierarchy.add_decomposition(parent, child)
+    # a second parent and a self reference are ignored
+    hierarchy.add_decomposition(5, 10)
+    hierarchy.add_decomposition(12, 12)
+    hierarchy.encode()
+
+    assert hierarchy.get_encoding(12) == {'hierarchy_path': '/1/2/3/4/12', 'hierarchy_left': 6,
+                                          'hierarchy_right': 7, 'hierarchy_depth': 4}
+    assert hierarchy.get_encoding(99) is None
+
+    def descendants(p21_id):
+        encoding = hierarchy.get_encoding(p21_id)
+        return sorted(p for p, e in hierarchy.encodings.items()
+                      if encoding['hierarchy_left'] < e['hierarchy_left'] < encoding['hierarchy_right'])
+
+    assert descendants(1) == [2, 3, 4, 5, 10, 11, 12]
+    assert descendants(4) == [10, 12]
+    assert descendants(11) == []
+    assert all(e['hierarchy_path'].startswith(hierarchy.get_encoding(3)['hierarchy_path'] + '/')
+               for p, e in hierarchy.encodings.items() if p in descendants(3))
+
+
+def test_from_model(sample_model):
+    pytest.importorskip('ifcopenshell')
+    from Ifc2GraphTranslator import IFCGraphGenerator
+
+    hierarchy = IFCGraphGenerator(None, sample_model, write_to_file=True).build_spatial_hierarchy()
+    # project > site > building > storey > wall
+    assert hierarchy.get_encoding(17)['hierarchy_path'] == '/6/8/10/12/17'
+    assert hierarchy.get_encoding(17)['hierarchy_depth'] == 4
+    assert hierarchy.get_encoding(6)['hierarchy_left'] == 0
+    assert hierarchy.get_encoding(23) is None